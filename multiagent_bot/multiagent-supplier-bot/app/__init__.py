@@ -1,6 +1,19 @@
 from flask import Flask
 from app.config import load_configurations, configure_logging
 from .views import webhook_blueprint
+from .admin_views import admin_blueprint
+from .utils.audit_log import init_price_audit_log
+from .utils.product_catalogue import init_product_catalogue
+from .utils.price_history import init_price_history
+from .utils.llm_usage import init_llm_usage
+from .utils.response_cache import init_response_cache
+from .utils.write_behind import init_write_behind
+from .utils.read_receipts import init_read_receipts
+from .utils.admission import init_admission_control
+from .utils.scheduler import init_scheduler
+from .utils.state_snapshot import init_state_snapshots
+from .utils.whatsapp_utils import user_conversation_threads, processed_message_ids
+from .startup import prewarm, run_prewarm
 
 
 def create_app():
@@ -8,10 +21,26 @@ def create_app():
 
     # Load configurations and logging settings
     load_configurations(app)
-    configure_logging()
+    configure_logging(app)
+    init_price_audit_log(app)
+    init_product_catalogue(app)
+    init_price_history(app)
+    init_llm_usage(app)
+    init_response_cache(app)
+    init_write_behind(app)
+    init_read_receipts(app)
+    init_admission_control(app)
+    init_scheduler(app)
+    init_state_snapshots(app, user_conversation_threads, processed_message_ids)
 
     # Import and register blueprints, if any
     app.register_blueprint(webhook_blueprint)
+    app.register_blueprint(admin_blueprint)
+
+    if not app.config["STARTUP_LAZY"]:
+        prewarm(app)
+    else:
+        run_prewarm(app)
 
     return app
 
@@ -0,0 +1,156 @@
+import logging
+import time
+
+from flask import Blueprint, request, jsonify
+
+from .decorators.security import admin_token_required
+from .utils.price_history import get_price_history, run_query
+from .utils.llm_usage import get_usage_aggregator
+from .utils.response_cache import get_response_cache
+from .utils.read_receipts import get_response_latency
+from .utils.scheduler import get_scheduler
+from .utils.state_snapshot import get_state_snapshotter
+from .utils import memory_introspection
+
+admin_blueprint = Blueprint("admin", __name__, url_prefix="/admin")
+
+
+@admin_blueprint.route("/price-history/<query>", methods=["GET"])
+@admin_token_required
+def price_history(query):
+    """
+    Aggregations over the price-change history:
+    per-supplier-day (?days=N), increase-pct, top-rejected (?limit=N)
+    """
+    started = time.perf_counter()
+    try:
+        result = run_query(
+            get_price_history(),
+            query,
+            days=request.args.get("days", type=int),
+            limit=request.args.get("limit", default=10, type=int),
+        )
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
+    except Exception as e:
+        logging.error("Price history query %s failed: %s", query, e)
+        return jsonify({"status": "error", "message": "Query failed"}), 500
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    return jsonify({"status": "ok", "query": query, "elapsed_ms": round(elapsed_ms, 2), "result": result}), 200
+
+
+@admin_blueprint.route("/llm-usage", methods=["GET"])
+@admin_token_required
+def llm_usage():
+    """
+    LLM token and latency rollup for a day (?day=YYYY-MM-DD), grouped by
+    ?by=wa_id (comma-separated: day, wa_id, intent, agent, model)
+    """
+    by = tuple(field for field in request.args.get("by", "wa_id").split(",") if field)
+    allowed = {"day", "wa_id", "intent", "agent", "model"}
+    if not by or not set(by) <= allowed:
+        return jsonify({"status": "error", "message": f"by must be a subset of {sorted(allowed)}"}), 400
+    result = get_usage_aggregator().rollup(by=by, day=request.args.get("day"))
+    return jsonify({"status": "ok", "by": list(by), "result": result}), 200
+
+
+@admin_blueprint.route("/response-cache", methods=["GET"])
+@admin_token_required
+def response_cache():
+    """
+    Hit-rate metrics of the clarification/FAQ response cache
+    """
+    cache = get_response_cache()
+    if cache is None:
+        return jsonify({"status": "disabled"}), 200
+    return jsonify({"status": "ok", "metrics": cache.get_metrics()}), 200
+
+
+@admin_blueprint.route("/response-latency", methods=["GET"])
+@admin_token_required
+def response_latency():
+    """
+    Time to the read receipt/typing indicator versus time to the reply
+    """
+    return jsonify({"status": "ok", "metrics": get_response_latency().get_metrics()}), 200
+
+
+@admin_blueprint.route("/scheduler", methods=["GET"])
+@admin_token_required
+def scheduler():
+    """
+    Queue depth, waits and stale/dropped counts of the message scheduler
+    """
+    message_scheduler = get_scheduler()
+    if message_scheduler is None:
+        return jsonify({"status": "disabled"}), 200
+    return jsonify({"status": "ok", "metrics": message_scheduler.get_metrics()}), 200
+
+
+@admin_blueprint.route("/state-snapshot", methods=["GET"])
+@admin_token_required
+def state_snapshot():
+    """
+    Size, duration and backlog of this worker's warm-restart snapshots
+    """
+    snapshotter = get_state_snapshotter()
+    if snapshotter is None:
+        return jsonify({"status": "disabled"}), 200
+    return jsonify({"status": "ok", "path": snapshotter.path, "metrics": snapshotter.get_metrics()}), 200
+
+
+@admin_blueprint.route("/memory", methods=["GET"])
+@admin_token_required
+def memory():
+    """
+    Process RSS, entry counts and deep sizes of the in-memory structures,
+    and tracemalloc status, for the worker that serves the request
+    """
+    return jsonify({"status": "ok", "result": memory_introspection.structure_sizes()}), 200
+
+
+@admin_blueprint.route("/memory/tracemalloc/<action>", methods=["POST"])
+@admin_token_required
+def memory_tracemalloc(action):
+    """
+    start (?frames=N), stop, or snapshot
+    """
+    if action == "start":
+        changed = memory_introspection.start_tracing(request.args.get("frames", default=1, type=int))
+    elif action == "stop":
+        changed = memory_introspection.stop_tracing()
+    elif action == "snapshot":
+        try:
+            snapshot_id = memory_introspection.take_snapshot()
+        except RuntimeError as e:
+            return jsonify({"status": "error", "message": str(e)}), 409
+        return jsonify({"status": "ok", "snapshot": snapshot_id}), 200
+    else:
+        return jsonify({"status": "error", "message": f"Unknown action: {action}"}), 404
+    return jsonify({"status": "ok", "changed": changed, "tracemalloc": memory_introspection.tracemalloc_status()}), 200
+
+
+@admin_blueprint.route("/memory/tracemalloc/diff", methods=["GET"])
+@admin_token_required
+def memory_tracemalloc_diff():
+    """
+    Allocation growth between snapshots ?from=ID&to=ID (to defaults to a new
+    snapshot), grouped by ?group_by=lineno|filename, top ?limit=N
+    """
+    from_id = request.args.get("from", type=int)
+    if from_id is None:
+        return jsonify({"status": "error", "message": "from is required"}), 400
+    try:
+        result = memory_introspection.diff_snapshots(
+            from_id,
+            request.args.get("to", type=int),
+            group_by=request.args.get("group_by", "lineno"),
+            limit=request.args.get("limit", default=20, type=int),
+        )
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except KeyError as e:
+        return jsonify({"status": "error", "message": str(e.args[0])}), 404
+    except RuntimeError as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+    return jsonify({"status": "ok", "result": result}), 200
@@ -16,11 +16,119 @@ def load_configurations(app):
     app.config["VERIFY_TOKEN"] = os.getenv("VERIFY_TOKEN")
     app.config["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
     app.config["ASSISTANT_ID"] = os.getenv("ASSISTANT_ID")
+    app.config["OPENAI_MODEL"] = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    app.config["OPENAI_FALLBACK_MODEL"] = os.getenv("OPENAI_FALLBACK_MODEL")
     app.config["MARKAZ_AUTH_TOKEN"] = os.getenv("MARKAZ_AUTH_TOKEN")
+    app.config["ADMIN_TOKEN"] = os.getenv("ADMIN_TOKEN")
 
-def configure_logging():
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    # Startup: defer state loading and heavy imports; optional pre-warm
+    app.config["STARTUP_LAZY"] = os.getenv("STARTUP_LAZY", "true").lower() == "true"
+    app.config["STARTUP_PREWARM"] = os.getenv("STARTUP_PREWARM", "off").lower()
+
+    # Logging pipeline
+    app.config["LOG_LEVEL"] = os.getenv("LOG_LEVEL", "INFO")
+    app.config["LOG_ASYNC"] = os.getenv("LOG_ASYNC", "true").lower() == "true"
+    app.config["LOG_BATCH_SIZE"] = int(os.getenv("LOG_BATCH_SIZE", "100"))
+    app.config["LOG_FLUSH_INTERVAL"] = float(os.getenv("LOG_FLUSH_INTERVAL", "0.5"))
+    app.config["LOG_DEBUG_MAX_PER_INTERVAL"] = int(os.getenv("LOG_DEBUG_MAX_PER_INTERVAL", "20"))
+    app.config["LOG_DEBUG_INTERVAL"] = float(os.getenv("LOG_DEBUG_INTERVAL", "10"))
+
+    # Price operation audit log
+    app.config["AUDIT_LOG_DIR"] = os.getenv("AUDIT_LOG_DIR")
+    app.config["AUDIT_LOG_BATCH_SIZE"] = int(os.getenv("AUDIT_LOG_BATCH_SIZE", "50"))
+    app.config["AUDIT_LOG_FLUSH_INTERVAL"] = float(os.getenv("AUDIT_LOG_FLUSH_INTERVAL", "2"))
+    app.config["AUDIT_LOG_MAX_BYTES"] = int(os.getenv("AUDIT_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+
+    # Local product catalogue export (CSV or JSON)
+    app.config["PRODUCT_CATALOGUE_PATH"] = os.getenv("PRODUCT_CATALOGUE_PATH")
+    app.config["PRODUCT_CATALOGUE_REFRESH_INTERVAL"] = int(os.getenv("PRODUCT_CATALOGUE_REFRESH_INTERVAL", "300"))
+
+    # Columnar price-change history
+    app.config["PRICE_HISTORY_DIR"] = os.getenv("PRICE_HISTORY_DIR")
+
+    # Admission control (token buckets; rates are tokens per second)
+    app.config["REDIS_URL"] = os.getenv("REDIS_URL")
+    app.config["ADMISSION_CONTROL_ENABLED"] = os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() == "true"
+    app.config["RATE_LIMIT_SUPPLIER_RATE"] = float(os.getenv("RATE_LIMIT_SUPPLIER_RATE", "0.2"))
+    app.config["RATE_LIMIT_SUPPLIER_BURST"] = int(os.getenv("RATE_LIMIT_SUPPLIER_BURST", "5"))
+    app.config["RATE_LIMIT_GLOBAL_RATE"] = float(os.getenv("RATE_LIMIT_GLOBAL_RATE", "5"))
+    app.config["RATE_LIMIT_GLOBAL_BURST"] = int(os.getenv("RATE_LIMIT_GLOBAL_BURST", "50"))
+    app.config["RATE_LIMIT_SHED_REPLY_INTERVAL"] = int(os.getenv("RATE_LIMIT_SHED_REPLY_INTERVAL", "60"))
+
+    # Priority/deadline scheduling of supplier messages (deadlines in seconds)
+    app.config["SCHEDULER_ENABLED"] = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
+    app.config["SCHEDULER_WORKERS"] = int(os.getenv("SCHEDULER_WORKERS", "4"))
+    app.config["SCHEDULER_MAX_QUEUE"] = int(os.getenv("SCHEDULER_MAX_QUEUE", "200"))
+    app.config["SCHEDULER_LOAD_THRESHOLD"] = int(os.getenv("SCHEDULER_LOAD_THRESHOLD", "20"))
+    app.config["SCHEDULER_DEADLINE_MUTATION"] = int(os.getenv("SCHEDULER_DEADLINE_MUTATION", "60"))
+    app.config["SCHEDULER_DEADLINE_CLARIFICATION"] = int(os.getenv("SCHEDULER_DEADLINE_CLARIFICATION", "120"))
+    app.config["SCHEDULER_DEADLINE_OTHER"] = int(os.getenv("SCHEDULER_DEADLINE_OTHER", "180"))
+
+    # Warm-restart snapshots of in-memory state
+    app.config["SNAPSHOT_ENABLED"] = os.getenv("SNAPSHOT_ENABLED", "true").lower() == "true"
+    app.config["SNAPSHOT_PATH"] = os.getenv("SNAPSHOT_PATH")
+    app.config["SNAPSHOT_INTERVAL"] = int(os.getenv("SNAPSHOT_INTERVAL", "30"))
+    app.config["SNAPSHOT_MAX_DIRTY"] = int(os.getenv("SNAPSHOT_MAX_DIRTY", "500"))
+    # Processed message IDs older or beyond this are forgotten
+    app.config["SNAPSHOT_MESSAGE_ID_MAX_AGE"] = int(os.getenv("SNAPSHOT_MESSAGE_ID_MAX_AGE", str(7 * 24 * 3600)))
+    app.config["SNAPSHOT_MAX_MESSAGE_IDS"] = int(os.getenv("SNAPSHOT_MAX_MESSAGE_IDS", "100000"))
+
+    # Interactive button/list messages for clarifications
+    app.config["INTERACTIVE_MESSAGES_ENABLED"] = os.getenv("INTERACTIVE_MESSAGES_ENABLED", "true").lower() == "true"
+
+    # LLM token accounting and soft per-supplier budgets (0 disables budgets)
+    app.config["LLM_USAGE_DIR"] = os.getenv("LLM_USAGE_DIR")
+    app.config["LLM_USAGE_FLUSH_INTERVAL"] = int(os.getenv("LLM_USAGE_FLUSH_INTERVAL", "60"))
+    app.config["LLM_SUPPLIER_DAILY_TOKEN_BUDGET"] = int(os.getenv("LLM_SUPPLIER_DAILY_TOKEN_BUDGET", "0"))
+
+    # Write-behind batching of Apps Script price writes
+    app.config["PRICE_WRITE_BEHIND"] = os.getenv("PRICE_WRITE_BEHIND", "false").lower() == "true"
+    app.config["PRICE_WRITE_JOURNAL_PATH"] = os.getenv("PRICE_WRITE_JOURNAL_PATH")
+    app.config["PRICE_WRITE_FLUSH_INTERVAL"] = float(os.getenv("PRICE_WRITE_FLUSH_INTERVAL", "2.0"))
+    app.config["PRICE_WRITE_MAX_ATTEMPTS"] = int(os.getenv("PRICE_WRITE_MAX_ATTEMPTS", "5"))
+
+    # Similarity cache for clarification/FAQ replies
+    app.config["RESPONSE_CACHE_ENABLED"] = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+    app.config["RESPONSE_CACHE_THRESHOLD"] = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.9"))
+    app.config["RESPONSE_CACHE_MAX_ENTRIES"] = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+    app.config["RESPONSE_CACHE_TTL"] = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+
+    # Read receipts with typing indicator
+    app.config["READ_RECEIPTS_ENABLED"] = os.getenv("READ_RECEIPTS_ENABLED", "true").lower() == "true"
+    app.config["READ_RECEIPTS_WORKERS"] = int(os.getenv("READ_RECEIPTS_WORKERS", "4"))
+
+    # Prompt building
+    app.config["PROMPT_HISTORY_TOKEN_BUDGET"] = int(os.getenv("PROMPT_HISTORY_TOKEN_BUDGET", "400"))
+    app.config["PROMPT_HISTORY_MAX_TURNS"] = int(os.getenv("PROMPT_HISTORY_MAX_TURNS", "5"))
+    app.config["PROMPT_ASSISTANT_TURN_MAX_TOKENS"] = int(os.getenv("PROMPT_ASSISTANT_TURN_MAX_TOKENS", "60"))
+
+def configure_logging(app=None):
+    config = app.config if app is not None else {}
+    level = getattr(logging, str(config.get("LOG_LEVEL", "INFO")).upper(), logging.INFO)
+
+    if not config.get("LOG_ASYNC", False):
+        logging.basicConfig(
+            level=level,
+            format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+            stream=sys.stdout,
+        )
+        return
+
+    from app.utils.logging_utils import setup_async_logging
+
+    setup_async_logging(
+        level=level,
         stream=sys.stdout,
+        secrets=[
+            config.get("ACCESS_TOKEN"),
+            config.get("APP_SECRET"),
+            config.get("VERIFY_TOKEN"),
+            config.get("OPENAI_API_KEY"),
+            config.get("MARKAZ_AUTH_TOKEN"),
+            config.get("ADMIN_TOKEN"),
+        ],
+        batch_size=config.get("LOG_BATCH_SIZE", 100),
+        flush_interval=config.get("LOG_FLUSH_INTERVAL", 0.5),
+        debug_max_per_interval=config.get("LOG_DEBUG_MAX_PER_INTERVAL", 20),
+        debug_interval=config.get("LOG_DEBUG_INTERVAL", 10.0),
     )
@@ -36,3 +36,25 @@ def signature_required(f):
         return f(*args, **kwargs)
 
     return decorated_function
+
+
+def admin_token_required(f):
+    """
+    Decorator for admin endpoints: requires the ADMIN_TOKEN as a bearer token.
+    Admin endpoints are disabled when no ADMIN_TOKEN is configured.
+    """
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        expected = current_app.config.get("ADMIN_TOKEN")
+        if not expected:
+            return jsonify({"status": "error", "message": "Not found"}), 404
+        provided = request.headers.get("Authorization", "")
+        if provided.startswith("Bearer "):
+            provided = provided[7:]
+        if not hmac.compare_digest(provided.encode("utf-8"), expected.encode("utf-8")):
+            logging.info("Admin token verification failed!")
+            return jsonify({"status": "error", "message": "Invalid admin token"}), 403
+        return f(*args, **kwargs)
+
+    return decorated_function
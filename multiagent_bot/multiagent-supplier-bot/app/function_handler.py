@@ -7,10 +7,24 @@ from flask import current_app
 import datetime
 import json
 import os
+import threading
+from .utils.single_flight import SingleFlight, KeyedLocks, make_price_key, price_key_product, normalize_price_product
+from .utils.product_catalogue import check_product_code, format_product_code_rejection
+from .utils.write_behind import get_price_write_queue
+from .utils.price_history import (
+    record_price_outcome,
+    OUTCOME_APPLIED,
+    OUTCOME_REJECTED_CAP,
+    OUTCOME_REJECTED_RECENT,
+    OUTCOME_REJECTED_ABOVE_OLD,
+    OUTCOME_ERROR,
+)
 
 # Dictionary to store price increase attempts
 _price_increase_log = {}
 _PRICE_LOG_FILE = "price_increase_log.json"
+_price_log_loaded = False
+_price_log_lock = threading.Lock()
 
 def load_price_log():
     """Load price increase log from file"""
@@ -18,12 +32,12 @@ def load_price_log():
         if os.path.exists(_PRICE_LOG_FILE):
             with open(_PRICE_LOG_FILE, 'r') as f:
                 data = json.load(f)
-                logging.info(f"Loaded price log with {len(data)} entries")
+                logging.info("Loaded price log with %s entries", len(data))
                 return data
         logging.info("No existing price log file found")
         return {}
     except Exception as e:
-        logging.error(f"Error loading price log: {e}")
+        logging.error("Error loading price log: %s", e)
         return {}
 
 def save_price_log():
@@ -31,12 +45,28 @@ def save_price_log():
     try:
         with open(_PRICE_LOG_FILE, 'w') as f:
             json.dump(_price_increase_log, f, indent=2)
-        logging.info(f"Price log saved with {len(_price_increase_log)} entries")
+        logging.info("Price log saved with %s entries", len(_price_increase_log))
     except Exception as e:
-        logging.error(f"Error saving price log: {e}")
-
-# Load existing log on startup
-_price_increase_log = load_price_log()
+        logging.error("Error saving price log: %s", e)
+
+def ensure_price_log_loaded():
+    """Load the price log from file on first use rather than at import time"""
+    global _price_log_loaded
+    if _price_log_loaded:
+        return
+    with _price_log_lock:
+        if not _price_log_loaded:
+            _price_increase_log.update(load_price_log())
+            _price_log_loaded = True
+
+# Identical price mutations share one Apps Script round-trip, and their
+# outcome is replayed for a minute. Only successes are replayed: errors and
+# "⚠️" rejections are re-checked on the next attempt.
+_price_calls = SingleFlight(
+    expiry=60, should_cache=lambda result: str(result).startswith("✅"), group_of=price_key_product
+)
+# Serialises the weekly-increase rule check and its log entry per product
+_product_locks = KeyedLocks()
 
 def check_product_listing(business_name, product_id):
     """
@@ -49,8 +79,15 @@ def check_product_listing(business_name, product_id):
     Returns:
         str: Message indicating whether the product is listed or not
     """
-    logging.info(f"Checking product {product_id} for business {business_name}")
-        
+    logging.info("Checking product %s for business %s", product_id, business_name)
+
+    check = check_product_code(product_id, business_name=business_name)
+    if check["status"] == "ok":
+        return f"✅ Product `{check['code']}` for business *{business_name}* is listed."
+    if check["status"] != "unavailable":
+        return format_product_code_rejection(check)
+
+    # No catalogue export configured
     if product_id.startswith("PROD"):
         return f"✅ Product `{product_id}` for business *{business_name}* is listed."
     else:
@@ -68,7 +105,7 @@ def cancellation_of_orders(order_item_id, reason="FakeOrders/Non-deliverable ord
     Returns:
         str: Message indicating whether the order was successfully cancelled
     """
-    logging.info(f"Cancelling order {order_item_id}")
+    logging.info("Cancelling order %s", order_item_id)
 
     url = "https://api.markaz.app/shipping/markaz/order/status"
     
@@ -90,23 +127,22 @@ def cancellation_of_orders(order_item_id, reason="FakeOrders/Non-deliverable ord
 
     try:
         # Print payload for debugging
-        logging.info(f"Sending request to URL: {url}")
-        logging.info(f"Sending payload: {payload}")
-        logging.info(f"Using token: {current_app.config.get('MARKAZ_AUTH_TOKEN')}")
+        logging.info("Sending request to URL: %s", url)
+        logging.debug("Sending payload: %s", payload)
         
         response = requests.put(url, json=payload, headers=headers)
         
         if response.status_code == 200:
-            logging.info(f"Successfully cancelled order {order_item_id}")
+            logging.info("Successfully cancelled order %s", order_item_id)
             return f"✅ Order `{order_item_id}` has been successfully cancelled."
         else:
             # Log response details for debugging
-            logging.error(f"Failed to cancel order {order_item_id}. Status code: {response.status_code}")
-            logging.error(f"Response text: {response.text}")
+            logging.error("Failed to cancel order %s. Status code: %s", order_item_id, response.status_code)
+            logging.debug("Response text: %s", response.text)
             return f"❌ Failed to cancel order `{order_item_id}`. API responded with status code {response.status_code}."
 
     except Exception as e:
-        logging.error(f"Error cancelling order {order_item_id}: {str(e)}")
+        logging.error("Error cancelling order %s: %s", order_item_id, e)
         return f"❌ Error occurred while trying to cancel order `{order_item_id}`: {str(e)}"
 
 def has_recent_increase(product_id):
@@ -119,6 +155,7 @@ def has_recent_increase(product_id):
     Returns:
         bool: True if there was a recent increase, False otherwise
     """
+    ensure_price_log_loaded()
     if product_id not in _price_increase_log:
         return False
         
@@ -128,43 +165,81 @@ def has_recent_increase(product_id):
     return last_increase >= one_week_ago
 
 def log_price_increase(product_id):
-    """Log a price increase attempt for a product"""
+    """Log a price increase attempt for a product and return its timestamp"""
+    ensure_price_log_loaded()
     try:
         _price_increase_log[product_id] = datetime.datetime.now().isoformat()
-        logging.info(f"Logging price increase for product {product_id} at {_price_increase_log[product_id]}")
+        logging.info("Logging price increase for product %s at %s", product_id, _price_increase_log[product_id])
         save_price_log()
-        logging.info(f"Successfully saved price increase log to {_PRICE_LOG_FILE}")
+        logging.info("Successfully saved price increase log to %s", _PRICE_LOG_FILE)
+        return _price_increase_log[product_id]
     except Exception as e:
-        logging.error(f"Failed to log price increase: {str(e)}")
+        logging.error("Failed to log price increase: %s", e)
+        return None
 
-def update_price(product_id, new_price):
+def revert_queued_write(entry):
+    """
+    Undo the local effects of a write-behind price write that never reached
+    the sheet, so the supplier can simply send the request again
+    """
+    product_id = entry["product_id"]
+    _price_calls.forget_group(normalize_price_product(product_id))
+    logged_at = entry.get("increase_logged_at")
+    if not logged_at:
+        return
+    ensure_price_log_loaded()
+    with _product_locks.hold(normalize_price_product(product_id)):
+        # Only clear the entry this write created, not a later increase
+        if _price_increase_log.get(product_id) == logged_at:
+            del _price_increase_log[product_id]
+            save_price_log()
+            logging.info("Cleared weekly increase entry for product %s after a failed write", product_id)
+
+def update_price(product_id, new_price, supplier=None):
     """
     Updates the price for a product.
     - Fetches old price from API.
     - If price is increasing, applies a 10% limit check.
     - If price is decreasing or unchanged, updates directly.
+    - Duplicate requests for the same product and price share one update.
+    - Every outcome is recorded in the price-change history.
+    - In write-behind mode the sheet write is queued and flushed in batches.
     """
+    result, shared = _price_calls.do(
+        make_price_key(product_id, "update_price", new_price), _update_price, product_id, new_price, supplier
+    )
+    if shared:
+        logging.info("Reused in-flight/recent price update for product %s", product_id)
+    return result
+
+def _update_price(product_id, new_price, supplier=None):
     base_url = "https://script.google.com/macros/s/AKfycbxRdURlwCEQ_OTJyBKIY5nRJ9Npty7XxIEvarjjzXQxBfHwtNFBTOjDGSkdx5LtiMhl/exec"
 
-    logging.info(f"Attempting to update price for product {product_id} to {new_price}")
+    logging.info("Attempting to update price for product %s to %s", product_id, new_price)
+    oldPrice_from_sheet = None
+    increase_logged_at = None
 
     try:
         # === Step 1: Get current price ===
         get_params = {"supplierproductcode": str(product_id)}
         get_response = requests.get(base_url, params=get_params)
 
-        logging.info(f"Response from API for product {product_id}: {get_response.text}")
+        logging.debug("Response from API for product %s: %s", product_id, get_response.text)
 
         if get_response.status_code != 200:
             raise Exception(f"Failed to retrieve current price. Status: {get_response.status_code}, Response: {get_response.text}")
 
         data = get_response.json()
+        write_queue = get_price_write_queue()
+        if write_queue is not None:
+            # Validate against this product's queued write, not the stale sheet
+            data = write_queue.overlay(base_url, product_id, data)
         price_from_sheet = float(data.get("update_price", 0))
-        logging.info(f"Retrieved current price for {product_id}: {price_from_sheet}")
+        logging.info("Retrieved current price for %s: %s", product_id, price_from_sheet)
         oldPrice_from_sheet = float(data.get("update_oldPrice", 0))
-        logging.info(f"Retrieved oldprice for {product_id}: {oldPrice_from_sheet}")
+        logging.info("Retrieved oldprice for %s: %s", product_id, oldPrice_from_sheet)
         shippingCharges_from_sheet = float(data.get("update_additionalshippingcharges", 0))
-        logging.info(f"Retrieved additional shipping charges for {product_id}: {shippingCharges_from_sheet}")
+        logging.info("Retrieved additional shipping charges for %s: %s", product_id, shippingCharges_from_sheet)
 
         updated_price = new_price - shippingCharges_from_sheet
 
@@ -176,18 +251,23 @@ def update_price(product_id, new_price):
 
         # === Step 2: Determine type of change ===
         if new_price > oldPrice_from_sheet:
-            # Check for recent price increase
-            if has_recent_increase(product_id):
-                return f"⚠️ Price increase for product `{product_id}` was attempted within the last week. Please wait before increasing the price again."
-            
-            increase_percent = ((new_price - oldPrice_from_sheet) / oldPrice_from_sheet) * 100
-            if increase_percent > 10:
-                return f"⚠️ Price increase of {increase_percent:.2f}% exceeds 10% threshold. Update rejected for product `{product_id}`."
-            
-            change_type = "increased"
-            payload["old_price"] = max(new_price, oldPrice_from_sheet)
-            # Log the price increase
-            log_price_increase(product_id)
+            # Check and record the increase atomically so concurrent requests
+            # for the same product cannot both pass the weekly rule
+            # Same normalisation as the coalescing key, so "mz1" and "MZ1" share a lock
+            with _product_locks.hold(normalize_price_product(product_id)):
+                if has_recent_increase(product_id):
+                    record_price_outcome("update_price", product_id, OUTCOME_REJECTED_RECENT, oldPrice_from_sheet, new_price, supplier)
+                    return f"⚠️ Price increase for product `{product_id}` was attempted within the last week. Please wait before increasing the price again."
+
+                increase_percent = ((new_price - oldPrice_from_sheet) / oldPrice_from_sheet) * 100
+                if increase_percent > 10:
+                    record_price_outcome("update_price", product_id, OUTCOME_REJECTED_CAP, oldPrice_from_sheet, new_price, supplier)
+                    return f"⚠️ Price increase of {increase_percent:.2f}% exceeds 10% threshold. Update rejected for product `{product_id}`."
+
+                change_type = "increased"
+                payload["old_price"] = max(new_price, oldPrice_from_sheet)
+                # Log the price increase
+                increase_logged_at = log_price_increase(product_id)
 
         elif new_price < oldPrice_from_sheet:
             change_type = "decreased"
@@ -197,50 +277,78 @@ def update_price(product_id, new_price):
             change_type = "unchanged"
             payload["old_price"] = oldPrice_from_sheet  # Keep old price if unchanged
 
-        logging.info(f"Sending POST request with payload: {payload}")
+        logging.debug("Sending POST request with payload: %s", payload)
+
+        if write_queue is not None:
+            # The outcome is recorded once the queued write reaches the sheet
+            write_queue.enqueue(
+                base_url, product_id, payload, supplier, "update_price", oldPrice_from_sheet, new_price,
+                increase_logged_at=increase_logged_at,
+            )
+            return f"✅ Price for product `{product_id}` will be {change_type} from {price_from_sheet} to {updated_price} soon."
 
         post_response = requests.post(base_url, json=payload)
 
         if post_response.status_code != 200:
             raise Exception(f"Failed to update price. Status: {post_response.status_code}, Response: {post_response.text}")
 
+        record_price_outcome("update_price", product_id, OUTCOME_APPLIED, oldPrice_from_sheet, new_price, supplier)
         return f"✅ Price for product `{product_id}` will be {change_type} from {price_from_sheet} to {updated_price} soon."
 
     except Exception as e:
-        logging.error(f"Error updating price for product {product_id}: {str(e)}")
+        logging.error("Error updating price for product %s: %s", product_id, e)
+        record_price_outcome("update_price", product_id, OUTCOME_ERROR, oldPrice_from_sheet, new_price, supplier)
         return f"❌ Error occurred while updating price for product `{product_id}`: {str(e)}"
 
 
-def discount(product_id, new_price):
+def discount(product_id, new_price, supplier=None):
     """right 
     Updates the price for a product.
     - Changes the price only.
     - Keeps the old price.
+    - Duplicate requests for the same product and price share one update.
+    - Every outcome is recorded in the price-change history.
+    - In write-behind mode the sheet write is queued and flushed in batches.
     """
+    result, shared = _price_calls.do(
+        make_price_key(product_id, "discount", new_price), _discount, product_id, new_price, supplier
+    )
+    if shared:
+        logging.info("Reused in-flight/recent discount for product %s", product_id)
+    return result
+
+def _discount(product_id, new_price, supplier=None):
     base_url = "https://script.google.com/macros/s/AKfycby9s68FArBBMxrzVcbsaS3xDQ9orMBOOGfZMjD_r0yB7aDySdKzkzthEcoAWNIJj7aS/exec"
 
-    logging.info(f"Applying discount by changing price for product {product_id} to {new_price}")
+    logging.info("Applying discount by changing price for product %s to %s", product_id, new_price)
+    requested_price = new_price
+    oldPrice_from_sheet = None
 
     try:
         # === Step 1: Get current price ===
         get_params = {"supplierproductcode": str(product_id)}
         get_response = requests.get(base_url, params=get_params)
 
-        logging.info(f"Response from API for product {product_id}: {get_response.text}")
+        logging.debug("Response from API for product %s: %s", product_id, get_response.text)
 
         if get_response.status_code != 200:
             raise Exception(f"Failed to retrieve current price. Status: {get_response.status_code}, Response: {get_response.text}")
 
         data = get_response.json()
+        write_queue = get_price_write_queue()
+        if write_queue is not None:
+            # Validate against this product's queued write, not the stale sheet
+            data = write_queue.overlay(base_url, product_id, data)
         price_from_sheet = float(data.get("update_price", 0))
-        logging.info(f"Retrieved current price for {product_id}: {price_from_sheet}")
+        logging.info("Retrieved current price for %s: %s", product_id, price_from_sheet)
         oldPrice_from_sheet = float(data.get("update_oldPrice", 0))
-        logging.info(f"Retrieved oldprice for {product_id}: {oldPrice_from_sheet}")
+        logging.info("Retrieved oldprice for %s: %s", product_id, oldPrice_from_sheet)
         shippingCharges_from_sheet = float(data.get("update_additionalshippingcharges", 0))
-        logging.info(f"Retrieved additional shipping charges for {product_id}: {shippingCharges_from_sheet}")
+        logging.info("Retrieved additional shipping charges for %s: %s", product_id, shippingCharges_from_sheet)
 
         # === Step 2: Check if new price exceeds old price ===
         if new_price > oldPrice_from_sheet:
+            record_price_outcome("discount", product_id, OUTCOME_REJECTED_ABOVE_OLD, oldPrice_from_sheet, requested_price, supplier)
             return f"⚠️ Discounted price cannot exceed old price. Update rejected for product `{product_id}`."
         
         else:
@@ -253,13 +361,20 @@ def discount(product_id, new_price):
             "old_price" : oldPrice_from_sheet  # Keep old price unchanged   
         }
 
+        if write_queue is not None:
+            # The outcome is recorded once the queued write reaches the sheet
+            write_queue.enqueue(base_url, product_id, payload, supplier, "discount", oldPrice_from_sheet, requested_price)
+            return f"✅ Discount for product `{product_id}` will be applied soon. Price will change from {oldPrice_from_sheet} to {new_price} with additional shipping charges {shippingCharges_from_sheet}."
+
         post_response = requests.post(base_url, json=payload)
 
         if post_response.status_code != 200:
             raise Exception(f"Failed to update price. Status: {post_response.status_code}, Response: {post_response.text}")
 
+        record_price_outcome("discount", product_id, OUTCOME_APPLIED, oldPrice_from_sheet, requested_price, supplier)
         return f"✅ Discount applied for product `{product_id}`. Price changed from {oldPrice_from_sheet} to {new_price} with additional shipping charges {shippingCharges_from_sheet}."
 
     except Exception as e:
-        logging.error(f"Error updating price for product {product_id}: {str(e)}")
+        logging.error("Error updating price for product %s: %s", product_id, e)
+        record_price_outcome("discount", product_id, OUTCOME_ERROR, oldPrice_from_sheet, requested_price, supplier)
         return f"❌ Error occurred while updating price for product `{product_id}`: {str(e)}"
\ No newline at end of file
@@ -0,0 +1,58 @@
+"""
+Startup helpers: deferred state loading and an optional pre-warm hook.
+
+With STARTUP_LAZY enabled (the default), the price increase log, the
+product catalogue export and the OpenAI client are loaded on first use, and
+heavy dependencies are imported then too. STARTUP_PREWARM can pay those
+costs ahead of the first message, either in a background thread or before
+create_app() returns.
+
+Some startup work is never deferred, because messages must not be handled
+before it is done: create_app() always restores the state snapshot (so
+redelivered messages are still recognised), replays the write-behind
+journal (so queued price writes are neither lost nor hidden from
+validation), and starts the audit log, snapshot, write-behind and scheduler
+threads.
+"""
+import logging
+import threading
+import time
+
+
+def prewarm(app):
+    """
+    Import lazy dependencies and load deferred state
+    """
+    started = time.perf_counter()
+    with app.app_context():
+        from .function_handler import ensure_price_log_loaded
+        from .utils.openai_utils import get_openai_client
+        from .utils.product_catalogue import get_product_catalogue
+
+        ensure_price_log_loaded()
+        catalogue = get_product_catalogue()
+        if catalogue is not None:
+            # Build the suggestion index now instead of on the first typo
+            catalogue.suggest("WARMUP")
+        if app.config.get("OPENAI_API_KEY"):
+            get_openai_client()
+
+    logging.info("Pre-warm finished in %.1f ms", (time.perf_counter() - started) * 1000)
+
+
+def run_prewarm(app):
+    """
+    Run the pre-warm hook according to STARTUP_PREWARM: off, background or sync
+    """
+    mode = app.config.get("STARTUP_PREWARM", "off")
+    if mode == "sync":
+        prewarm(app)
+    elif mode == "background":
+        threading.Thread(target=_safe_prewarm, args=(app,), name="prewarm", daemon=True).start()
+
+
+def _safe_prewarm(app):
+    try:
+        prewarm(app)
+    except Exception as e:
+        logging.error("Pre-warm failed: %s", e)
@@ -0,0 +1,213 @@
+"""
+Admission control in front of the multi-agent pipeline.
+
+Each message has to take a token from its supplier's bucket and from the
+global bucket before any LLM or Apps Script work runs. Shed messages get a
+canned reply instead. Bucket state lives in Redis when REDIS_URL is set, so
+all workers share the same limits, and in process memory otherwise.
+"""
+import logging
+import threading
+import time
+
+SHED_REPLY = "⏳ We are receiving a lot of requests right now. Please wait a minute and send your message again."
+
+# Atomically refill and take one token; returns 1 if admitted, 0 otherwise.
+# The clock is Redis TIME, so workers with skewed clocks cannot mint tokens.
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+if now == nil then
+    local clock = redis.call('TIME')
+    now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+end
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local admitted = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    admitted = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return admitted
+"""
+
+# Give one token back without going over capacity; a missing bucket is full
+_REFUND_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+if tokens == nil then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'tokens', math.min(capacity, tokens + 1))
+return 1
+"""
+
+
+class MemoryBucketStore:
+    """
+    Token buckets held in this process
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, capacity, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+            admitted = tokens >= 1
+            if admitted:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+        return admitted
+
+    def refund(self, key, capacity):
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, time.time()))
+            self._buckets[key] = (min(capacity, tokens + 1), updated)
+
+    def evict_idle(self, max_idle=3600):
+        cutoff = time.time() - max_idle
+        with self._lock:
+            for key in [k for k, (_, updated) in self._buckets.items() if updated < cutoff]:
+                del self._buckets[key]
+
+
+class RedisBucketStore:
+    """
+    Token buckets shared across workers through Redis
+    """
+
+    def __init__(self, url, prefix="admission:"):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(_TAKE_SCRIPT)
+        self._refund = self._client.register_script(_REFUND_SCRIPT)
+        self._prefix = prefix
+
+    def take(self, key, rate, capacity, now=None):
+        # Without an explicit now the script reads the Redis server clock
+        args = [rate, capacity] if now is None else [rate, capacity, now]
+        return bool(self._take(keys=[self._prefix + key], args=args))
+
+    def refund(self, key, capacity):
+        self._refund(keys=[self._prefix + key], args=[capacity])
+
+    def evict_idle(self, max_idle=3600):
+        # Keys expire on their own
+        pass
+
+
+class AdmissionController:
+    """
+    Per-supplier and global token buckets
+    """
+
+    def __init__(self, store, supplier_rate=0.2, supplier_burst=5,
+                 global_rate=5.0, global_burst=50, shed_reply_interval=60):
+        self.store = store
+        self.supplier_rate = supplier_rate
+        self.supplier_burst = supplier_burst
+        self.global_rate = global_rate
+        self.global_burst = global_burst
+        self.shed_reply_interval = shed_reply_interval
+        self.admitted = 0
+        self.shed = 0
+        self._last_shed_reply = {}
+        self._last_eviction = time.monotonic()
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        if now - self._last_eviction < 600:
+            return
+        self._last_eviction = now
+        self.store.evict_idle()
+        for wa_id in [w for w, t in self._last_shed_reply.items() if now - t >= self.shed_reply_interval]:
+            self._last_shed_reply.pop(wa_id, None)
+
+    def admit(self, wa_id):
+        """
+        Take a token for wa_id from its bucket and from the global bucket.
+
+        Returns:
+            bool: True if the message may go through the full pipeline
+        """
+        self._evict_idle()
+        try:
+            if not self.store.take(f"supplier:{wa_id}", self.supplier_rate, self.supplier_burst):
+                self.shed += 1
+                logging.warning("Shedding message from %s: supplier rate limit", wa_id)
+                return False
+            if not self.store.take("global", self.global_rate, self.global_burst):
+                # Do not charge the supplier for a message we shed globally
+                self.store.refund(f"supplier:{wa_id}", self.supplier_burst)
+                self.shed += 1
+                logging.warning("Shedding message from %s: global rate limit", wa_id)
+                return False
+        except Exception as e:
+            # Fail open: a broken store must not take the bot down
+            logging.error("Admission store error, admitting message: %s", e)
+        self.admitted += 1
+        return True
+
+    def should_send_shed_reply(self, wa_id):
+        """
+        Send the canned reply at most once per interval per supplier, so a
+        flood of messages does not turn into a flood of replies
+        """
+        now = time.monotonic()
+        last = self._last_shed_reply.get(wa_id)
+        if last is not None and now - last < self.shed_reply_interval:
+            return False
+        self._last_shed_reply[wa_id] = now
+        return True
+
+
+_controller = None
+
+
+def init_admission_control(app):
+    """
+    Build the admission controller from the app configuration
+    """
+    global _controller
+    if not app.config.get("ADMISSION_CONTROL_ENABLED", True):
+        _controller = None
+        return None
+
+    store = None
+    redis_url = app.config.get("REDIS_URL")
+    if redis_url:
+        try:
+            store = RedisBucketStore(redis_url)
+        except ImportError:
+            logging.error(
+                "REDIS_URL is set but the redis package is not installed; admission control "
+                "falls back to per-process buckets, so limits apply per worker. Install redis."
+            )
+        except Exception as e:
+            logging.error("Could not use Redis for admission control, falling back to memory: %s", e)
+    if store is None:
+        store = MemoryBucketStore()
+
+    _controller = AdmissionController(
+        store,
+        supplier_rate=app.config.get("RATE_LIMIT_SUPPLIER_RATE", 0.2),
+        supplier_burst=app.config.get("RATE_LIMIT_SUPPLIER_BURST", 5),
+        global_rate=app.config.get("RATE_LIMIT_GLOBAL_RATE", 5.0),
+        global_burst=app.config.get("RATE_LIMIT_GLOBAL_BURST", 50),
+        shed_reply_interval=app.config.get("RATE_LIMIT_SHED_REPLY_INTERVAL", 60),
+    )
+    return _controller
+
+
+def get_admission_controller():
+    return _controller
@@ -0,0 +1,222 @@
+"""
+Buffered, batched audit log for price operations.
+
+Entries are kept in memory and written as JSON lines in batches, either when
+the buffer reaches a size threshold or when the flush interval elapses. Each
+batch is written with a single fsync. Files rotate daily and when they grow
+past a size limit, and a final flush runs on interpreter exit and SIGTERM.
+The SIGTERM handler takes no locks: it hands the final flush to the writer
+thread, because the signal may interrupt record() or flush() while they hold
+a lock on the main thread.
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import signal
+import threading
+from datetime import datetime, timedelta
+
+_AUDIT_DIR = os.path.join("instance", "audit")
+_FILE_PREFIX = "price_audit"
+
+
+class PriceAuditLog:
+    """
+    Audit-log writer for price operations
+    """
+
+    def __init__(self, directory=_AUDIT_DIR, batch_size=50, flush_interval=2.0,
+                 max_file_bytes=10 * 1024 * 1024):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_file_bytes = max_file_bytes
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="price-audit-writer", daemon=True
+        )
+        self._thread.start()
+
+    def record(self, entry):
+        """
+        Buffer an audit entry. Never touches the disk on the caller's thread.
+        """
+        with self._lock:
+            self._buffer.append(entry)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+        # Entries recorded while the last batch was being written
+        self.flush()
+
+    def flush(self):
+        """
+        Write all buffered entries with one write and one fsync
+        """
+        with self._lock:
+            if not self._buffer:
+                return 0
+            batch, self._buffer = self._buffer, []
+
+        data = "".join(json.dumps(entry, default=str) + "\n" for entry in batch)
+        try:
+            with self._write_lock:
+                os.makedirs(self.directory, exist_ok=True)
+                path = self._current_path(len(data))
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+        except Exception as e:
+            logging.error("Failed to flush price audit log: %s", e)
+            with self._lock:
+                self._buffer[:0] = batch
+            return 0
+        return len(batch)
+
+    def _current_path(self, incoming_bytes):
+        """
+        Return the file for today's date, moving on to the next numbered part
+        when the current one would exceed the size limit
+        """
+        day = datetime.now().strftime("%Y%m%d")
+        part = 0
+        while True:
+            path = os.path.join(self.directory, f"{_FILE_PREFIX}-{day}-{part:03d}.jsonl")
+            if not os.path.exists(path):
+                return path
+            if os.path.getsize(path) + incoming_bytes <= self.max_file_bytes:
+                return path
+            part += 1
+
+    def iter_entries(self, since=None, until=None, product_id=None, operation=None):
+        """
+        Stream entries from the audit files in chronological order.
+
+        Args:
+            since (datetime, optional): Skip entries older than this
+            until (datetime, optional): Skip entries newer than this
+            product_id (str, optional): Only return entries for this product
+            operation (str, optional): Only return entries for this operation
+
+        Yields:
+            dict: One audit entry at a time
+        """
+        self.flush()
+        pattern = os.path.join(self.directory, f"{_FILE_PREFIX}-*.jsonl")
+        for path in sorted(glob.glob(pattern)):
+            # Skip whole files outside the requested date range. Files are
+            # named by flush date, and an entry buffered before midnight can
+            # land in the next day's file, so allow one day after `until`.
+            day = os.path.basename(path).split("-")[1]
+            if since and day < since.strftime("%Y%m%d"):
+                continue
+            if until and day > (until + timedelta(days=1)).strftime("%Y%m%d"):
+                continue
+
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if product_id and entry.get("product_id") != product_id:
+                        continue
+                    if operation and entry.get("operation") != operation:
+                        continue
+                    if since or until:
+                        try:
+                            timestamp = datetime.fromisoformat(entry.get("timestamp"))
+                        except (TypeError, ValueError):
+                            logging.warning("Skipping audit entry with bad timestamp in %s: %r", path, entry.get("timestamp"))
+                            continue
+                        if since and timestamp < since:
+                            continue
+                        if until and timestamp > until:
+                            continue
+                    yield entry
+
+    def stop(self, timeout=5.0):
+        """
+        Ask the writer thread for a final flush and wait up to timeout for it.
+        Takes no locks, so it is safe to call from a signal handler.
+        """
+        self._closed = True
+        self._wakeup.set()
+        if threading.current_thread() is not self._thread:
+            self._thread.join(timeout)
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        self.flush()
+
+
+_audit_log = None
+_audit_log_lock = threading.Lock()
+
+
+def init_price_audit_log(app):
+    """
+    Create the process-wide audit log from the app configuration. Call this
+    from the main thread so the SIGTERM handler can be installed.
+    """
+    global _audit_log
+    with _audit_log_lock:
+        if _audit_log is None:
+            _audit_log = PriceAuditLog(
+                directory=app.config.get("AUDIT_LOG_DIR") or os.path.join(app.instance_path, "audit"),
+                batch_size=app.config.get("AUDIT_LOG_BATCH_SIZE", 50),
+                flush_interval=app.config.get("AUDIT_LOG_FLUSH_INTERVAL", 2.0),
+                max_file_bytes=app.config.get("AUDIT_LOG_MAX_BYTES", 10 * 1024 * 1024),
+            )
+            _install_shutdown_hooks(_audit_log)
+    return _audit_log
+
+
+def get_price_audit_log():
+    """
+    Return the process-wide audit log, creating it with defaults on first use
+    """
+    global _audit_log
+    if _audit_log is None:
+        with _audit_log_lock:
+            if _audit_log is None:
+                _audit_log = PriceAuditLog()
+                _install_shutdown_hooks(_audit_log)
+    return _audit_log
+
+
+def _install_shutdown_hooks(audit_log):
+    atexit.register(audit_log.close)
+
+    # Signal handlers can only be installed from the main thread
+    if threading.current_thread() is not threading.main_thread():
+        return
+
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def handle_sigterm(signum, frame):
+        # Not close(): flush() would wait forever on a lock the interrupted
+        # main thread may hold. Anything left is written by the atexit close().
+        audit_log.stop()
+        if previous == signal.SIG_IGN:
+            return
+        if callable(previous):
+            previous(signum, frame)
+        else:
+            raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
@@ -1,6 +1,7 @@
-import json
 import logging
 from datetime import datetime
+from .audit_log import get_price_audit_log
+from .price_history import record_price_outcome, OUTCOME_APPLIED, OUTCOME_ERROR
 
 def normalize_product_id(product_id):
     """
@@ -10,7 +11,7 @@ def normalize_product_id(product_id):
         return str(product_id).upper().strip()
     return product_id
 
-def increase_price(product_id, new_price):
+def increase_price(product_id, new_price, supplier=None):
     """
     Dummy function for price increase - simulates API call
     """
@@ -28,7 +29,8 @@ def increase_price(product_id, new_price):
             "product_id": normalized_product_id,
             "new_price": new_price,
             "timestamp": datetime.now().isoformat(),
-            "status": "success"
+            "status": "success",
+            "supplier": supplier
         }
         
         # In real implementation, this would call the actual API
@@ -43,21 +45,22 @@ def increase_price(product_id, new_price):
             "timestamp": datetime.now().isoformat()
         }
         
-        # Log to file (simulating database logging)
-        with open("price_increase_log.json", "a") as f:
-            f.write(json.dumps(log_entry) + "\n")
+        # Buffered audit log (simulating database logging)
+        get_price_audit_log().record(log_entry)
+        record_price_outcome("update_price", normalized_product_id, OUTCOME_APPLIED, new_price=new_price, supplier=supplier)
         
         return response
         
     except Exception as e:
-        logging.error(f"Dummy increase_price error: {e}")
+        logging.error("Dummy increase_price error: %s", e)
+        record_price_outcome("update_price", product_id, OUTCOME_ERROR, new_price=new_price, supplier=supplier)
         return {
             "success": False,
             "message": f"Failed to increase price for product {product_id}",
             "error": str(e)
         }
 
-def decrease_price(product_id, new_price):
+def decrease_price(product_id, new_price, supplier=None):
     """
     Dummy function for price decrease - simulates API call
     """
@@ -75,7 +78,8 @@ def decrease_price(product_id, new_price):
             "product_id": normalized_product_id,
             "new_price": new_price,
             "timestamp": datetime.now().isoformat(),
-            "status": "success"
+            "status": "success",
+            "supplier": supplier
         }
         
         # In real implementation, this would call the actual API
@@ -90,21 +94,22 @@ def decrease_price(product_id, new_price):
             "timestamp": datetime.now().isoformat()
         }
         
-        # Log to file (simulating database logging)
-        with open("price_increase_log.json", "a") as f:
-            f.write(json.dumps(log_entry) + "\n")
+        # Buffered audit log (simulating database logging)
+        get_price_audit_log().record(log_entry)
+        record_price_outcome("update_price", normalized_product_id, OUTCOME_APPLIED, new_price=new_price, supplier=supplier)
         
         return response
         
     except Exception as e:
-        logging.error(f"Dummy decrease_price error: {e}")
+        logging.error("Dummy decrease_price error: %s", e)
+        record_price_outcome("update_price", product_id, OUTCOME_ERROR, new_price=new_price, supplier=supplier)
         return {
             "success": False,
             "message": f"Failed to decrease price for product {product_id}",
             "error": str(e)
         }
 
-def discount(product_id, discount_amount):
+def discount(product_id, discount_amount, supplier=None):
     """
     Dummy function for applying discount - simulates API call
     """
@@ -122,7 +127,8 @@ def discount(product_id, discount_amount):
             "product_id": normalized_product_id,
             "discount_amount": discount_amount,
             "timestamp": datetime.now().isoformat(),
-            "status": "success"
+            "status": "success",
+            "supplier": supplier
         }
         
         # In real implementation, this would call the actual API
@@ -137,14 +143,15 @@ def discount(product_id, discount_amount):
             "timestamp": datetime.now().isoformat()
         }
         
-        # Log to file (simulating database logging)
-        with open("price_increase_log.json", "a") as f:
-            f.write(json.dumps(log_entry) + "\n")
+        # Buffered audit log (simulating database logging)
+        get_price_audit_log().record(log_entry)
+        record_price_outcome("discount", normalized_product_id, OUTCOME_APPLIED, new_price=discount_amount, supplier=supplier)
         
         return response
         
     except Exception as e:
-        logging.error(f"Dummy discount error: {e}")
+        logging.error("Dummy discount error: %s", e)
+        record_price_outcome("discount", product_id, OUTCOME_ERROR, new_price=discount_amount, supplier=supplier)
         return {
             "success": False,
             "message": f"Failed to apply discount to product {product_id}",
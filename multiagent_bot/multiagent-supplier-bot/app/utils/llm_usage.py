@@ -0,0 +1,257 @@
+"""
+Per-supplier LLM token and latency accounting.
+
+Every chat completion records its prompt and completion tokens, model,
+latency and calling agent, together with the supplier (wa_id) and intent
+of the message being handled. Counters are kept in memory and merged into
+one JSON file per day and process at a flush interval, so workers never
+rewrite each other's files. Rollups and budgets read all of a day's files.
+Optional soft daily token budgets switch a supplier to cheaper paths once
+exceeded.
+"""
+import atexit
+import contextvars
+import glob
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date
+
+_current_wa_id = contextvars.ContextVar("llm_usage_wa_id", default=None)
+_current_intent = contextvars.ContextVar("llm_usage_intent", default=None)
+
+_FIELDS = ("calls", "prompt_tokens", "completion_tokens", "latency_ms")
+_KEY_FIELDS = ("day", "wa_id", "intent", "agent", "model")
+
+
+@contextmanager
+def usage_context(wa_id):
+    """
+    Attribute LLM calls made inside the block to a supplier
+    """
+    wa_token = _current_wa_id.set(wa_id)
+    intent_token = _current_intent.set(None)
+    try:
+        yield
+    finally:
+        _current_wa_id.reset(wa_token)
+        _current_intent.reset(intent_token)
+
+
+def set_usage_intent(intent):
+    _current_intent.set(intent)
+
+
+def current_wa_id():
+    return _current_wa_id.get()
+
+
+def _default_namespace():
+    return re.sub(r"[^A-Za-z0-9.]+", "_", f"{socket.gethostname()}.{os.getpid()}")
+
+
+class UsageAggregator:
+    """
+    Low-overhead in-memory counters, flushed to one JSON file per day and process
+    """
+
+    def __init__(self, directory, flush_interval=60, daily_token_budget=0, namespace=None):
+        self.directory = directory
+        self.namespace = namespace or _default_namespace()
+        self.flush_interval = flush_interval
+        self.daily_token_budget = daily_token_budget
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Deltas since the last flush, keyed by _KEY_FIELDS
+        self._pending = {}
+        # Running token totals per (day, wa_id) for budget checks
+        self._supplier_tokens = {}
+        self._budget_warned = set()
+        self._load_today()
+
+    def _path(self, day):
+        return os.path.join(self.directory, f"usage-{day}-{self.namespace}.json")
+
+    @staticmethod
+    def _read_file(path):
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _read_day(self, day):
+        """
+        Rows of every process for a day
+        """
+        paths = glob.glob(os.path.join(glob.escape(self.directory), f"usage-{day}-*.json"))
+        rows = []
+        for path in sorted(paths):
+            rows.extend(self._read_file(path))
+        return rows
+
+    def _load_today(self):
+        day = date.today().isoformat()
+        try:
+            rows = self._read_day(day)
+        except (OSError, ValueError) as e:
+            logging.error("Failed to load LLM usage for %s: %s", day, e)
+            return
+        for row in rows:
+            key = (day, row.get("wa_id"))
+            self._supplier_tokens[key] = (
+                self._supplier_tokens.get(key, 0) + row["prompt_tokens"] + row["completion_tokens"]
+            )
+
+    def record(self, agent, model, prompt_tokens, completion_tokens, latency_ms,
+               wa_id=None, intent=None):
+        day = date.today().isoformat()
+        key = (day, wa_id, intent, agent, model)
+        with self._lock:
+            counters = self._pending.get(key)
+            if counters is None:
+                counters = self._pending[key] = [0, 0, 0, 0.0]
+            counters[0] += 1
+            counters[1] += prompt_tokens
+            counters[2] += completion_tokens
+            counters[3] += latency_ms
+            supplier_key = (day, wa_id)
+            self._supplier_tokens[supplier_key] = (
+                self._supplier_tokens.get(supplier_key, 0) + prompt_tokens + completion_tokens
+            )
+
+    def tokens_today(self, wa_id):
+        return self._supplier_tokens.get((date.today().isoformat(), wa_id), 0)
+
+    def is_over_budget(self, wa_id):
+        """
+        True once the supplier has used its soft daily token budget
+        """
+        if not self.daily_token_budget or wa_id is None:
+            return False
+        over = self.tokens_today(wa_id) >= self.daily_token_budget
+        if over and (date.today(), wa_id) not in self._budget_warned:
+            self._budget_warned.add((date.today(), wa_id))
+            logging.warning("Supplier %s exceeded the daily LLM token budget", wa_id)
+        return over
+
+    def flush(self):
+        """
+        Merge pending counters into this process's per-day files
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                # Budgets only concern today
+                today = date.today().isoformat()
+                for key in [k for k in self._supplier_tokens if k[0] != today]:
+                    del self._supplier_tokens[key]
+                self._budget_warned = {k for k in self._budget_warned if k[0] == date.today()}
+            if not pending:
+                return 0
+
+            by_day = {}
+            for key, counters in pending.items():
+                by_day.setdefault(key[0], {})[key[1:]] = counters
+
+            os.makedirs(self.directory, exist_ok=True)
+            for day, deltas in by_day.items():
+                rows = {}
+                for row in self._read_file(self._path(day)):
+                    rows[tuple(row.get(field) for field in _KEY_FIELDS[1:])] = row
+                for key, counters in deltas.items():
+                    row = rows.get(key)
+                    if row is None:
+                        row = rows[key] = dict(zip(_KEY_FIELDS[1:], key), **{field: 0 for field in _FIELDS})
+                    for field, value in zip(_FIELDS, counters):
+                        row[field] += value
+                temp_path = self._path(day) + ".tmp"
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(list(rows.values()), f)
+                os.replace(temp_path, self._path(day))
+            return len(pending)
+
+    def rollup(self, by=("wa_id",), day=None):
+        """
+        Aggregate a day's usage (flushed and pending) by the given fields
+        """
+        day = day or date.today().isoformat()
+        self.flush()
+        totals = {}
+        for row in self._read_day(day):
+            row = dict(row, day=day)
+            key = tuple(row.get(field) for field in by)
+            entry = totals.get(key)
+            if entry is None:
+                entry = totals[key] = dict(zip(by, key), **{field: 0 for field in _FIELDS})
+            for field in _FIELDS:
+                entry[field] += row[field]
+        result = sorted(totals.values(), key=lambda e: -(e["prompt_tokens"] + e["completion_tokens"]))
+        for entry in result:
+            entry["avg_latency_ms"] = round(entry["latency_ms"] / entry["calls"], 1) if entry["calls"] else 0
+        return result
+
+    def start(self):
+        threading.Thread(target=self._run, name="llm-usage-flush", daemon=True).start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error("Failed to flush LLM usage: %s", e)
+
+
+_aggregator = None
+_aggregator_lock = threading.Lock()
+_settings = {"directory": os.path.join("instance", "llm_usage"), "flush_interval": 60, "daily_token_budget": 0}
+
+
+def init_llm_usage(app):
+    _settings.update(
+        directory=app.config.get("LLM_USAGE_DIR") or os.path.join(app.instance_path, "llm_usage"),
+        flush_interval=app.config.get("LLM_USAGE_FLUSH_INTERVAL", 60),
+        daily_token_budget=app.config.get("LLM_SUPPLIER_DAILY_TOKEN_BUDGET", 0),
+    )
+
+
+def get_usage_aggregator():
+    """
+    Return the aggregator, creating it (and reading today's totals) on first use
+    """
+    global _aggregator
+    if _aggregator is None:
+        with _aggregator_lock:
+            if _aggregator is None:
+                _aggregator = UsageAggregator(**_settings)
+                _aggregator.start()
+    return _aggregator
+
+
+def record_completion(agent, model, usage, latency_ms):
+    """
+    Record one completion for the supplier and intent in the current context
+    """
+    try:
+        get_usage_aggregator().record(
+            agent or "unknown",
+            model,
+            getattr(usage, "prompt_tokens", 0) or 0,
+            getattr(usage, "completion_tokens", 0) or 0,
+            latency_ms,
+            wa_id=_current_wa_id.get(),
+            intent=_current_intent.get(),
+        )
+    except Exception as e:
+        logging.error("Failed to record LLM usage: %s", e)
+
+
+def supplier_over_budget(wa_id=None):
+    wa_id = wa_id if wa_id is not None else _current_wa_id.get()
+    return get_usage_aggregator().is_over_budget(wa_id)
@@ -0,0 +1,236 @@
+"""
+Asynchronous, batched JSON-lines logging.
+
+Request threads merge the message with its arguments (which may be mutated
+once the call returns) and drop the record on a queue, as
+logging.handlers.QueueHandler does. A background writer thread formats the
+records as JSON, redacts secrets and writes them to the stream in batches.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+# Patterns that must never reach the log output
+_SECRET_PATTERNS = [
+    (re.compile(r"(Bearer\s+)[A-Za-z0-9._~+/=\-]+", re.IGNORECASE), r"\1[REDACTED]"),
+    (re.compile(r"(access_token=)[^&\s\"']+", re.IGNORECASE), r"\1[REDACTED]"),
+    (re.compile(r"sk-[A-Za-z0-9_\-]{16,}"), "[REDACTED]"),
+]
+
+_STOP = object()
+
+
+class SecretRedactor:
+    """
+    Replaces known secret values and token-looking strings with a placeholder
+    """
+
+    def __init__(self, secrets=None):
+        # Only redact values long enough to be meaningful secrets
+        self.secrets = sorted(
+            {s for s in (secrets or []) if s and len(s) >= 6}, key=len, reverse=True
+        )
+
+    def redact(self, text):
+        for secret in self.secrets:
+            if secret in text:
+                text = text.replace(secret, "[REDACTED]")
+        for pattern, replacement in _SECRET_PATTERNS:
+            text = pattern.sub(replacement, text)
+        return text
+
+
+class DebugRateLimitFilter(logging.Filter):
+    """
+    Rate-limits DEBUG records per call site so high-volume debug logging
+    cannot flood the queue. Runs on the calling thread, before the record
+    is queued, and never formats the message.
+    """
+
+    def __init__(self, max_per_interval=20, interval=10.0):
+        super().__init__()
+        self.max_per_interval = max_per_interval
+        self.interval = interval
+        self._windows = {}
+        self._suppressed = 0
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.max_per_interval <= 0:
+            return True
+
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window_start, count = self._windows.get(key, (now, 0))
+            if now - window_start >= self.interval:
+                window_start, count = now, 0
+            if count >= self.max_per_interval:
+                self._suppressed += 1
+                self._windows[key] = (window_start, count)
+                return False
+            self._windows[key] = (window_start, count + 1)
+        return True
+
+    def pop_suppressed(self):
+        with self._lock:
+            suppressed, self._suppressed = self._suppressed, 0
+        return suppressed
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    Formats a record as a single JSON object, redacting secrets
+    """
+
+    def __init__(self, redactor=None):
+        super().__init__()
+        self.redactor = redactor or SecretRedactor()
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": self.redactor.redact(record.getMessage()),
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exc"] = self.redactor.redact(self.formatException(record.exc_info))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class AsyncBatchHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler whose own writer thread writes the queued records as JSON
+    lines in batches (QueueListener hands them over one at a time)
+    """
+
+    def __init__(self, stream=None, formatter=None, batch_size=100,
+                 flush_interval=0.5, max_queue_size=10000, rate_limiter=None):
+        super().__init__(queue.Queue(maxsize=max_queue_size))
+        self.stream = stream or sys.stdout
+        self.setFormatter(formatter or JsonLinesFormatter())
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rate_limiter = rate_limiter
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._thread = threading.Thread(
+            target=self._run, name="log-writer", daemon=True
+        )
+        self._thread.start()
+
+    def prepare(self, record):
+        """
+        Merge msg and args on the calling thread; JSON formatting and
+        redaction are left to the writer thread
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def pop_dropped(self):
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        return dropped
+
+    def _run(self):
+        while True:
+            try:
+                record = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._write_batch([])
+                continue
+
+            batch = [record]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = _STOP in batch
+            self._write_batch([r for r in batch if r is not _STOP])
+            if stop:
+                return
+
+    def _write_batch(self, records):
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+
+        suppressed = self.rate_limiter.pop_suppressed() if self.rate_limiter else 0
+        dropped = self.pop_dropped()
+        if suppressed or dropped:
+            lines.append(json.dumps({
+                "ts": datetime.now(timezone.utc).isoformat(),
+                "level": "WARNING",
+                "logger": __name__,
+                "msg": "Log records suppressed",
+                "debug_rate_limited": suppressed,
+                "queue_full_dropped": dropped,
+            }))
+
+        if not lines:
+            return
+        try:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+        except Exception:
+            pass
+
+    def close(self):
+        if self._thread.is_alive():
+            # Blocks if the queue is full, unlike enqueue()
+            self.queue.put(_STOP)
+            self._thread.join(timeout=5)
+        super().close()
+
+
+def setup_async_logging(level=logging.INFO, stream=None, secrets=None,
+                        batch_size=100, flush_interval=0.5,
+                        debug_max_per_interval=20, debug_interval=10.0):
+    """
+    Replace the root handlers with a single asynchronous JSON-lines handler
+    """
+    rate_limiter = DebugRateLimitFilter(debug_max_per_interval, debug_interval)
+    handler = AsyncBatchHandler(
+        stream=stream,
+        formatter=JsonLinesFormatter(SecretRedactor(secrets)),
+        batch_size=batch_size,
+        flush_interval=flush_interval,
+        rate_limiter=rate_limiter,
+    )
+    handler.addFilter(rate_limiter)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+        existing.close()
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    atexit.register(handler.close)
+    return handler
@@ -0,0 +1,284 @@
+"""
+Memory introspection for a running worker.
+
+Reports the entry count and deep byte size of each long-lived in-memory
+structure, and wraps tracemalloc so that allocation snapshots can be taken
+in production and diffed, grouped by file or by file and line. All numbers
+are for the current worker process only.
+"""
+import gc
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import types
+from collections import OrderedDict, deque
+
+# Containers are walked; these are shared program objects, not data
+_SKIP_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+
+_MAX_SNAPSHOTS = 5
+
+
+def deep_sizeof(obj, max_objects=1_000_000):
+    """
+    Size in bytes of obj and everything it references through containers,
+    instance __dict__ and __slots__, counting shared objects once. A NumPy
+    array that owns its data reports its buffer in getsizeof; a view does
+    not, so the array it views is walked instead and counted once.
+
+    Returns:
+        tuple: (bytes, truncated) where truncated means max_objects was hit
+    """
+    # Only present if something already imported it
+    numpy = sys.modules.get("numpy")
+    ndarray = numpy.ndarray if numpy is not None else ()
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        if len(seen) >= max_objects:
+            return total, True
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, _SKIP_TYPES):
+            continue
+        seen.add(id(current))
+        total += sys.getsizeof(current, 0)
+
+        # Copies are taken in one step so live structures can be walked
+        # while request threads keep changing them
+        if isinstance(current, dict):
+            items = current.copy()
+            stack.extend(items.keys())
+            stack.extend(items.values())
+        elif isinstance(current, (set, frozenset)):
+            stack.extend(current.copy())
+        elif isinstance(current, (list, tuple, deque)):
+            stack.extend(list(current))
+        elif isinstance(current, (str, bytes, bytearray, int, float, bool)) or current is None:
+            continue
+        elif isinstance(current, ndarray):
+            if current.base is not None:
+                stack.append(current.base)
+        else:
+            if hasattr(current, "__dict__"):
+                stack.append(vars(current))
+            for slot in getattr(type(current), "__slots__", ()):
+                if hasattr(current, slot):
+                    stack.append(getattr(current, slot))
+    return total, False
+
+
+def _tracked_structures():
+    """
+    name -> object for the module-level state that lives as long as the worker
+    """
+    from . import whatsapp_utils
+    from .. import function_handler
+    from . import openai_utils, response_cache, llm_usage, price_history, write_behind, scheduler
+    from . import state_snapshot, admission, read_receipts, audit_log
+
+    structures = OrderedDict([
+        ("processed_message_ids", whatsapp_utils.processed_message_ids),
+        ("user_conversation_threads", whatsapp_utils.user_conversation_threads),
+        ("price_increase_log", function_handler._price_increase_log),
+        ("recent_function_calls", whatsapp_utils._recent_function_calls),
+        ("function_handler_price_calls", function_handler._price_calls.results),
+        ("pending_requests", whatsapp_utils._pending_requests),
+        ("recent_products", whatsapp_utils._recent_products),
+        ("product_locks", function_handler._product_locks._locks),
+        ("reply_latency_accepted", read_receipts.get_response_latency()._accepted),
+    ])
+    if openai_utils._client is not None:
+        structures["openai_client"] = openai_utils._client
+    cache = response_cache.get_response_cache()
+    if cache is not None:
+        structures["response_cache"] = cache._entries
+        # Allocated in full on first store, whatever the entry count
+        if cache._matrix is not None:
+            structures["response_cache_matrix"] = cache._matrix
+    snapshotter = state_snapshot.get_state_snapshotter()
+    if snapshotter is not None:
+        structures["snapshot_thread_blobs"] = snapshotter._thread_blobs
+        structures["snapshot_encoded_ids"] = snapshotter._encoded_ids
+    controller = admission.get_admission_controller()
+    if controller is not None:
+        # Redis-backed buckets live in Redis, not in this process
+        if isinstance(controller.store, admission.MemoryBucketStore):
+            structures["admission_buckets"] = controller.store._buckets
+        structures["admission_last_shed_reply"] = controller._last_shed_reply
+    if llm_usage._aggregator is not None:
+        structures["llm_usage_counters"] = llm_usage._aggregator._pending
+        structures["llm_usage_supplier_tokens"] = llm_usage._aggregator._supplier_tokens
+    if price_history._store is not None:
+        structures["price_history_chunk_cache"] = price_history._store._chunk_cache
+    if write_behind.get_price_write_queue() is not None:
+        structures["price_write_queue"] = write_behind.get_price_write_queue()._pending
+    # Not get_price_audit_log(), which would create one
+    if audit_log._audit_log is not None:
+        structures["audit_log_buffer"] = audit_log._audit_log._buffer
+    if scheduler.get_scheduler() is not None:
+        structures["scheduler_queue"] = list(scheduler.get_scheduler()._queue.queue)
+        structures["scheduler_lanes"] = scheduler.get_scheduler()._lanes
+    return structures
+
+
+def _entry_count(obj):
+    try:
+        return len(obj)
+    except TypeError:
+        return None
+
+
+def process_memory():
+    """
+    Current and peak resident set size of this process, where available
+    """
+    info = {"pid": os.getpid()}
+    try:
+        with open("/proc/self/statm", "r") as f:
+            info["rss_bytes"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        info["rss_bytes"] = None
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KiB, macOS bytes
+        info["peak_rss_bytes"] = peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        info["peak_rss_bytes"] = None
+    info["gc_objects"] = len(gc.get_objects())
+    return info
+
+
+def structure_sizes():
+    """
+    Entry counts and deep sizes of every tracked structure
+    """
+    started = time.perf_counter()
+    report = []
+    for name, obj in _tracked_structures().items():
+        size, truncated = deep_sizeof(obj)
+        report.append({
+            "name": name,
+            "entries": _entry_count(obj),
+            "deep_bytes": size,
+            "truncated": truncated,
+        })
+    report.sort(key=lambda entry: -entry["deep_bytes"])
+    return {
+        "process": process_memory(),
+        "structures": report,
+        "tracemalloc": tracemalloc_status(),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+# === tracemalloc ===
+
+_snapshots = OrderedDict()
+_snapshot_ids = itertools.count(1)
+_snapshot_lock = threading.Lock()
+
+
+def start_tracing(frames=1):
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start(frames)
+    logging.info("tracemalloc started with %s frame(s)", frames)
+    return True
+
+
+def stop_tracing():
+    """
+    Stop tracing and drop stored snapshots, releasing tracemalloc's memory
+    """
+    if not tracemalloc.is_tracing():
+        return False
+    tracemalloc.stop()
+    with _snapshot_lock:
+        _snapshots.clear()
+    logging.info("tracemalloc stopped")
+    return True
+
+
+def tracemalloc_status():
+    status = {"tracing": tracemalloc.is_tracing(), "snapshots": []}
+    if status["tracing"]:
+        current, peak = tracemalloc.get_traced_memory()
+        status.update({
+            "traced_bytes": current,
+            "traced_peak_bytes": peak,
+            "overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+        })
+    with _snapshot_lock:
+        status["snapshots"] = [
+            {"id": snapshot_id, "taken_at": taken_at} for snapshot_id, (taken_at, _) in _snapshots.items()
+        ]
+    return status
+
+
+def take_snapshot():
+    """
+    Store a filtered snapshot and return its id. Only the last few are kept.
+    """
+    if not tracemalloc.is_tracing():
+        raise RuntimeError("tracemalloc is not tracing; start it first")
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+    with _snapshot_lock:
+        snapshot_id = next(_snapshot_ids)
+        _snapshots[snapshot_id] = (time.time(), snapshot)
+        while len(_snapshots) > _MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return snapshot_id
+
+
+def diff_snapshots(from_id, to_id=None, group_by="lineno", limit=20):
+    """
+    Allocation growth between two snapshots. A new snapshot is taken when
+    to_id is not given.
+
+    Args:
+        group_by (str): "lineno" (file and line) or "filename" (module)
+    """
+    if group_by not in ("lineno", "filename"):
+        raise ValueError("group_by must be 'lineno' or 'filename'")
+    with _snapshot_lock:
+        known = from_id in _snapshots
+    if known and to_id is None:
+        to_id = take_snapshot()
+    with _snapshot_lock:
+        if from_id not in _snapshots or to_id not in _snapshots:
+            raise KeyError(f"Unknown snapshot id; available: {list(_snapshots)}")
+        old_taken, old = _snapshots[from_id]
+        new_taken, new = _snapshots[to_id]
+
+    stats = new.compare_to(old, group_by)
+    top = []
+    for stat in stats[:limit]:
+        frame = stat.traceback[0]
+        top.append({
+            "file": frame.filename,
+            "line": frame.lineno if group_by == "lineno" else None,
+            "size_diff_bytes": stat.size_diff,
+            "count_diff": stat.count_diff,
+            "size_bytes": stat.size,
+            "count": stat.count,
+        })
+    return {
+        "from": from_id,
+        "to": to_id,
+        "seconds_between": round(new_taken - old_taken, 1),
+        "group_by": group_by,
+        "total_size_diff_bytes": sum(stat.size_diff for stat in stats),
+        "top": top,
+    }
@@ -1,22 +1,55 @@
 import logging
-import openai
+import threading
+import time
 from flask import current_app
+from .llm_usage import record_completion, supplier_over_budget
 
-def call_openai_chat(messages, temperature=0.3):
+# The openai package is imported on first use to keep cold start fast, and
+# one client (with its connection pool) is reused for all calls
+_client = None
+_client_api_key = None
+_client_lock = threading.Lock()
+
+def get_openai_client():
+    """
+    Return a shared OpenAI client for the configured API key
+    """
+    global _client, _client_api_key
+    api_key = current_app.config['OPENAI_API_KEY']
+    if _client is None or _client_api_key != api_key:
+        with _client_lock:
+            if _client is None or _client_api_key != api_key:
+                import openai
+
+                _client = openai.OpenAI(api_key=api_key)
+                _client_api_key = api_key
+    return _client
+
+def call_openai_chat(messages, temperature=0.3, agent=None):
     """
     Make a call to OpenAI Chat Completion API
+
+    Token usage and latency are recorded per supplier, intent and agent.
+    Suppliers over their soft daily budget are switched to the fallback model.
     """
     try:
-        client = openai.OpenAI(api_key=current_app.config['OPENAI_API_KEY'])
+        client = get_openai_client()
+
+        model = current_app.config.get("OPENAI_MODEL") or "gpt-4o-mini"
+        fallback_model = current_app.config.get("OPENAI_FALLBACK_MODEL")
+        if fallback_model and supplier_over_budget():
+            model = fallback_model
         
+        started = time.perf_counter()
         response = client.chat.completions.create(
-            model="gpt-4o-mini",  # You can change this to your preferred model
+            model=model,
             messages=messages,
             temperature=temperature,
             max_tokens=1000
         )
+        record_completion(agent, response.model or model, response.usage, (time.perf_counter() - started) * 1000)
         
         return response.choices[0].message.content
     except Exception as e:
-        logging.error(f"OpenAI API error: {e}")
-        return None
\ No newline at end of file
+        logging.error("OpenAI API error: %s", e)
+        return None
@@ -1,5 +1,38 @@
 import json
 from .openai_utils import call_openai_chat
+from .llm_usage import supplier_over_budget
+from .prompt_builder import PromptBuilder, count_tokens
+
+_OUTPUT_BASE_PROMPT = """You are an output formatting agent for the price management system. Your job is to:
+1. Format responses from other agents for WhatsApp
+2. Make responses friendly and professional
+3. Handle error cases gracefully
+4. Ask for clarification when needed
+
+Keep responses concise but informative. Use emojis sparingly and appropriately.
+Respond in Roman Urdu as users communicate in Roman Urdu."""
+
+# Task instructions live in the static prompts so the per-call user message
+# carries only data, and the cached prefix stays byte-identical
+CLARIFICATION_PROMPT = _OUTPUT_BASE_PROMPT + """
+
+Task: the user message contains what the supplier sent and the analysis result.
+Create a friendly response that asks for missing information to help with price update or discount request.
+Respond in English."""
+
+CONFIRMATION_PROMPT = _OUTPUT_BASE_PROMPT + """
+
+Task: the user message contains the API response and the original request.
+Create a friendly confirmation message for the user.
+Respond in English."""
+
+# Raw API responses can be long; the formatter only needs the gist
+_MAX_API_RESPONSE_TOKENS = 200
+
+
+def _compact_json(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+
 
 class OutputAgent:
     """
@@ -7,58 +40,63 @@ class OutputAgent:
     """
     
     def __init__(self):
-        self.system_prompt = """
-        You are an output formatting agent for the price management system. Your job is to:
-        1. Format responses from other agents for WhatsApp
-        2. Make responses friendly and professional
-        3. Handle error cases gracefully
-        4. Ask for clarification when needed
-        
-        Keep responses concise but informative. Use emojis sparingly and appropriately.
-        Respond in Roman Urdu as users communicate in Roman Urdu.
-        """
+        self.system_prompt = _OUTPUT_BASE_PROMPT
+        self.clarification_builder = PromptBuilder.from_config(CLARIFICATION_PROMPT)
+        self.confirmation_builder = PromptBuilder.from_config(CONFIRMATION_PROMPT)
     
     def format_response(self, agent_response, query_analysis, original_message):
         """
         Format the final response for WhatsApp
         """
-        if query_analysis.get("intent") == "unclear" or query_analysis.get("clarification_needed"):
+        clarification = query_analysis.get("intent") == "unclear" or query_analysis.get("clarification_needed")
+
+        # Suppliers over their soft LLM budget get template replies
+        if supplier_over_budget():
+            return self.template_response(agent_response, query_analysis, clarification)
+
+        if clarification:
             return self.format_clarification_request(query_analysis, original_message)
         
         return self.format_success_response(agent_response, query_analysis)
+
+    def template_response(self, agent_response, query_analysis, clarification):
+        """
+        Format a response without an LLM call
+        """
+        if clarification:
+            return "I need more information to help you. Please provide the product ID and new price or discount amount."
+        if isinstance(agent_response, dict):
+            prefix = "✅" if agent_response.get("success") else "❌"
+            return f"{prefix} {agent_response.get('message', 'Request processed.')}"
+        return str(agent_response) if agent_response else f"Operation completed successfully for product {query_analysis.get('product_id')}. ✅"
     
     def format_clarification_request(self, query_analysis, original_message):
         """
         Format a request for clarification
         """
-        messages = [
-            {"role": "system", "content": self.system_prompt},
-            {"role": "user", "content": f"""
-            User sent: "{original_message}"
-            Analysis result: {json.dumps(query_analysis)}
-            
-            Create a friendly response that asks for missing information to help with price update or discount request.
-            Respond in English.
-            """}
-        ]
+        messages = self.clarification_builder.build(
+            f"User sent: {_compact_json(original_message)}\nAnalysis: {_compact_json(query_analysis)}",
+            agent="output_clarification",
+        )
         
-        response = call_openai_chat(messages)
+        response = call_openai_chat(messages, agent="output_clarification")
         return response or "I need more information to help you. Please provide the product ID and new price or discount amount."
     
     def format_success_response(self, api_response, query_analysis):
         """
         Format a successful operation response
         """
-        messages = [
-            {"role": "system", "content": self.system_prompt},
-            {"role": "user", "content": f"""
-            API Response: {api_response}
-            Original request was: {query_analysis.get('intent')} for product {query_analysis.get('product_id')}
-            
-            Create a friendly confirmation message for the user.
-            Respond in English.
-            """}
-        ]
+        if isinstance(api_response, (dict, list)):
+            api_response = _compact_json(api_response)
+        api_response = str(api_response)
+        if count_tokens(api_response) > _MAX_API_RESPONSE_TOKENS:
+            api_response = api_response[:_MAX_API_RESPONSE_TOKENS * 4] + " …"
+
+        messages = self.confirmation_builder.build(
+            f"API Response: {api_response}\n"
+            f"Original request: {query_analysis.get('intent')} for product {query_analysis.get('product_id')}",
+            agent="output_confirmation",
+        )
         
-        response = call_openai_chat(messages)
-        return response or f"Operation completed successfully for product {query_analysis.get('product_id')}. ✅"
\ No newline at end of file
+        response = call_openai_chat(messages, agent="output_confirmation")
+        return response or f"Operation completed successfully for product {query_analysis.get('product_id')}. ✅"
@@ -0,0 +1,439 @@
+"""
+Columnar price-change history.
+
+Every update_price/discount outcome is appended as one row to typed column
+arrays. Full chunks (and any partial chunk at the flush interval or on exit)
+are written as immutable .npz files, with product and supplier strings
+dictionary-encoded into integer columns. Aggregations load the chunks once
+and run vectorized with NumPy.
+
+Each process (e.g. each Gunicorn worker) writes its own namespace of chunks
+and its own dictionary, named by host and pid, so workers sharing the
+directory never overwrite each other. Queries read every namespace and remap
+its codes into one dictionary.
+
+CLI:
+    python -m app.utils.price_history per-supplier-day [--days 7]
+    python -m app.utils.price_history increase-pct
+    python -m app.utils.price_history top-rejected [--limit 10]
+    python -m app.utils.price_history compact
+"""
+import argparse
+import atexit
+import glob
+import json
+import logging
+import math
+import os
+import re
+import socket
+import threading
+import time
+from array import array
+
+OPERATIONS = ["update_price", "discount"]
+
+OUTCOME_APPLIED = 0
+OUTCOME_REJECTED_CAP = 1
+OUTCOME_REJECTED_RECENT = 2
+OUTCOME_REJECTED_ABOVE_OLD = 3
+OUTCOME_ERROR = 4
+OUTCOMES = ["applied", "rejected_cap", "rejected_recent", "rejected_above_old", "error"]
+REJECTED_OUTCOMES = (OUTCOME_REJECTED_CAP, OUTCOME_REJECTED_RECENT, OUTCOME_REJECTED_ABOVE_OLD)
+
+INCREASE_CAP_PCT = 10.0
+
+# column name -> array typecode / numpy dtype
+_COLUMNS = {
+    "ts": ("q", "int64"),
+    "supplier": ("i", "int32"),
+    "product": ("i", "int32"),
+    "operation": ("b", "int8"),
+    "outcome": ("b", "int8"),
+    "old_price": ("d", "float64"),
+    "new_price": ("d", "float64"),
+    "change_pct": ("f", "float32"),
+}
+_UNKNOWN = -1
+# chunk-<namespace>-<number>.npz; namespaces never contain "-"
+_CHUNK_NAME = re.compile(r"^chunk-(?P<namespace>[A-Za-z0-9._]+)-(?P<number>\d{8})\.npz$")
+
+
+def _sanitize_namespace(namespace):
+    return re.sub(r"[^A-Za-z0-9.]+", "_", namespace)
+
+
+def _default_namespace():
+    return _sanitize_namespace(f"{socket.gethostname()}.{os.getpid()}")
+
+
+def _dictionary_file(namespace):
+    return f"dictionary-{namespace}.json"
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+class PriceHistoryStore:
+    """
+    Append-only columnar store of price-change outcomes
+    """
+
+    def __init__(self, directory, chunk_rows=65536, flush_interval=60, namespace=None):
+        self.directory = directory
+        self.namespace = _sanitize_namespace(namespace) if namespace else _default_namespace()
+        self.chunk_rows = chunk_rows
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._active = self._new_columns()
+        self._chunk_cache = {}
+        self._dictionary_cache = {}
+        self._suppliers, self._products = [], []
+        self._supplier_ids, self._product_ids = {}, {}
+        self._load_dictionary()
+        self._last_flush = time.monotonic()
+
+    @staticmethod
+    def _new_columns():
+        return {name: array(typecode) for name, (typecode, _) in _COLUMNS.items()}
+
+    def _load_dictionary(self):
+        path = os.path.join(self.directory, _dictionary_file(self.namespace))
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self._suppliers, self._products = data.get("suppliers", []), data.get("products", [])
+        self._supplier_ids = {value: i for i, value in enumerate(self._suppliers)}
+        self._product_ids = {value: i for i, value in enumerate(self._products)}
+
+    @staticmethod
+    def _encode(value, values, ids):
+        if value is None:
+            return _UNKNOWN
+        value = str(value)
+        code = ids.get(value)
+        if code is None:
+            code = ids[value] = len(values)
+            values.append(value)
+        return code
+
+    def record(self, operation, product_id, outcome, old_price=None, new_price=None,
+               supplier=None, timestamp=None):
+        """
+        Append one outcome row. Cheap enough for the request thread.
+        """
+        old_price = _to_float(old_price)
+        new_price = _to_float(new_price)
+        if old_price and not math.isnan(old_price) and not math.isnan(new_price):
+            change_pct = (new_price - old_price) / old_price * 100
+        else:
+            change_pct = float("nan")
+
+        with self._lock:
+            columns = self._active
+            columns["ts"].append(int(timestamp if timestamp is not None else time.time()))
+            columns["supplier"].append(self._encode(supplier, self._suppliers, self._supplier_ids))
+            columns["product"].append(self._encode(product_id, self._products, self._product_ids))
+            columns["operation"].append(OPERATIONS.index(operation))
+            columns["outcome"].append(outcome)
+            columns["old_price"].append(old_price)
+            columns["new_price"].append(new_price)
+            columns["change_pct"].append(change_pct)
+            now = time.monotonic()
+            due = len(columns["ts"]) >= self.chunk_rows or now - self._last_flush >= self.flush_interval
+            if due:
+                # Claim the flush so concurrent records do not start another
+                self._last_flush = now
+
+        if due:
+            threading.Thread(target=self.flush, name="price-history-flush", daemon=True).start()
+
+    def flush(self):
+        """
+        Write the active rows as a new immutable chunk
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not len(self._active["ts"]):
+                    return None
+                columns, self._active = self._active, self._new_columns()
+                dictionary = {"suppliers": list(self._suppliers), "products": list(self._products)}
+                self._last_flush = time.monotonic()
+
+            import numpy as np
+
+            os.makedirs(self.directory, exist_ok=True)
+            existing = self._chunk_paths().get(self.namespace, [])
+            number = max((_chunk_number(p) for p in existing), default=0) + 1
+            path = os.path.join(self.directory, f"chunk-{self.namespace}-{number:08d}.npz")
+            arrays = {
+                name: np.frombuffer(columns[name], dtype=dtype).copy()
+                for name, (_, dtype) in _COLUMNS.items()
+            }
+            # The dictionary goes first so no reader sees a chunk with unknown codes
+            _atomic_write(
+                os.path.join(self.directory, _dictionary_file(self.namespace)),
+                lambda f: f.write(json.dumps(dictionary).encode("utf-8")),
+            )
+            _atomic_write(path, lambda f: np.savez(f, **arrays))
+            self._chunk_cache[path] = arrays
+            return path
+
+    def _chunk_paths(self):
+        """
+        Chunk paths per namespace, in write order
+        """
+        namespaces = {}
+        for path in sorted(glob.glob(os.path.join(glob.escape(self.directory), "chunk-*-*.npz"))):
+            match = _CHUNK_NAME.match(os.path.basename(path))
+            if match:
+                namespaces.setdefault(match.group("namespace"), []).append(path)
+        for paths in namespaces.values():
+            paths.sort(key=_chunk_number)
+        return namespaces
+
+    def compact(self, namespace=None):
+        """
+        Merge a namespace's chunks (default: this process's) into one to keep
+        the file count down. Pass "*" to compact every namespace.
+        """
+        import numpy as np
+
+        if namespace is None or namespace == self.namespace:
+            self.flush()
+        with self._flush_lock:
+            chunk_paths = self._chunk_paths()
+            targets = list(chunk_paths) if namespace == "*" else [namespace or self.namespace]
+            merged_count = 0
+            for name in targets:
+                paths = chunk_paths.get(name, [])
+                if len(paths) < 2:
+                    continue
+                merged = self._load_columns(paths)
+                target = paths[-1]
+                _atomic_write(target, lambda f: np.savez(f, **merged))
+                for path in paths[:-1]:
+                    os.remove(path)
+                    self._chunk_cache.pop(path, None)
+                self._chunk_cache[target] = merged
+                merged_count += len(paths)
+            return merged_count
+
+    def _load_columns(self, paths):
+        import numpy as np
+
+        parts = {name: [] for name in _COLUMNS}
+        for path in paths:
+            chunk = self._chunk_cache.get(path)
+            if chunk is None:
+                with np.load(path) as data:
+                    chunk = {name: data[name] for name in _COLUMNS}
+                self._chunk_cache[path] = chunk
+            for name in _COLUMNS:
+                parts[name].append(chunk[name])
+        return {
+            name: np.concatenate(parts[name]) if parts[name] else np.empty(0, dtype=dtype)
+            for name, (_, dtype) in _COLUMNS.items()
+        }
+
+    def _namespace_dictionary(self, namespace):
+        if namespace == self.namespace:
+            with self._lock:
+                return list(self._suppliers), list(self._products)
+        path = os.path.join(self.directory, _dictionary_file(namespace))
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return [], []
+        cached = self._dictionary_cache.get(namespace)
+        if cached is None or cached[0] != mtime:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            cached = self._dictionary_cache[namespace] = (mtime, data.get("suppliers", []), data.get("products", []))
+        return cached[1], cached[2]
+
+    def columns(self):
+        """
+        All rows (every namespace's chunks plus this process's active chunk)
+        as NumPy arrays, with supplier and product codes remapped into one
+        dictionary.
+
+        Returns:
+            tuple: (columns, suppliers, products)
+        """
+        import numpy as np
+
+        chunk_paths = self._chunk_paths()
+        live = {path for paths in chunk_paths.values() for path in paths}
+        for path in [p for p in self._chunk_cache if p not in live]:
+            # Merged away by a compaction
+            del self._chunk_cache[path]
+        chunk_paths.setdefault(self.namespace, [])
+
+        suppliers, products = [], []
+        supplier_ids, product_ids = {}, {}
+        parts = {name: [] for name in _COLUMNS}
+        for namespace, paths in chunk_paths.items():
+            stored = self._load_columns(paths)
+            if namespace == self.namespace:
+                with self._lock:
+                    active = {
+                        name: np.frombuffer(self._active[name], dtype=dtype).copy()
+                        for name, (_, dtype) in _COLUMNS.items()
+                    }
+                stored = {name: np.concatenate([stored[name], active[name]]) for name in _COLUMNS}
+            local_suppliers, local_products = self._namespace_dictionary(namespace)
+            for column, values, merged, ids in (
+                ("supplier", local_suppliers, suppliers, supplier_ids),
+                ("product", local_products, products, product_ids),
+            ):
+                # Local code -> merged code, with -1 (unknown) kept as is
+                mapping = np.array([self._encode(value, merged, ids) for value in values] + [_UNKNOWN], dtype=np.int32)
+                codes = stored[column]
+                stored[column] = mapping[np.where((codes >= 0) & (codes < len(values)), codes, -1)]
+            for name in _COLUMNS:
+                parts[name].append(stored[name])
+
+        data = {
+            name: np.concatenate(parts[name]) if parts[name] else np.empty(0, dtype=dtype)
+            for name, (_, dtype) in _COLUMNS.items()
+        }
+        return data, suppliers, products
+
+    # === Aggregations ===
+
+    def changes_per_supplier_per_day(self, days=None):
+        import numpy as np
+
+        data, suppliers, _ = self.columns()
+        mask = data["outcome"] == OUTCOME_APPLIED
+        if days:
+            mask &= data["ts"] >= time.time() - days * 86400
+        day = data["ts"][mask] // 86400
+        supplier = data["supplier"][mask].astype(np.int64) + 1  # shift unknown (-1) to 0
+        width = len(suppliers) + 1
+        keys, counts = np.unique(day * width + supplier, return_counts=True)
+        return [
+            {
+                "day": time.strftime("%Y-%m-%d", time.gmtime(int(key // width) * 86400)),
+                "supplier": suppliers[key % width - 1] if key % width else None,
+                "changes": int(count),
+            }
+            for key, count in zip(keys, counts)
+        ]
+
+    def increase_pct_distribution(self, bins=(0, 2, 4, 6, 8, 10, 15, 20, 50, 100)):
+        import numpy as np
+
+        data, _, _ = self.columns()
+        pct = data["change_pct"]
+        pct = pct[(data["operation"] == OPERATIONS.index("update_price")) & (pct > 0)]
+        edges = np.array(list(bins) + [np.inf], dtype=np.float64)
+        counts, _ = np.histogram(pct, bins=edges)
+        return {
+            "attempts": int(pct.size),
+            "above_cap": int(np.count_nonzero(pct > INCREASE_CAP_PCT)),
+            "cap_pct": INCREASE_CAP_PCT,
+            "median_pct": float(np.median(pct)) if pct.size else None,
+            "p95_pct": float(np.percentile(pct, 95)) if pct.size else None,
+            "histogram": [
+                {"from": float(edges[i]), "to": float(edges[i + 1]), "count": int(counts[i])}
+                for i in range(len(counts))
+            ],
+        }
+
+    def top_rejected_products(self, limit=10):
+        import numpy as np
+
+        data, _, products = self.columns()
+        mask = np.isin(data["outcome"], REJECTED_OUTCOMES) & (data["product"] >= 0)
+        counts = np.bincount(data["product"][mask], minlength=len(products))
+        top = np.argsort(counts)[::-1][:limit]
+        return [
+            {"product_id": products[i], "rejections": int(counts[i])}
+            for i in top if counts[i] > 0
+        ]
+
+
+def _chunk_number(path):
+    return int(_CHUNK_NAME.match(os.path.basename(path)).group("number"))
+
+
+def _atomic_write(path, write):
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+_store = None
+_store_lock = threading.Lock()
+_store_directory = os.path.join("instance", "price_history")
+
+
+def init_price_history(app):
+    """
+    Point the store at PRICE_HISTORY_DIR (default instance/price_history)
+    """
+    global _store_directory
+    _store_directory = app.config.get("PRICE_HISTORY_DIR") or os.path.join(app.instance_path, "price_history")
+
+
+def get_price_history():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = PriceHistoryStore(_store_directory)
+                atexit.register(_store.flush)
+    return _store
+
+
+def record_price_outcome(operation, product_id, outcome, old_price=None, new_price=None, supplier=None):
+    """
+    Record an outcome, never letting history failures affect the caller
+    """
+    try:
+        get_price_history().record(operation, product_id, outcome, old_price, new_price, supplier)
+    except Exception as e:
+        logging.error("Failed to record price history: %s", e)
+
+
+def run_query(store, query, days=None, limit=10):
+    if query == "per-supplier-day":
+        return store.changes_per_supplier_per_day(days=days)
+    if query == "increase-pct":
+        return store.increase_pct_distribution()
+    if query == "top-rejected":
+        return store.top_rejected_products(limit=limit)
+    raise ValueError(f"Unknown query: {query}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the price-change history")
+    parser.add_argument("query", choices=["per-supplier-day", "increase-pct", "top-rejected", "compact"])
+    parser.add_argument("--dir", default=_store_directory, help="price history directory")
+    parser.add_argument("--days", type=int, help="only include the last N days")
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    store = PriceHistoryStore(args.dir)
+    started = time.perf_counter()
+    if args.query == "compact":
+        result = {"merged_chunks": store.compact(namespace="*")}
+    else:
+        result = run_query(store, args.query, days=args.days, limit=args.limit)
+    print(json.dumps(result, indent=2))
+    print(f"({(time.perf_counter() - started) * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -21,48 +21,49 @@ class PriceManagementAgent:
             return str(product_id).upper().strip()
         return product_id
     
-    def increase_price(self, product_id, new_price):
+    def increase_price(self, product_id, new_price, supplier=None):
         """
         Call the price increase API
         """
         try:
             normalized_product_id = self.normalize_product_id(product_id)
-            return increase_price(normalized_product_id, new_price)
+            return increase_price(normalized_product_id, new_price, supplier=supplier)
         except Exception as e:
-            logging.error(f"Price increase API error: {e}")
+            logging.error("Price increase API error: %s", e)
             return f"Error increasing price for product {product_id}: {str(e)}"
     
-    def decrease_price(self, product_id, new_price):
+    def decrease_price(self, product_id, new_price, supplier=None):
         """
         Call the price decrease API
         """
         try:
             normalized_product_id = self.normalize_product_id(product_id)
-            return decrease_price(normalized_product_id, new_price)
+            return decrease_price(normalized_product_id, new_price, supplier=supplier)
         except Exception as e:
-            logging.error(f"Price decrease API error: {e}")
+            logging.error("Price decrease API error: %s", e)
             return f"Error decreasing price for product {product_id}: {str(e)}"
     
-    def apply_discount(self, product_id, discount_amount):
+    def apply_discount(self, product_id, discount_amount, supplier=None):
         """
         Call the discount API
         """
         try:
             normalized_product_id = self.normalize_product_id(product_id)
-            return discount(normalized_product_id, discount_amount)
+            return discount(normalized_product_id, discount_amount, supplier=supplier)
         except Exception as e:
-            logging.error(f"Discount API error: {e}")
+            logging.error("Discount API error: %s", e)
             return f"Error applying discount to product {product_id}: {str(e)}"
     
-    def process_request(self, intent, product_id, amount):
+    def process_request(self, intent, product_id, amount, supplier=None):
         """
-        Process the price management request
+        Process the price management request. supplier is the requesting
+        supplier's wa_id, passed on to the price API for history and notices.
         """
         if intent == "price_increase":
-            return self.increase_price(product_id, amount)
+            return self.increase_price(product_id, amount, supplier=supplier)
         elif intent == "price_decrease":
-            return self.decrease_price(product_id, amount)
+            return self.decrease_price(product_id, amount, supplier=supplier)
         elif intent == "discount":
-            return self.apply_discount(product_id, amount)
+            return self.apply_discount(product_id, amount, supplier=supplier)
         else:
             return "Invalid request type. I can only handle price increases, decreases, and discounts."
\ No newline at end of file
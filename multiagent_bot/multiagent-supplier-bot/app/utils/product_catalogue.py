@@ -0,0 +1,332 @@
+"""
+Local product catalogue index.
+
+Loaded from a periodic CSV or JSON export of the product sheet so product
+codes can be validated (existence and ownership) and typos corrected before
+any LLM pass or Apps Script round-trip.
+"""
+import csv
+import json
+import logging
+import os
+import re
+import threading
+import time
+from array import array
+
+_CODE_COLUMNS = ("supplierproductcode", "product_code", "product_id", "code")
+_SUPPLIER_COLUMNS = ("supplier", "business_name", "supplier_name")
+_WA_ID_COLUMNS = ("wa_id", "supplier_phone", "phone")
+_NO_SUPPLIER = -1
+
+
+def normalize_code(code):
+    """
+    Normalize a product code for lookups: uppercase, no spaces or dashes
+    """
+    if code is None:
+        return None
+    return re.sub(r"[\s\-_]+", "", str(code)).upper()
+
+
+def edit_distance(a, b, max_distance=None):
+    """
+    Levenshtein distance, stopping early once max_distance is exceeded
+    """
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != cb),
+            ))
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+def _trigrams(code):
+    padded = f"$${code}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _TrigramIndex:
+    """
+    Inverted index from character trigrams to catalogue rows, used to pick
+    candidate codes before the exact edit-distance check
+    """
+
+    def __init__(self, codes):
+        self.codes = codes
+        self.postings = {}
+        for row, code in enumerate(codes):
+            for trigram in _trigrams(code):
+                rows = self.postings.get(trigram)
+                if rows is None:
+                    rows = self.postings[trigram] = array("i")
+                rows.append(row)
+
+    def search(self, code, max_distance, max_candidates=200):
+        query = _trigrams(code)
+        # Trigrams shared by a large share of the catalogue (common prefixes,
+        # runs of zeros) say little about similarity and cost the most to scan
+        common_limit = max(1000, len(self.codes) // 20)
+        shared = {}
+        skipped = 0
+        for trigram in query:
+            rows = self.postings.get(trigram, ())
+            if len(rows) > common_limit:
+                skipped += 1
+                continue
+            for row in rows:
+                shared[row] = shared.get(row, 0) + 1
+
+        # Each edit can remove at most three trigrams
+        required = max(1, len(query) - skipped - 3 * max_distance)
+        candidates = sorted(
+            (row for row, count in shared.items() if count >= required),
+            key=lambda row: -shared[row],
+        )[:max_candidates]
+
+        matches = []
+        for row in candidates:
+            distance = edit_distance(code, self.codes[row], max_distance)
+            if distance <= max_distance:
+                matches.append((distance, self.codes[row]))
+        return sorted(matches)
+
+
+class ProductCatalogue:
+    """
+    Compact in-memory index of product codes and their owning suppliers.
+
+    Normalized codes map to a row number, and each row keeps the code as it
+    is written in the sheet, which is what the backend expects. Suppliers and
+    WhatsApp IDs are interned and stored per row as integer arrays.
+    """
+
+    def __init__(self, rows=()):
+        self._index = {}
+        self._codes = []
+        self._canonical_codes = []
+        self._supplier_names = []
+        self._supplier_lookup = {}
+        self._row_supplier = array("i")
+        self._wa_ids = []
+        self._wa_id_lookup = {}
+        self._row_wa_id = array("i")
+        self._trigram_index = None
+        self._trigram_lock = threading.Lock()
+
+        for code, supplier, wa_id in rows:
+            self._add(code, supplier, wa_id)
+
+    def _intern(self, value, values, lookup):
+        if not value:
+            return _NO_SUPPLIER
+        value = str(value).strip()
+        position = lookup.get(value.lower())
+        if position is None:
+            position = lookup[value.lower()] = len(values)
+            values.append(value)
+        return position
+
+    def _add(self, code, supplier=None, wa_id=None):
+        canonical = str(code).strip() if code is not None else None
+        code = normalize_code(code)
+        if not code or code in self._index:
+            return
+        self._index[code] = len(self._codes)
+        self._codes.append(code)
+        self._canonical_codes.append(canonical)
+        self._row_supplier.append(self._intern(supplier, self._supplier_names, self._supplier_lookup))
+        self._row_wa_id.append(self._intern(wa_id, self._wa_ids, self._wa_id_lookup))
+
+    def __len__(self):
+        return len(self._codes)
+
+    def exists(self, code):
+        return normalize_code(code) in self._index
+
+    def canonical(self, code):
+        """
+        Return the code as written in the sheet, or None if it is unknown
+        """
+        row = self._index.get(normalize_code(code))
+        return self._canonical_codes[row] if row is not None else None
+
+    def owner(self, code):
+        """
+        Return (supplier, wa_id) for a code, or None if the code is unknown
+        """
+        row = self._index.get(normalize_code(code))
+        if row is None:
+            return None
+        supplier = self._row_supplier[row]
+        wa_id = self._row_wa_id[row]
+        return (
+            self._supplier_names[supplier] if supplier != _NO_SUPPLIER else None,
+            self._wa_ids[wa_id] if wa_id != _NO_SUPPLIER else None,
+        )
+
+    def is_owned_by(self, code, supplier=None, wa_id=None):
+        """
+        Check ownership. Rows without owner information are not restricted.
+        """
+        owner = self.owner(code)
+        if owner is None:
+            return False
+        owner_supplier, owner_wa_id = owner
+        if wa_id and owner_wa_id and str(wa_id) != owner_wa_id:
+            return False
+        if supplier and owner_supplier and str(supplier).strip().lower() != owner_supplier.lower():
+            return False
+        return True
+
+    def suggest(self, code, max_distance=2, limit=3):
+        """
+        Suggest the nearest known codes by edit distance, as written in the
+        sheet. The trigram index is built on first use.
+        """
+        code = normalize_code(code)
+        if not code:
+            return []
+        if self._trigram_index is None:
+            with self._trigram_lock:
+                if self._trigram_index is None:
+                    self._trigram_index = _TrigramIndex(self._codes)
+        return [
+            self._canonical_codes[self._index[candidate]]
+            for _, candidate in self._trigram_index.search(code, max_distance)[:limit]
+        ]
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Load a catalogue from a CSV export or a JSON export (a list of row
+        objects, or an object mapping product code to supplier)
+        """
+        if path.lower().endswith(".json"):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                return cls((code, supplier, None) for code, supplier in data.items())
+            return cls(_rows_from_dicts(data))
+
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            return cls(_rows_from_dicts(csv.DictReader(f)))
+
+
+def _rows_from_dicts(records):
+    for record in records:
+        fields = {str(key).strip().lower(): value for key, value in record.items() if key}
+        code = next((fields[c] for c in _CODE_COLUMNS if fields.get(c)), None)
+        if not code:
+            continue
+        supplier = next((fields[c] for c in _SUPPLIER_COLUMNS if fields.get(c)), None)
+        wa_id = next((fields[c] for c in _WA_ID_COLUMNS if fields.get(c)), None)
+        yield code, supplier, wa_id
+
+
+_catalogue = None
+_catalogue_path = None
+_catalogue_mtime = None
+_refresh_interval = 300
+_last_refresh_check = None
+_catalogue_lock = threading.Lock()
+
+
+def init_product_catalogue(app):
+    """
+    Configure and load the catalogue export named by PRODUCT_CATALOGUE_PATH
+    """
+    global _catalogue_path, _refresh_interval
+    _catalogue_path = app.config.get("PRODUCT_CATALOGUE_PATH")
+    _refresh_interval = app.config.get("PRODUCT_CATALOGUE_REFRESH_INTERVAL", 300)
+    # In lazy startup mode the export is read on first use
+    if _catalogue_path and not app.config.get("STARTUP_LAZY", False):
+        _reload_if_changed(force=True)
+
+
+def _reload_if_changed(force=False):
+    global _catalogue, _catalogue_mtime, _last_refresh_check
+    now = time.monotonic()
+    if not force and _last_refresh_check is not None and now - _last_refresh_check < _refresh_interval:
+        return
+    _last_refresh_check = now
+
+    try:
+        mtime = os.path.getmtime(_catalogue_path)
+    except OSError as e:
+        logging.error("Product catalogue not readable at %s: %s", _catalogue_path, e)
+        return
+    if mtime == _catalogue_mtime:
+        return
+
+    with _catalogue_lock:
+        if mtime == _catalogue_mtime:
+            return
+        started = time.perf_counter()
+        try:
+            catalogue = ProductCatalogue.from_file(_catalogue_path)
+        except Exception as e:
+            logging.error("Failed to load product catalogue from %s: %s", _catalogue_path, e)
+            return
+        _catalogue, _catalogue_mtime = catalogue, mtime
+        logging.info(
+            "Loaded product catalogue with %s codes in %.1f ms",
+            len(catalogue), (time.perf_counter() - started) * 1000,
+        )
+
+
+def get_product_catalogue():
+    """
+    Return the current catalogue, or None when no export is configured
+    """
+    if _catalogue_path:
+        _reload_if_changed()
+    return _catalogue
+
+
+def check_product_code(product_id, wa_id=None, business_name=None):
+    """
+    Validate a product code against the local catalogue.
+
+    Returns:
+        dict: status is one of "ok", "unknown", "not_owned" or "unavailable"
+        (no catalogue loaded), plus the code and suggestions. For known codes
+        "code" is the canonical code from the sheet; use it for backend calls.
+    """
+    code = str(product_id).strip() if product_id is not None else None
+    catalogue = get_product_catalogue()
+    if catalogue is None or not normalize_code(code):
+        return {"status": "unavailable", "code": code, "suggestions": []}
+    canonical = catalogue.canonical(code)
+    if canonical is None:
+        return {"status": "unknown", "code": code, "suggestions": catalogue.suggest(code)}
+    if not catalogue.is_owned_by(code, supplier=business_name, wa_id=wa_id):
+        return {"status": "not_owned", "code": canonical, "suggestions": []}
+    return {"status": "ok", "code": canonical, "suggestions": []}
+
+
+def format_product_code_rejection(check):
+    """
+    Build the reply for a code that failed the catalogue check
+    """
+    if check["status"] == "not_owned":
+        return f"❌ Product `{check['code']}` is not listed under your account. Please check the product code."
+    message = f"❌ Product `{check['code']}` was not found."
+    if check["suggestions"]:
+        options = ", ".join(f"`{code}`" for code in check["suggestions"])
+        message += f" Did you mean {options}?"
+    return message
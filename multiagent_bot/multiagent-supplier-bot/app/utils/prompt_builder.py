@@ -0,0 +1,164 @@
+"""
+Token-budgeted prompt builder shared by the agents.
+
+The static system prompt always goes first and is passed through unchanged,
+so provider-side prompt caching can match the prefix. Conversation history is
+trimmed to a token budget: recent turns are kept (long assistant replies are
+shortened), and older turns become one compact summary of the product codes
+and amounts they mentioned.
+"""
+import logging
+import math
+import re
+import threading
+
+from flask import current_app, has_app_context
+
+_PRODUCT_CODE_PATTERN = re.compile(r"\b[A-Za-z]{2,}[0-9][A-Za-z0-9]{2,}\b")
+_AMOUNT_PATTERN = re.compile(r"\b\d+(?:\.\d+)?%?")
+
+_encoding = None
+_encoding_loaded = False
+
+_stats = {"calls": 0, "prompt_tokens": 0, "tokens_saved": 0}
+_stats_lock = threading.Lock()
+
+
+def count_tokens(text):
+    """
+    Count tokens with tiktoken when it is installed, otherwise estimate at
+    four characters per token
+    """
+    global _encoding, _encoding_loaded
+    if not text:
+        return 0
+    if not _encoding_loaded:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = None
+        _encoding_loaded = True
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def _count_message_tokens(message):
+    # Every chat message carries a few tokens of role/framing overhead
+    return count_tokens(message["content"]) + 4
+
+
+def _truncate_to_tokens(text, max_tokens):
+    if count_tokens(text) <= max_tokens:
+        return text
+    # Trim by characters until the estimate fits, keeping the opening words
+    length = max_tokens * 4
+    while length > 0 and count_tokens(text[:length]) > max_tokens:
+        length = int(length * 0.8)
+    return text[:length].rstrip() + " …"
+
+
+def summarize_turns(turns):
+    """
+    Reduce older turns to the slots they mentioned (product codes, amounts)
+    """
+    codes, amounts = [], []
+    for turn in turns:
+        if turn["role"] != "user":
+            continue
+        for code in _PRODUCT_CODE_PATTERN.findall(turn["content"]):
+            code = code.upper()
+            if code not in codes:
+                codes.append(code)
+        for amount in _AMOUNT_PATTERN.findall(turn["content"]):
+            if amount not in amounts and not any(amount in code for code in codes):
+                amounts.append(amount)
+    if not codes and not amounts:
+        return None
+    parts = []
+    if codes:
+        parts.append("products " + ", ".join(codes[-5:]))
+    if amounts:
+        parts.append("amounts " + ", ".join(amounts[-5:]))
+    return f"Earlier in this conversation the supplier mentioned {'; '.join(parts)}."
+
+
+class PromptBuilder:
+    """
+    Builds chat messages for one agent within a history token budget
+    """
+
+    def __init__(self, system_prompt, history_budget=400, max_turns=5,
+                 assistant_turn_max_tokens=60):
+        self.system_prompt = system_prompt
+        self.history_budget = history_budget
+        self.max_turns = max_turns
+        self.assistant_turn_max_tokens = assistant_turn_max_tokens
+
+    @classmethod
+    def from_config(cls, system_prompt):
+        config = current_app.config if has_app_context() else {}
+        return cls(
+            system_prompt,
+            history_budget=config.get("PROMPT_HISTORY_TOKEN_BUDGET", 400),
+            max_turns=config.get("PROMPT_HISTORY_MAX_TURNS", 5),
+            assistant_turn_max_tokens=config.get("PROMPT_ASSISTANT_TURN_MAX_TOKENS", 60),
+        )
+
+    def build(self, user_content, history=(), agent=None):
+        """
+        Returns:
+            list: Chat messages with the static system prompt first
+        """
+        history = list(history)
+        recent = history[-self.max_turns:] if self.max_turns else []
+        older = history[:-self.max_turns] if self.max_turns else history
+
+        kept = []
+        used = 0
+        # Walk back from the newest turn and stop once the budget is spent
+        for position in range(len(recent) - 1, -1, -1):
+            turn = recent[position]
+            content = turn["content"]
+            if turn["role"] == "assistant":
+                content = _truncate_to_tokens(content, self.assistant_turn_max_tokens)
+            message = {"role": turn["role"], "content": content}
+            cost = _count_message_tokens(message)
+            if used + cost > self.history_budget:
+                older = history[:len(history) - len(recent) + position + 1]
+                break
+            kept.append(message)
+            used += cost
+        kept.reverse()
+
+        messages = [{"role": "system", "content": self.system_prompt}]
+        summary = summarize_turns(older) if older else None
+        if summary:
+            messages.append({"role": "system", "content": summary})
+        messages.extend(kept)
+        messages.append({"role": "user", "content": user_content})
+
+        self._report(messages, recent, user_content, agent)
+        return messages
+
+    def _report(self, messages, recent, user_content, agent):
+        sent = sum(_count_message_tokens(m) for m in messages)
+        # What the agent used to send: system prompt, raw recent turns, message
+        baseline = (
+            _count_message_tokens({"content": self.system_prompt})
+            + sum(_count_message_tokens(turn) for turn in recent)
+            + _count_message_tokens({"content": user_content})
+        )
+        saved = max(0, baseline - sent)
+        with _stats_lock:
+            _stats["calls"] += 1
+            _stats["prompt_tokens"] += sent
+            _stats["tokens_saved"] += saved
+        logging.info("Prompt for %s: %s tokens, %s saved", agent or "agent", sent, saved)
+
+
+def get_prompt_stats():
+    with _stats_lock:
+        return dict(_stats)
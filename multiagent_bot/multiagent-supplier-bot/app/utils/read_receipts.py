@@ -0,0 +1,174 @@
+"""
+Immediate read receipts with a typing indicator.
+
+As soon as a message is accepted, a mark-as-read request that also shows the
+typing indicator is sent to the Graph API from a small thread pool. The
+webhook never waits for it. The supplier sees the message was read while the
+agents are still working, instead of re-sending it. Time to this first signal
+and time to the actual reply are both measured from acceptance, per message.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+import requests
+
+
+class ResponseLatency:
+    """
+    Time-to-first-signal versus time-to-reply, over a window of recent messages
+    """
+
+    def __init__(self, window=1000, max_awaiting=10000):
+        self._lock = threading.Lock()
+        # message_id -> start time, oldest first
+        self._accepted = OrderedDict()
+        self.max_awaiting = max_awaiting
+        self._first_signal_ms = deque(maxlen=window)
+        self._reply_ms = deque(maxlen=window)
+        self.counts = {
+            "accepted": 0, "signals_sent": 0, "signals_failed": 0,
+            "replies": 0, "replies_failed": 0, "expired": 0,
+        }
+
+    def accepted(self, message_id):
+        started = time.monotonic()
+        with self._lock:
+            self.counts["accepted"] += 1
+            if message_id:
+                self._accepted[message_id] = started
+                # Messages that never got a reply would otherwise pile up
+                while len(self._accepted) > self.max_awaiting:
+                    self._accepted.popitem(last=False)
+                    self.counts["expired"] += 1
+        return started
+
+    def signal_sent(self, started, ok):
+        with self._lock:
+            if ok:
+                self._first_signal_ms.append((time.monotonic() - started) * 1000)
+                self.counts["signals_sent"] += 1
+            else:
+                self.counts["signals_failed"] += 1
+
+    def replied(self, message_id, ok=True):
+        """
+        Stop the clock for message_id; a failed send is counted but not timed
+        """
+        with self._lock:
+            started = self._accepted.pop(message_id, None)
+            if started is None:
+                return
+            if ok:
+                self._reply_ms.append((time.monotonic() - started) * 1000)
+                self.counts["replies"] += 1
+            else:
+                self.counts["replies_failed"] += 1
+
+    @staticmethod
+    def _summary(samples):
+        if not samples:
+            return {"count": 0, "p50_ms": None, "p95_ms": None}
+        ordered = sorted(samples)
+        return {
+            "count": len(ordered),
+            "p50_ms": round(ordered[len(ordered) // 2], 1),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+        }
+
+    def get_metrics(self):
+        with self._lock:
+            metrics = dict(self.counts)
+            metrics["time_to_first_signal"] = self._summary(self._first_signal_ms)
+            metrics["time_to_reply"] = self._summary(self._reply_ms)
+            metrics["awaiting_reply"] = len(self._accepted)
+        return metrics
+
+
+class ReadReceiptSender:
+    """
+    Fire-and-forget mark-as-read plus typing indicator
+    """
+
+    def __init__(self, access_token, version, phone_number_id, latency, workers=4, timeout=5):
+        self.url = f"https://graph.facebook.com/{version}/{phone_number_id}/messages"
+        self.headers = {
+            "Content-type": "application/json",
+            "Authorization": f"Bearer {access_token}",
+        }
+        self.latency = latency
+        self.workers = workers
+        self.timeout = timeout
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    from concurrent.futures import ThreadPoolExecutor
+
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="read-receipt")
+        return self._executor
+
+    def send(self, message_id, started):
+        """
+        Queue the receipt and return immediately
+        """
+        self._get_executor().submit(self._post, message_id, started)
+
+    def _post(self, message_id, started):
+        payload = {
+            "messaging_product": "whatsapp",
+            "status": "read",
+            "message_id": message_id,
+            "typing_indicator": {"type": "text"},
+        }
+        try:
+            response = requests.post(self.url, json=payload, headers=self.headers, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logging.warning("Failed to send read receipt for %s: %s", message_id, e)
+            self.latency.signal_sent(started, False)
+            return
+        self.latency.signal_sent(started, True)
+
+
+_latency = ResponseLatency()
+_sender = None
+
+
+def init_read_receipts(app):
+    """
+    Set up the sender when READ_RECEIPTS_ENABLED is set
+    """
+    global _sender
+    if not app.config.get("READ_RECEIPTS_ENABLED", True) or not app.config.get("ACCESS_TOKEN"):
+        _sender = None
+        return None
+    _sender = ReadReceiptSender(
+        app.config["ACCESS_TOKEN"],
+        app.config.get("VERSION"),
+        app.config.get("PHONE_NUMBER_ID"),
+        _latency,
+        workers=app.config.get("READ_RECEIPTS_WORKERS", 4),
+    )
+    return _sender
+
+
+def message_accepted(wa_id, message_id):
+    """
+    Start the reply clock and send the read receipt and typing indicator
+    """
+    started = _latency.accepted(message_id)
+    if _sender is not None and message_id:
+        _sender.send(message_id, started)
+
+
+def reply_sent(message_id, ok=True):
+    _latency.replied(message_id, ok)
+
+
+def get_response_latency():
+    return _latency
@@ -0,0 +1,193 @@
+"""
+Similarity-based cache for clarification and FAQ replies.
+
+Messages such as "price kam karni hai" or "discount lagana hai" carry no
+product code or amount and always get the same analysis and reply. Each
+cached message is stored as a hashed character n-gram vector. A lookup
+scores the new message against every entry with one matrix-vector product,
+and a cosine similarity above the threshold is a hit. Messages containing
+digits (product codes, amounts) are never cached. Analyses with a price
+action intent are only reused for the exact same normalized text, because
+"increase" and "decrease" differ by a few n-grams and score alike.
+"""
+import logging
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+_NON_WORD = re.compile(r"[^\w]+")
+_DIGIT = re.compile(r"\d")
+_REPEATED = re.compile(r"(\w)\1+")
+
+# Intents whose meaning hinges on one word; never matched by similarity
+PRICE_ACTION_INTENTS = ("price_increase", "price_decrease", "discount")
+
+
+def normalize_message(text):
+    """
+    Lowercase, drop punctuation and emoji, collapse repeated letters and spaces
+    """
+    text = _NON_WORD.sub(" ", str(text or "").lower())
+    text = _REPEATED.sub(r"\1", text.replace("_", " "))
+    return " ".join(text.split())
+
+
+def is_cacheable(text):
+    """
+    Only generic messages qualify: anything with a digit may carry a product
+    code or amount whose answer depends on it
+    """
+    return bool(text) and not _DIGIT.search(text)
+
+
+class ResponseCache:
+    """
+    LRU/TTL cache of (analysis, reply) pairs looked up by n-gram cosine similarity
+    """
+
+    def __init__(self, threshold=0.9, max_entries=512, ttl=3600, ngram=3, dimensions=2048):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.ngram = ngram
+        self.dimensions = dimensions
+        self._lock = threading.Lock()
+        self._matrix = None
+        # normalized message -> entry; order is least to most recently used
+        self._entries = OrderedDict()
+        self._row_keys = {}
+        # Rows holding a price action analysis, excluded from similarity hits
+        self._action_rows = set()
+        self._free_rows = list(range(max_entries - 1, -1, -1))
+        self.metrics = {"lookups": 0, "hits": 0, "misses": 0, "uncacheable": 0, "stores": 0, "evictions": 0}
+
+    def _vector(self, text):
+        import numpy as np
+
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        padded = f" {text} "
+        for i in range(max(1, len(padded) - self.ngram + 1)):
+            vector[zlib.crc32(padded[i:i + self.ngram].encode("utf-8")) % self.dimensions] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _ensure_matrix(self):
+        if self._matrix is None:
+            import numpy as np
+
+            self._matrix = np.zeros((self.max_entries, self.dimensions), dtype=np.float32)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        del self._row_keys[entry["row"]]
+        self._action_rows.discard(entry["row"])
+        self._matrix[entry["row"]] = 0
+        self._free_rows.append(entry["row"])
+
+    def _mark_action_row(self, entry):
+        if entry["analysis"].get("intent") in PRICE_ACTION_INTENTS:
+            self._action_rows.add(entry["row"])
+        else:
+            self._action_rows.discard(entry["row"])
+
+    def get(self, message):
+        """
+        Returns:
+            dict|None: {"analysis", "reply", "similarity"} for a hit
+        """
+        key = normalize_message(message)
+        with self._lock:
+            self.metrics["lookups"] += 1
+            if not is_cacheable(key):
+                self.metrics["uncacheable"] += 1
+                return None
+            if not self._entries:
+                self.metrics["misses"] += 1
+                return None
+
+            now = time.monotonic()
+            for stale in [k for k, e in self._entries.items() if now - e["stored_at"] > self.ttl]:
+                self._remove(stale)
+
+            entry, similarity = self._entries.get(key), 1.0
+            if entry is None and self._entries:
+                scores = self._matrix @ self._vector(key)
+                if self._action_rows:
+                    scores[list(self._action_rows)] = -1.0
+                row = int(scores.argmax())
+                similarity = float(scores[row])
+                if similarity >= self.threshold:
+                    entry = self._entries[self._row_keys[row]]
+            if entry is None:
+                self.metrics["misses"] += 1
+                return None
+
+            self._entries.move_to_end(entry["key"])
+            self.metrics["hits"] += 1
+        logging.info("Response cache hit (similarity %.2f) for %r via %r", similarity, key, entry["key"])
+        return {"analysis": dict(entry["analysis"]), "reply": entry["reply"], "similarity": similarity}
+
+    def put(self, message, analysis, reply=None):
+        """
+        Store or update the analysis and reply for a generic message
+        """
+        key = normalize_message(message)
+        if not is_cacheable(key) or analysis.get("product_id") or analysis.get("amount"):
+            return False
+        with self._lock:
+            self._ensure_matrix()
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.update(analysis=dict(analysis), reply=reply if reply is not None else entry["reply"])
+                self._mark_action_row(entry)
+                self._entries.move_to_end(key)
+                return True
+            if not self._free_rows:
+                self._remove(next(iter(self._entries)))
+                self.metrics["evictions"] += 1
+            row = self._free_rows.pop()
+            self._matrix[row] = self._vector(key)
+            self._row_keys[row] = key
+            self._entries[key] = {
+                "key": key,
+                "row": row,
+                "analysis": dict(analysis),
+                "reply": reply,
+                "stored_at": time.monotonic(),
+            }
+            self._mark_action_row(self._entries[key])
+            self.metrics["stores"] += 1
+        return True
+
+    def get_metrics(self):
+        with self._lock:
+            metrics = dict(self.metrics)
+            metrics["entries"] = len(self._entries)
+        checked = metrics["hits"] + metrics["misses"]
+        metrics["hit_rate"] = round(metrics["hits"] / checked, 3) if checked else 0.0
+        return metrics
+
+
+_cache = None
+
+
+def init_response_cache(app):
+    """
+    Create the cache when RESPONSE_CACHE_ENABLED is set
+    """
+    global _cache
+    if not app.config.get("RESPONSE_CACHE_ENABLED", True):
+        _cache = None
+        return None
+    _cache = ResponseCache(
+        threshold=app.config.get("RESPONSE_CACHE_THRESHOLD", 0.9),
+        max_entries=app.config.get("RESPONSE_CACHE_MAX_ENTRIES", 512),
+        ttl=app.config.get("RESPONSE_CACHE_TTL", 3600),
+    )
+    return _cache
+
+
+def get_response_cache():
+    return _cache
@@ -0,0 +1,200 @@
+"""
+Priority- and deadline-aware scheduling of supplier messages.
+
+Messages are classified with a cheap keyword check (no LLM) so that price
+mutations and cancellations run ahead of clarifications and chit-chat.
+Within a priority, the earliest deadline runs first. Each deadline comes
+from the WhatsApp message timestamp. Work that is already past its deadline
+gets a cheap reply instead of the LLM pipeline, or is dropped when the queue
+is under load. Priorities only apply across suppliers: one supplier's
+messages run one at a time and in arrival order, so a quick correction never
+overtakes (or races) the message it corrects.
+"""
+import itertools
+import logging
+import queue
+import re
+import threading
+import time
+from collections import deque
+
+PRIORITY_MUTATION = 0
+PRIORITY_CLARIFICATION = 1
+PRIORITY_OTHER = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_MUTATION: "mutation",
+    PRIORITY_CLARIFICATION: "clarification",
+    PRIORITY_OTHER: "other",
+}
+
+STALE_REPLY = "⌛ Sorry, we could not get to your earlier message in time. Please send it again if you still need help."
+
+_ACTION_WORDS = re.compile(
+    r"\b(barha|barhao|barhana|kam|increase|decrease|discount|cancel|cancellation|qeemat|qimat|price)\b",
+    re.IGNORECASE,
+)
+_NUMBER = re.compile(r"\d")
+
+
+def classify_priority(message_body):
+    """
+    Cheap intent guess: an action word plus a number (product code or
+    amount) is an actionable mutation or cancellation. An action word alone
+    needs clarification. Anything else is chit-chat.
+    """
+    text = message_body or ""
+    if _ACTION_WORDS.search(text):
+        return PRIORITY_MUTATION if _NUMBER.search(text) else PRIORITY_CLARIFICATION
+    return PRIORITY_OTHER
+
+
+class MessageScheduler:
+    """
+    Worker pool that pulls work by (priority, deadline), one message per
+    supplier at a time
+    """
+
+    def __init__(self, app, workers=4, max_queue=200, load_threshold=20, deadlines=None):
+        self.app = app
+        self.max_queue = max_queue
+        self.load_threshold = load_threshold
+        self.deadlines = deadlines or {
+            PRIORITY_MUTATION: 60,
+            PRIORITY_CLARIFICATION: 120,
+            PRIORITY_OTHER: 180,
+        }
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        # key -> items in arrival order; the head is queued or running, the
+        # rest wait for it to finish
+        self._lanes = {}
+        self._lanes_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self.metrics = {
+            "submitted": 0,
+            "processed": 0,
+            "stale_replied": 0,
+            "dropped": 0,
+            "queue_wait_ms_total": 0.0,
+        }
+        for index in range(workers):
+            threading.Thread(target=self._run, name=f"scheduler-{index}", daemon=True).start()
+
+    def _depth(self):
+        with self._lanes_lock:
+            waiting = sum(len(lane) - 1 for lane in self._lanes.values())
+        return self._queue.qsize() + waiting
+
+    def submit(self, fn, args=(), priority=PRIORITY_OTHER, timestamp=None, on_stale=None, key=None):
+        """
+        Queue fn(*args) with a deadline derived from the message timestamp.
+
+        Args:
+            fn (callable): The full (expensive) handler
+            args (tuple): Arguments for fn
+            priority (int): One of the PRIORITY_* constants
+            timestamp (str|float, optional): WhatsApp message timestamp in epoch seconds
+            on_stale (callable, optional): Cheap handler used once the deadline has passed
+            key (str, optional): Ordering key (the supplier's wa_id); work with
+                the same key runs one at a time, in submission order
+        """
+        try:
+            sent_at = float(timestamp) if timestamp else time.time()
+        except (TypeError, ValueError):
+            sent_at = time.time()
+        deadline = sent_at + self.deadlines.get(priority, self.deadlines[PRIORITY_OTHER])
+
+        self._count("submitted")
+        if self._depth() >= self.max_queue and priority == PRIORITY_OTHER:
+            logging.warning("Scheduler queue full, dropping low-priority message")
+            self._count("dropped")
+            return False
+
+        item = (priority, deadline, next(self._sequence), time.monotonic(), fn, args, on_stale, key)
+        if key is not None:
+            with self._lanes_lock:
+                lane = self._lanes.setdefault(key, deque())
+                lane.append(item)
+                if len(lane) > 1:
+                    # Queued once the supplier's earlier message is done
+                    return True
+        self._queue.put(item)
+        return True
+
+    def _release(self, key):
+        """
+        Hand the next message of a supplier to the priority queue
+        """
+        with self._lanes_lock:
+            lane = self._lanes[key]
+            lane.popleft()
+            if not lane:
+                del self._lanes[key]
+                return
+            self._queue.put(lane[0])
+
+    def _run(self):
+        while True:
+            priority, deadline, _, queued_at, fn, args, on_stale, key = self._queue.get()
+            with self._metrics_lock:
+                self.metrics["queue_wait_ms_total"] += (time.monotonic() - queued_at) * 1000
+            try:
+                with self.app.app_context():
+                    if time.time() <= deadline:
+                        fn(*args)
+                        self._count("processed")
+                    elif self._depth() >= self.load_threshold or on_stale is None:
+                        logging.info("Dropping stale %s message under load", PRIORITY_NAMES.get(priority))
+                        self._count("dropped")
+                    else:
+                        logging.info("Downgrading stale %s message to a cheap reply", PRIORITY_NAMES.get(priority))
+                        on_stale()
+                        self._count("stale_replied")
+            except Exception as e:
+                logging.error("Scheduled message handling failed: %s", e)
+            finally:
+                if key is not None:
+                    self._release(key)
+                self._queue.task_done()
+
+    def _count(self, name):
+        with self._metrics_lock:
+            self.metrics[name] += 1
+
+    def get_metrics(self):
+        with self._metrics_lock:
+            metrics = dict(self.metrics)
+        metrics["queue_depth"] = self._depth()
+        with self._lanes_lock:
+            metrics["suppliers_queued"] = len(self._lanes)
+        return metrics
+
+
+_scheduler = None
+
+
+def init_scheduler(app):
+    """
+    Start the scheduler when SCHEDULER_ENABLED is set
+    """
+    global _scheduler
+    if not app.config.get("SCHEDULER_ENABLED", False):
+        _scheduler = None
+        return None
+    _scheduler = MessageScheduler(
+        app,
+        workers=app.config.get("SCHEDULER_WORKERS", 4),
+        max_queue=app.config.get("SCHEDULER_MAX_QUEUE", 200),
+        load_threshold=app.config.get("SCHEDULER_LOAD_THRESHOLD", 20),
+        deadlines={
+            PRIORITY_MUTATION: app.config.get("SCHEDULER_DEADLINE_MUTATION", 60),
+            PRIORITY_CLARIFICATION: app.config.get("SCHEDULER_DEADLINE_CLARIFICATION", 120),
+            PRIORITY_OTHER: app.config.get("SCHEDULER_DEADLINE_OTHER", 180),
+        },
+    )
+    return _scheduler
+
+
+def get_scheduler():
+    return _scheduler
@@ -0,0 +1,151 @@
+"""
+Single-flight coalescing for duplicate requests.
+
+Concurrent calls with the same key share one execution of the underlying
+function, and the outcome is remembered for a short window so that re-sent
+messages and retries get the cached result instead of a new backend call.
+Keys can belong to a group (the product, for price keys). A successful call
+evicts the group's other cached results, since they no longer describe the
+current state.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls and caches outcomes per key
+    """
+
+    def __init__(self, expiry=60, results=None, should_cache=None, group_of=None):
+        self.expiry = expiry
+        # Predicate deciding whether an outcome may be replayed to repeats
+        self.should_cache = should_cache
+        # Maps a key to its group; None disables group eviction
+        self.group_of = group_of
+        # key -> (expires_at, result); may be a dict shared with the caller
+        self.results = results if results is not None else {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) once for key.
+
+        Returns:
+            tuple: (result, shared) where shared is True when the result came
+            from another in-flight call or from the cache
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            cached = self.results.get(key)
+            if cached is not None:
+                return cached[1], True
+
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+                if call.error is None and (
+                    self.should_cache is None or self.should_cache(call.result)
+                ):
+                    # A later mutation of the same product invalidates the rest
+                    if self.group_of is not None:
+                        self._forget_group(self.group_of(key))
+                    self.results[key] = (time.monotonic() + self.expiry, call.result)
+            call.done.set()
+
+        return call.result, False
+
+    def forget(self, key):
+        with self._lock:
+            self.results.pop(key, None)
+
+    def forget_group(self, group):
+        with self._lock:
+            self._forget_group(group)
+
+    def _forget_group(self, group):
+        for key in [k for k in self.results if self.group_of(k) == group]:
+            del self.results[key]
+
+    def _evict_expired(self, now):
+        expired = [key for key, (expires_at, _) in self.results.items() if expires_at <= now]
+        for key in expired:
+            del self.results[key]
+
+
+class KeyedLocks:
+    """
+    One lock per key, so checks and updates for the same product are atomic
+    without serialising unrelated products
+    """
+
+    def __init__(self):
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, key):
+        with self._lock:
+            lock = self._locks.get(key)
+            if lock is None:
+                lock = self._locks[key] = [threading.Lock(), 0]
+            lock[1] += 1
+        try:
+            with lock[0]:
+                yield
+        finally:
+            with self._lock:
+                lock[1] -= 1
+                if lock[1] == 0:
+                    self._locks.pop(key, None)
+
+
+def normalize_price_product(product_id):
+    return str(product_id).upper().strip() if product_id else product_id
+
+
+def make_price_key(product_id, operation, price):
+    """
+    Build a single-flight key for a price mutation
+    """
+    product = normalize_price_product(product_id)
+    try:
+        price = round(float(price), 2)
+    except (TypeError, ValueError):
+        logging.debug("Non-numeric price in single-flight key: %s", price)
+        price = str(price).strip()
+    return (product, operation, price)
+
+
+def price_key_product(key):
+    """
+    Group price keys by product
+    """
+    return key[0]
@@ -0,0 +1,373 @@
+"""
+Warm-restart snapshots of in-memory bot state.
+
+Conversation threads and processed message IDs are written periodically to
+a compact binary file per process, which is swapped in with an atomic rename.
+create_app() reloads and merges the files of every process, keeping the
+most recent copy of each conversation, and removes files nobody has written
+for longer than the message ID age. Snapshots are incremental. Each conversation is
+encoded once and its bytes are cached until it changes. Message IDs are
+appended in arrival order and dropped from the front once they are older
+than the maximum age or beyond the maximum count, which also removes them
+from the in-memory set. The number of conversations re-encoded per snapshot
+is capped to bound CPU cost.
+
+File layout (little-endian):
+    header:  magic "SBST", version u16, created f64, thread count u32, id count u32
+    thread:  wa_id (u16 length + utf-8), message count u16, then per message
+             role u8, timestamp f64, content (u32 length + utf-8)
+    ids:     per id, u16 length + utf-8, then seen at f64
+"""
+import atexit
+import glob
+import logging
+import os
+import re
+import socket
+import struct
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+_MAGIC = b"SBST"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHdII")
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+_MESSAGE = struct.Struct("<Bd")
+_F64 = struct.Struct("<d")
+_ROLES = {"user": 0, "assistant": 1, "system": 2}
+_ROLE_NAMES = {value: key for key, value in _ROLES.items()}
+
+
+def _encode_text(text, length_struct):
+    data = str(text).encode("utf-8")
+    if length_struct is _U16:
+        data = data[:0xFFFF]
+    return length_struct.pack(len(data)) + data
+
+
+def _encode_thread(wa_id, messages):
+    parts = [_encode_text(wa_id, _U16), _U16.pack(len(messages))]
+    for message in messages:
+        timestamp = message.get("timestamp")
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.timestamp()
+        parts.append(_MESSAGE.pack(_ROLES.get(message.get("role"), 0), float(timestamp or 0)))
+        parts.append(_encode_text(message.get("content") or "", _U32))
+    return b"".join(parts)
+
+
+def _encode_id(message_id, seen_at):
+    return _encode_text(message_id, _U16) + _F64.pack(seen_at)
+
+
+def _read_text(data, offset, length_struct):
+    (length,) = length_struct.unpack_from(data, offset)
+    offset += length_struct.size
+    return data[offset:offset + length].decode("utf-8"), offset + length
+
+
+def _read_snapshot(path):
+    """
+    Returns:
+        tuple: (threads, ids) where threads is a list of (wa_id, messages,
+        encoded bytes) and ids a list of (message_id, seen_at)
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, _, thread_count, id_count = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError("unknown snapshot format")
+
+    offset = _HEADER.size
+    threads = []
+    for _ in range(thread_count):
+        start = offset
+        wa_id, offset = _read_text(data, offset, _U16)
+        (message_count,) = _U16.unpack_from(data, offset)
+        offset += _U16.size
+        messages = []
+        for _ in range(message_count):
+            role, timestamp = _MESSAGE.unpack_from(data, offset)
+            offset += _MESSAGE.size
+            content, offset = _read_text(data, offset, _U32)
+            messages.append({
+                "role": _ROLE_NAMES.get(role, "user"),
+                "content": content,
+                "timestamp": datetime.fromtimestamp(timestamp),
+            })
+        threads.append((wa_id, messages, data[start:offset]))
+
+    ids = []
+    for _ in range(id_count):
+        message_id, offset = _read_text(data, offset, _U16)
+        (seen_at,) = _F64.unpack_from(data, offset)
+        offset += _F64.size
+        ids.append((message_id, seen_at))
+    return threads, ids
+
+
+def _last_activity(messages):
+    return max((m["timestamp"] for m in messages), default=datetime.min)
+
+
+def _default_namespace():
+    return re.sub(r"[^A-Za-z0-9.]+", "_", f"{socket.gethostname()}.{os.getpid()}")
+
+
+class StateSnapshotter:
+    """
+    Periodic, incremental snapshots of conversation threads and processed IDs
+    """
+
+    def __init__(self, path, threads, message_ids, interval=30, max_dirty_per_snapshot=500,
+                 max_id_age=7 * 24 * 3600, max_ids=100_000, namespace=None):
+        # path names the snapshot family: "state.snapshot" is written by this
+        # process as "state.<namespace>.snapshot"
+        self.base_path = path
+        root, ext = os.path.splitext(path)
+        self.path = f"{root}.{namespace or _default_namespace()}{ext}"
+        self.threads = threads
+        self.message_ids = message_ids
+        self.interval = interval
+        self.max_dirty_per_snapshot = max_dirty_per_snapshot
+        self.max_id_age = max_id_age
+        self.max_ids = max_ids
+
+        self._thread_blobs = {}
+        self._dirty = set()
+        self._encoded_ids = bytearray()
+        # (seen_at, encoded length, message_id) in the order of _encoded_ids
+        self._id_entries = deque()
+        self._pending_ids = []
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.metrics = {
+            "snapshots_written": 0,
+            "last_size_bytes": 0,
+            "last_duration_ms": 0.0,
+            "last_threads_encoded": 0,
+            "dirty_threads": 0,
+            "last_load_ms": 0.0,
+            "message_ids": 0,
+            "message_ids_expired": 0,
+        }
+
+    def mark_thread_dirty(self, wa_id):
+        with self._lock:
+            self._dirty.add(wa_id)
+
+    def note_message_id(self, message_id):
+        with self._lock:
+            self._pending_ids.append((message_id, time.time()))
+
+    def _append_id(self, message_id, seen_at):
+        encoded = _encode_id(message_id, seen_at)
+        self._encoded_ids += encoded
+        self._id_entries.append((seen_at, len(encoded), message_id))
+
+    def _ids_expiring(self, now):
+        return bool(self._id_entries) and (
+            len(self._id_entries) > self.max_ids or self._id_entries[0][0] < now - self.max_id_age
+        )
+
+    def _expire_ids(self, now):
+        """
+        Drop the oldest message IDs past the age or count limit, from both
+        the encoded bytes and the in-memory set
+        """
+        dropped_bytes = 0
+        expired = 0
+        while self._ids_expiring(now):
+            _, length, message_id = self._id_entries.popleft()
+            dropped_bytes += length
+            expired += 1
+            self.message_ids.discard(message_id)
+        if dropped_bytes:
+            del self._encoded_ids[:dropped_bytes]
+            self.metrics["message_ids_expired"] += expired
+        return expired
+
+    def _snapshot_paths(self):
+        root, ext = os.path.splitext(self.base_path)
+        return sorted(glob.glob(f"{glob.escape(root)}.*{ext}"))
+
+    def load(self):
+        """
+        Restore threads and message IDs from the snapshot files of every
+        process, if present. The decoded bytes also seed the encoding cache,
+        so the next snapshot of this process carries the merged state.
+        """
+        paths = self._snapshot_paths()
+        if not paths:
+            return False
+        started = time.perf_counter()
+        cutoff = time.time() - self.max_id_age
+        threads = {}
+        seen = {}
+        files = 0
+        for path in paths:
+            try:
+                if path != self.path and os.path.getmtime(path) < cutoff:
+                    # Left by a process that is long gone
+                    os.remove(path)
+                    continue
+                file_threads, file_ids = _read_snapshot(path)
+            except (OSError, ValueError, struct.error, UnicodeDecodeError) as e:
+                logging.error("Failed to load state snapshot %s: %s", path, e)
+                continue
+            files += 1
+            for wa_id, messages, blob in file_threads:
+                # Any worker may have served a supplier; keep the latest copy
+                current = threads.get(wa_id)
+                if current is None or _last_activity(messages) > _last_activity(current[0]):
+                    threads[wa_id] = (messages, blob)
+            for message_id, seen_at in file_ids:
+                seen[message_id] = max(seen_at, seen.get(message_id, seen_at))
+        if not files:
+            return False
+
+        for wa_id, (messages, blob) in threads.items():
+            self.threads[wa_id] = messages
+            self._thread_blobs[wa_id] = blob
+        for message_id, seen_at in sorted(seen.items(), key=lambda item: item[1]):
+            self.message_ids.add(message_id)
+            self._append_id(message_id, seen_at)
+        self._expire_ids(time.time())
+
+        self.metrics["last_load_ms"] = (time.perf_counter() - started) * 1000
+        self.metrics["message_ids"] = len(self._id_entries)
+        logging.info(
+            "Restored %s conversations and %s message IDs from %s snapshot file(s) in %.1f ms",
+            len(threads), len(self._id_entries), files, self.metrics["last_load_ms"],
+        )
+        return True
+
+    def snapshot(self):
+        """
+        Write a snapshot if anything changed since the last one
+        """
+        with self._snapshot_lock:
+            now = time.time()
+            with self._lock:
+                if not self._dirty and not self._pending_ids and not self._ids_expiring(now):
+                    return False
+                dirty = list(self._dirty)[:self.max_dirty_per_snapshot]
+                self._dirty.difference_update(dirty)
+                pending_ids, self._pending_ids = self._pending_ids, []
+
+            started = time.perf_counter()
+            for wa_id in dirty:
+                messages = self.threads.get(wa_id)
+                if messages is None:
+                    self._thread_blobs.pop(wa_id, None)
+                else:
+                    self._thread_blobs[wa_id] = _encode_thread(wa_id, list(messages))
+
+            for message_id, seen_at in pending_ids:
+                self._append_id(message_id, seen_at)
+            self._expire_ids(now)
+
+            blobs = list(self._thread_blobs.values())
+            header = _HEADER.pack(_MAGIC, _VERSION, now, len(blobs), len(self._id_entries))
+            temp_path = None
+            try:
+                directory = os.path.dirname(self.path) or "."
+                os.makedirs(directory, exist_ok=True)
+                fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(self.path) + ".", suffix=".tmp", dir=directory)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(header)
+                    f.write(b"".join(blobs))
+                    f.write(self._encoded_ids)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                if temp_path is not None:
+                    try:
+                        os.remove(temp_path)
+                    except OSError:
+                        pass
+                logging.error("Failed to write state snapshot %s: %s", self.path, e)
+                with self._lock:
+                    self._dirty.update(dirty)
+                return False
+
+            size = len(header) + sum(len(blob) for blob in blobs) + len(self._encoded_ids)
+            with self._lock:
+                dirty_left = len(self._dirty)
+            self.metrics.update({
+                "snapshots_written": self.metrics["snapshots_written"] + 1,
+                "last_size_bytes": size,
+                "last_duration_ms": (time.perf_counter() - started) * 1000,
+                "last_threads_encoded": len(dirty),
+                "dirty_threads": dirty_left,
+                "message_ids": len(self._id_entries),
+            })
+            logging.debug(
+                "State snapshot: %s bytes, %s conversations re-encoded, %.1f ms",
+                size, len(dirty), self.metrics["last_duration_ms"],
+            )
+            return True
+
+    def start(self):
+        threading.Thread(target=self._run, name="state-snapshot", daemon=True).start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.snapshot()
+            except Exception as e:
+                logging.error("State snapshot failed: %s", e)
+
+    def stop(self):
+        self._stop.set()
+        # Final snapshot without the per-run cap
+        self.max_dirty_per_snapshot = None
+        self.snapshot()
+
+    def get_metrics(self):
+        return dict(self.metrics)
+
+
+_snapshotter = None
+
+
+def init_state_snapshots(app, threads, message_ids):
+    """
+    Restore state from the last snapshot and start periodic snapshots
+    """
+    global _snapshotter
+    if not app.config.get("SNAPSHOT_ENABLED", True):
+        return None
+    _snapshotter = StateSnapshotter(
+        app.config.get("SNAPSHOT_PATH") or os.path.join(app.instance_path, "state.snapshot"),
+        threads,
+        message_ids,
+        interval=app.config.get("SNAPSHOT_INTERVAL", 30),
+        max_dirty_per_snapshot=app.config.get("SNAPSHOT_MAX_DIRTY", 500),
+        max_id_age=app.config.get("SNAPSHOT_MESSAGE_ID_MAX_AGE", 7 * 24 * 3600),
+        max_ids=app.config.get("SNAPSHOT_MAX_MESSAGE_IDS", 100_000),
+    )
+    _snapshotter.load()
+    _snapshotter.start()
+    return _snapshotter
+
+
+def get_state_snapshotter():
+    return _snapshotter
+
+
+def mark_thread_dirty(wa_id):
+    if _snapshotter is not None:
+        _snapshotter.mark_thread_dirty(wa_id)
+
+
+def note_message_id(message_id):
+    if _snapshotter is not None:
+        _snapshotter.note_message_id(message_id)
@@ -4,21 +4,50 @@ import json
 import requests
 import re
 import time
+from collections import namedtuple
 from datetime import datetime, timedelta
-from .openai_utils import call_openai_chat
 from .query_identifier_agent import QueryIdentifierAgent
 from .price_management_agent import PriceManagementAgent
 from .output_agent import OutputAgent
+from .single_flight import SingleFlight, make_price_key, price_key_product, normalize_price_product
+from .product_catalogue import check_product_code, format_product_code_rejection
+from .admission import get_admission_controller, SHED_REPLY
+from .scheduler import get_scheduler, classify_priority, STALE_REPLY, PRIORITY_MUTATION
+from .state_snapshot import mark_thread_dirty, note_message_id
+from .llm_usage import usage_context, set_usage_intent, supplier_over_budget
+from .response_cache import get_response_cache
+from .read_receipts import message_accepted, reply_sent
 
 # Dictionary to track recent function calls to prevent duplicates
 _recent_function_calls = {}
 # How long to remember a function call (in seconds)
 _function_call_expiry = 60  
 
+def _is_successful_price_response(response):
+    if isinstance(response, dict):
+        return response.get("success", False)
+    return not str(response).startswith("Error")
+
+# Coalesces identical price mutations (re-sent messages, retries, two staff
+# members) into one backend call and replays the outcome within the expiry
+_price_calls = SingleFlight(
+    expiry=_function_call_expiry,
+    results=_recent_function_calls,
+    should_cache=_is_successful_price_response,
+    group_of=price_key_product,
+)
+
+def forget_price_results(product_id):
+    """
+    Stop replaying cached outcomes for a product, e.g. after its queued
+    write failed
+    """
+    _price_calls.forget_group(normalize_price_product(product_id))
+
 def log_http_response(response):
-    logging.info(f"Status: {response.status_code}")
-    logging.info(f"Content-type: {response.headers.get('content-type')}")
-    logging.info(f"Body: {response.text}")
+    logging.info("Status: %s", response.status_code)
+    logging.debug("Content-type: %s", response.headers.get('content-type'))
+    logging.debug("Body: %s", response.text)
 
 def get_text_message_input(recipient, text):
     return json.dumps(
@@ -48,12 +77,63 @@ def send_message(data):
         logging.error("Timeout occurred while sending message")
         return jsonify({"status": "error", "message": "Request timed out"}), 408
     except requests.RequestException as e:
-        logging.error(f"Request failed due to: {e}")
+        logging.error("Request failed due to: %s", e)
         return jsonify({"status": "error", "message": "Failed to send message"}), 500
     else:
         log_http_response(response)
         return response
 
+def get_interactive_buttons_input(recipient, text, buttons):
+    """
+    Build a reply-button message. buttons is a list of (id, title) pairs;
+    WhatsApp allows up to 3 buttons with titles of up to 20 characters.
+    """
+    return json.dumps(
+        {
+            "messaging_product": "whatsapp",
+            "recipient_type": "individual",
+            "to": recipient,
+            "type": "interactive",
+            "interactive": {
+                "type": "button",
+                "body": {"text": text[:1024]},
+                "action": {
+                    "buttons": [
+                        {"type": "reply", "reply": {"id": button_id, "title": title[:20]}}
+                        for button_id, title in buttons[:3]
+                    ]
+                },
+            },
+        }
+    )
+
+def get_interactive_list_input(recipient, text, button, rows, section_title="Products"):
+    """
+    Build a list message. rows is a list of (id, title) pairs; WhatsApp allows
+    up to 10 rows with titles of up to 24 characters.
+    """
+    return json.dumps(
+        {
+            "messaging_product": "whatsapp",
+            "recipient_type": "individual",
+            "to": recipient,
+            "type": "interactive",
+            "interactive": {
+                "type": "list",
+                "body": {"text": text[:1024]},
+                "action": {
+                    "button": button[:20],
+                    "sections": [
+                        {
+                            "title": section_title[:24],
+                            "rows": [{"id": row_id, "title": title[:24]} for row_id, title in rows[:10]],
+                        }
+                    ],
+                },
+            },
+        }
+    )
+
 def process_text_for_whatsapp(text):
     # Remove brackets
     pattern = r"\【.*?\】"
@@ -83,6 +163,7 @@ def is_message_processed(message_id):
     if message_id in processed_message_ids:
         return True
     processed_message_ids.add(message_id)
+    note_message_id(message_id)
     return False
 
 def get_conversation_history(wa_id, limit=10):
@@ -111,45 +192,286 @@ def add_to_conversation_history(wa_id, role, content):
     if len(user_conversation_threads[wa_id]) > 50:
         user_conversation_threads[wa_id] = user_conversation_threads[wa_id][-50:]
 
+    mark_thread_dirty(wa_id)
+
+# A reply sent as an interactive message; text is what goes into history
+InteractiveReply = namedtuple("InteractiveReply", ["text", "data"])
+
+PRICE_INTENTS = ["price_increase", "price_decrease", "discount"]
+INTENT_TITLES = {
+    "price_increase": "Increase price",
+    "price_decrease": "Decrease price",
+    "discount": "Discount",
+}
+
+# Partially filled requests per supplier, completed by interactive replies
+_pending_requests = {}
+_PENDING_EXPIRY = 15 * 60
+# Product codes each supplier recently changed, offered as list options
+_recent_products = {}
+_AMOUNT_ONLY_PATTERN = re.compile(r"^\s*(?:rs\.?|pkr)?\s*(\d+(?:\.\d+)?)\s*%?\s*$", re.IGNORECASE)
+# A single token with both letters and digits, e.g. "MZ123"
+_PRODUCT_CODE_ONLY_PATTERN = re.compile(r"^\s*(?=[\w-]*[A-Za-z])(?=[\w-]*\d)([A-Za-z0-9][\w-]*)\s*$")
+
+def interactive_messages_enabled():
+    return current_app.config.get("INTERACTIVE_MESSAGES_ENABLED", True)
+
+def remember_recent_product(wa_id, product_id):
+    products = _recent_products.setdefault(wa_id, [])
+    if product_id in products:
+        products.remove(product_id)
+    products.insert(0, product_id)
+    del products[10:]
+
+def get_pending_request(wa_id):
+    pending = _pending_requests.get(wa_id)
+    if pending and time.time() - pending["updated"] > _PENDING_EXPIRY:
+        _pending_requests.pop(wa_id, None)
+        return None
+    return pending
+
+def message_priority(wa_id, message_body):
+    """
+    Scheduling priority of a free-text message. While a price request is
+    waiting for a slot, a bare reply such as "Rs 450" or "MZ123" completes
+    that mutation, so it runs as one.
+    """
+    if has_pending_slots(get_pending_request(wa_id)):
+        return PRIORITY_MUTATION
+    return classify_priority(message_body)
+
+def match_pending_product(wa_id, message_body):
+    """
+    The product code named by a bare reply to "Which product?": one of the
+    listed recent products, or a code the catalogue knows. None otherwise.
+    """
+    match = _PRODUCT_CODE_ONLY_PATTERN.match(message_body or "")
+    if not match:
+        return None
+    code = match.group(1).upper()
+    for option in _recent_products.get(wa_id, []):
+        if option.upper() == code:
+            return option
+    check = check_product_code(code, wa_id=wa_id)
+    return check["code"] if check["status"] == "ok" else None
+
+def has_pending_slots(pending):
+    """
+    True if a pending request holds anything a later message could complete
+    """
+    return bool(pending) and any(pending.get(slot) for slot in ("intent", "product_id", "amount"))
+
+def update_pending_request(wa_id, **slots):
+    pending = get_pending_request(wa_id) or {"intent": None, "product_id": None, "amount": None}
+    for slot, value in slots.items():
+        if value:
+            pending[slot] = value
+    pending["updated"] = time.time()
+    _pending_requests[wa_id] = pending
+    return pending
+
+def build_clarification_reply(wa_id, slots):
+    """
+    Ask for the next missing slot without an LLM call: intent buttons, a list
+    of recently edited products, or a plain prompt for the amount
+    """
+    if slots.get("intent") not in PRICE_INTENTS:
+        text = "What would you like to do?"
+        return InteractiveReply(text, get_interactive_buttons_input(
+            wa_id, text, [(f"intent:{intent}", title) for intent, title in INTENT_TITLES.items()]
+        ))
+
+    action = INTENT_TITLES[slots["intent"]].lower()
+    if not slots.get("product_id"):
+        products = _recent_products.get(wa_id)
+        if not products:
+            return f"Please send the product code you want to {action} for."
+        text = "Which product? Pick one below or send the product code."
+        return InteractiveReply(text, get_interactive_list_input(
+            wa_id, text, "Choose product", [(f"product:{code}", code) for code in products]
+        ))
+
+    if not slots.get("amount"):
+        noun = "discounted price" if slots["intent"] == "discount" else "new price"
+        return f"Please send the {noun} for product `{slots['product_id']}`."
+    return None
+
+def format_price_result(api_response):
+    """
+    Template reply for a price agent result, used where no LLM is involved
+    """
+    if isinstance(api_response, dict):
+        prefix = "✅" if api_response.get("success") else "❌"
+        return f"{prefix} {api_response.get('message', 'Request processed.')}"
+    return str(api_response)
+
+def execute_price_request(wa_id, intent, product_id, amount):
+    """
+    Validate the product code locally and run the price agent through the
+    single-flight layer.
+
+    Returns:
+        tuple: (api_response, rejection) where rejection is a reply text if
+        the product code was rejected before any backend call
+    """
+    check = check_product_code(product_id, wa_id=wa_id)
+    if check["status"] in ("unknown", "not_owned"):
+        logging.info("Product code %s rejected by catalogue: %s", check["code"], check["status"])
+        return None, format_product_code_rejection(check)
+    if check["status"] == "ok":
+        # The backend expects the code exactly as written in the sheet
+        product_id = check["code"]
+
+    api_response, shared = _price_calls.do(
+        make_price_key(product_id, intent, amount),
+        PriceManagementAgent().process_request,
+        intent,
+        product_id,
+        amount,
+        wa_id
+    )
+    if shared:
+        logging.info("Reused in-flight/recent result for %s on %s", intent, product_id)
+    _pending_requests.pop(wa_id, None)
+    remember_recent_product(wa_id, product_id)
+    return api_response, None
+
+def _complete_pending_request(wa_id, slots):
+    if not (slots.get("intent") in PRICE_INTENTS and slots.get("product_id") and slots.get("amount")):
+        return build_clarification_reply(wa_id, slots)
+    api_response, rejection = execute_price_request(
+        wa_id, slots["intent"], slots["product_id"], slots["amount"]
+    )
+    return rejection or format_price_result(api_response)
+
+def handle_interactive_reply(wa_id, reply_id, title):
+    """
+    Fill the pending request from a structured button/list payload and
+    process it directly once complete, with no LLM involved
+    """
+    add_to_conversation_history(wa_id, "user", title or reply_id)
+    kind, _, value = (reply_id or "").partition(":")
+    if kind == "intent" and value in PRICE_INTENTS:
+        slots = update_pending_request(wa_id, intent=value)
+    elif kind == "product" and value:
+        slots = update_pending_request(wa_id, product_id=value.upper())
+    else:
+        logging.warning("Unknown interactive reply id: %s", reply_id)
+        slots = update_pending_request(wa_id)
+
+    reply = _complete_pending_request(wa_id, slots)
+    add_to_conversation_history(wa_id, "assistant", reply.text if isinstance(reply, InteractiveReply) else reply)
+    return reply
+
 def generate_response(message_body, wa_id=None, name=None):
     """
     Generate a response using the multi-agent system
     """
+    # Attribute LLM token usage in this request to the supplier
+    with usage_context(wa_id):
+        return _generate_response(message_body, wa_id, name)
+
+def _generate_response(message_body, wa_id=None, name=None):
     try:
         # Add user message to conversation history
         add_to_conversation_history(wa_id, "user", message_body)
         
+        # A bare amount completes a pending request without an LLM call
+        pending = get_pending_request(wa_id)
+        amount_match = _AMOUNT_ONLY_PATTERN.match(message_body or "")
+        if pending and pending.get("intent") and pending.get("product_id") and amount_match:
+            slots = update_pending_request(wa_id, amount=amount_match.group(1))
+            final_response = _complete_pending_request(wa_id, slots)
+            add_to_conversation_history(wa_id, "assistant", final_response)
+            return final_response
+
+        # So does a bare product code while the request waits for the product
+        if pending and pending.get("intent") in PRICE_INTENTS and not pending.get("product_id"):
+            product_id = match_pending_product(wa_id, message_body)
+            if product_id:
+                slots = update_pending_request(wa_id, product_id=product_id)
+                final_response = _complete_pending_request(wa_id, slots)
+                add_to_conversation_history(
+                    wa_id, "assistant",
+                    final_response.text if isinstance(final_response, InteractiveReply) else final_response,
+                )
+                return final_response
+
         # Get conversation history for context
         conversation_history = get_conversation_history(wa_id)
         
         # Initialize agents
         query_agent = QueryIdentifierAgent()
-        price_agent = PriceManagementAgent()
         output_agent = OutputAgent()
         
+        # Generic messages (no product code or amount) reuse the analysis and
+        # reply of a near-identical earlier message. Skipped mid-request, where
+        # the answer depends on the pending slots. The empty request left by
+        # an interactive "What would you like to do?" reply does not count.
+        response_cache = get_response_cache() if not has_pending_slots(pending) else None
+        cached = response_cache.get(message_body) if response_cache is not None else None
+
         # Step 1: Analyze the query
-        logging.info("Step 1: Analyzing query with Query Identifier Agent")
-        query_analysis = query_agent.analyze_query(message_body, conversation_history)
-        logging.info(f"Query analysis result: {query_analysis}")
+        if cached:
+            logging.info("Step 1: Reusing cached query analysis")
+            query_analysis = cached["analysis"]
+        else:
+            logging.info("Step 1: Analyzing query with Query Identifier Agent")
+            query_analysis = query_agent.analyze_query(message_body, conversation_history)
+            if response_cache is not None and query_analysis.get("confidence") != "low":
+                response_cache.put(message_body, query_analysis)
+        logging.info("Query analysis result: %s", query_analysis)
+        set_usage_intent(query_analysis.get("intent"))
         
         # Step 2: Process the request if clear, otherwise ask for clarification
-        if query_analysis.get("intent") in ["price_increase", "price_decrease", "discount"] and \
+        if query_analysis.get("intent") in PRICE_INTENTS and \
            query_analysis.get("product_id") and query_analysis.get("amount"):
             
             logging.info("Step 2: Processing request with Price Management Agent")
-            api_response = price_agent.process_request(
+            # Unknown or foreign product codes are rejected locally, before any remote call
+            api_response, rejection = execute_price_request(
+                wa_id,
                 query_analysis["intent"],
                 query_analysis["product_id"],
                 query_analysis["amount"]
             )
-            logging.info(f"Price agent response: {api_response}")
+            if rejection:
+                add_to_conversation_history(wa_id, "assistant", rejection)
+                return rejection
+            logging.info("Price agent response: %s", api_response)
         else:
             api_response = None
             logging.info("Step 2: Skipped - clarification needed")
+
+            # Ask for the missing slots with buttons/lists instead of an LLM reply
+            if interactive_messages_enabled():
+                if query_analysis.get("product_id"):
+                    check = check_product_code(query_analysis["product_id"], wa_id=wa_id)
+                    if check["status"] in ("unknown", "not_owned"):
+                        rejection = format_product_code_rejection(check)
+                        add_to_conversation_history(wa_id, "assistant", rejection)
+                        return rejection
+                slots = update_pending_request(
+                    wa_id,
+                    intent=query_analysis.get("intent") if query_analysis.get("intent") in PRICE_INTENTS else None,
+                    product_id=query_analysis.get("product_id"),
+                    amount=query_analysis.get("amount"),
+                )
+                # Slots carried over from earlier turns may already complete it
+                reply = _complete_pending_request(wa_id, slots)
+                add_to_conversation_history(wa_id, "assistant", reply.text if isinstance(reply, InteractiveReply) else reply)
+                return reply
         
         # Step 3: Format the response
-        logging.info("Step 3: Formatting response with Output Agent")
-        final_response = output_agent.format_response(api_response, query_analysis, message_body)
+        if cached and cached["reply"] and api_response is None:
+            logging.info("Step 3: Reusing cached reply")
+            final_response = cached["reply"]
+        else:
+            logging.info("Step 3: Formatting response with Output Agent")
+            final_response = output_agent.format_response(api_response, query_analysis, message_body)
+            # Template replies for over-budget suppliers are not shared
+            if response_cache is not None and api_response is None and not supplier_over_budget():
+                response_cache.put(message_body, query_analysis, final_response)
         
         # Add assistant response to conversation history
         add_to_conversation_history(wa_id, "assistant", final_response)
@@ -157,7 +479,7 @@ def generate_response(message_body, wa_id=None, name=None):
         return final_response
         
     except Exception as e:
-        logging.error(f"Error in multi-agent response generation: {e}")
+        logging.error("Error in multi-agent response generation: %s", e)
         return "There was some problem while processing your request. Kindly try again."
 
 def process_whatsapp_message(body):
@@ -166,19 +488,86 @@ def process_whatsapp_message(body):
     
     # Skip if message already processed
     if is_message_processed(message_id):
-        logging.info(f"Skipping already processed message: {message_id}")
+        logging.info("Skipping already processed message: %s", message_id)
         return
         
     wa_id = body["entry"][0]["changes"][0]["value"]["contacts"][0]["wa_id"]
     name = body["entry"][0]["changes"][0]["value"]["contacts"][0]["profile"]["name"]
-    message_body = message["text"]["body"]
 
+    reply_id = None
+    if message.get("type") == "interactive":
+        interactive = message.get("interactive", {})
+        reply = interactive.get(interactive.get("type"), {})
+        reply_id = reply.get("id")
+        message_body = reply.get("title") or reply_id or ""
+    elif "text" in message:
+        message_body = message["text"]["body"]
+    else:
+        logging.info("Ignoring unsupported message type: %s", message.get("type"))
+        return
+
+    # Shed the message before any LLM or Apps Script work if over the limits
+    admission = get_admission_controller()
+    if admission is not None and not admission.admit(wa_id):
+        if admission.should_send_shed_reply(wa_id):
+            send_message(get_text_message_input(wa_id, SHED_REPLY))
+        return
+
+    # Read receipt and typing indicator go out now, without waiting, so the
+    # supplier sees a response before the agents run
+    message_accepted(wa_id, message_id)
+
+    if reply_id:
+        # Structured replies skip the LLM entirely and fill a pending request
+        handler, args, priority = respond_to_interactive, (wa_id, reply_id, message_body, message_id), PRIORITY_MUTATION
+    else:
+        handler, args, priority = (
+            respond_to_message, (wa_id, name, message_body, message_id), message_priority(wa_id, message_body)
+        )
+
+    scheduler = get_scheduler()
+    if scheduler is None:
+        handler(*args)
+        return
+
+    # Actionable work first; stale redeliveries get a cheap reply or are dropped
+    scheduler.submit(
+        handler,
+        args=args,
+        priority=priority,
+        timestamp=message.get("timestamp"),
+        on_stale=lambda: send_reply(wa_id, STALE_REPLY, message_id),
+        key=wa_id,
+    )
+
+def respond_to_message(wa_id, name, message_body, message_id=None):
+    """
+    Run the multi-agent pipeline for one message and send the reply
+    """
     # Generate response using the multi-agent system
     response = generate_response(message_body, wa_id, name)
-    response = process_text_for_whatsapp(response)
+    send_reply(wa_id, response, message_id)
 
-    data = get_text_message_input(wa_id, response)
-    send_message(data)
+def respond_to_interactive(wa_id, reply_id, title, message_id=None):
+    """
+    Handle a button/list reply and send the next prompt or the result
+    """
+    try:
+        response = handle_interactive_reply(wa_id, reply_id, title)
+    except Exception as e:
+        logging.error("Error handling interactive reply: %s", e)
+        response = "There was some problem while processing your request. Kindly try again."
+    send_reply(wa_id, response, message_id)
+
+def send_reply(wa_id, response, message_id=None):
+    if isinstance(response, InteractiveReply):
+        result = send_message(response.data)
+    else:
+        response = process_text_for_whatsapp(response)
+        data = get_text_message_input(wa_id, response)
+        result = send_message(data)
+    # send_message returns an error tuple instead of raising
+    reply_sent(message_id, ok=isinstance(result, requests.Response))
 
 def is_valid_whatsapp_message(body):
     """
@@ -0,0 +1,385 @@
+"""
+Write-behind queue for Apps Script price writes.
+
+Validated price changes are appended to a journal file (one fsync per write)
+and acknowledged to the supplier straight away. Each process has its own
+journal and holds an flock on its lock file while it runs. On startup a
+process replays its own journal and adopts the journals of processes that
+are gone (their lock is free), so queued writes survive a restart without
+being posted once per worker. A background thread flushes
+them to the Apps Script web apps every flush interval. Writes are coalesced
+per product code, and the last write wins. The price history records a
+write as applied only once it reaches the sheet. Failed writes are retried
+with backoff. After the final attempt the write is dropped, its local
+effects (weekly increase entry, cached replies) are undone, and the supplier
+gets a follow-up notice.
+"""
+import atexit
+import fcntl
+import glob
+import itertools
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+
+import requests
+
+FAILURE_NOTICE = (
+    "❌ Sorry, the price change for product `{product_id}` could not be saved. "
+    "Please send the request again."
+)
+
+
+def _default_namespace():
+    return re.sub(r"[^A-Za-z0-9.]+", "_", f"{socket.gethostname()}.{os.getpid()}")
+
+
+class PriceWriteQueue:
+    """
+    Durable, coalescing queue of Apps Script POST payloads
+    """
+
+    def __init__(self, journal_path, flush_interval=2.0, max_attempts=5,
+                 on_success=None, on_failure=None, timeout=30, namespace=None):
+        # journal_path names the journal family: "price_writes.journal" is
+        # written by this process as "price_writes.<namespace>.journal"
+        self.base_path = journal_path
+        root, ext = os.path.splitext(journal_path)
+        self.journal_path = f"{root}.{namespace or _default_namespace()}{ext}"
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._lock_file = None
+        self.on_success = on_success
+        self.on_failure = on_failure
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        # (url, product_id) -> entry; newer writes replace older ones
+        self._pending = {}
+        self._sequence = itertools.count(1)
+        self.metrics = {"queued": 0, "coalesced": 0, "written": 0, "retries": 0, "failed": 0, "posts": 0}
+
+    def _append_journal(self, entry):
+        os.makedirs(os.path.dirname(self.journal_path) or ".", exist_ok=True)
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite_journal(self):
+        # Caller holds self._lock
+        temp_path = self.journal_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for entry in self._pending.values():
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.journal_path)
+
+    @staticmethod
+    def _read_journal(path):
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # A torn final line from a crash mid-append
+                continue
+        return entries
+
+    @staticmethod
+    def _try_lock(path):
+        """
+        Open and flock path without blocking. Returns the open file, or None
+        if another live process holds the lock.
+        """
+        f = open(path, "a")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return None
+        return f
+
+    def _claim(self):
+        """
+        Lock this process's journal for as long as the process lives
+        """
+        if self._lock_file is None:
+            os.makedirs(os.path.dirname(self.journal_path) or ".", exist_ok=True)
+            self._lock_file = self._try_lock(self.journal_path + ".lock")
+            if self._lock_file is None:
+                raise RuntimeError(f"Price write journal {self.journal_path} is in use by another process")
+
+    def replay(self):
+        """
+        Reload writes that were queued but not flushed before the last exit:
+        this process's journal plus the journals of processes that are gone
+        """
+        self._claim()
+        root, ext = os.path.splitext(self.base_path)
+        adopted = []
+        entries = []
+        for path in sorted(glob.glob(f"{glob.escape(root)}.*{ext}")):
+            if path == self.journal_path:
+                entries.extend(self._read_journal(path))
+                continue
+            lock = self._try_lock(path + ".lock")
+            if lock is None:
+                # Its process is still running and flushing it
+                continue
+            try:
+                entries.extend(self._read_journal(path))
+            except OSError as e:
+                lock.close()
+                logging.error("Failed to read price write journal %s: %s", path, e)
+                continue
+            adopted.append((path, lock))
+
+        with self._lock:
+            # Sequence numbers are per process, so the newest queued write wins
+            for entry in sorted(entries, key=lambda e: e.get("queued_at", 0)):
+                entry["seq"] = next(self._sequence)
+                self._pending[(entry["url"], entry["product_id"])] = entry
+            count = len(self._pending)
+            # Durable in this process's journal before the others are removed
+            self._rewrite_journal()
+
+        for path, lock in adopted:
+            os.remove(path)
+            os.remove(lock.name)
+            lock.close()
+        if count:
+            logging.info("Replayed %s queued price writes into %s", count, self.journal_path)
+            self._wakeup.set()
+        return count
+
+    def enqueue(self, url, product_id, payload, supplier=None, operation=None,
+                old_price=None, new_price=None, increase_logged_at=None):
+        """
+        Durably queue a POST payload. Returns once it is in the journal.
+
+        Args:
+            supplier (str, optional): wa_id of the requesting supplier, notified on failure
+            increase_logged_at (str, optional): weekly-increase log entry made for this write
+        """
+        with self._lock:
+            entry = {
+                "seq": next(self._sequence),
+                "url": url,
+                "product_id": str(product_id),
+                "payload": payload,
+                "supplier": supplier,
+                "operation": operation,
+                "old_price": old_price,
+                "new_price": new_price,
+                "increase_logged_at": increase_logged_at,
+                "attempts": 0,
+                "next_attempt": 0,
+                "queued_at": time.time(),
+            }
+            self._append_journal(entry)
+            key = (url, entry["product_id"])
+            if key in self._pending:
+                self.metrics["coalesced"] += 1
+            self._pending[key] = entry
+            self.metrics["queued"] += 1
+        return entry["seq"]
+
+    def overlay(self, url, product_id, data):
+        """
+        Apply a queued, not yet written change to prices read from the sheet,
+        so validation sees the supplier's own pending write
+        """
+        with self._lock:
+            entry = self._pending.get((url, str(product_id)))
+        if entry is None:
+            return data
+        data = dict(data)
+        data["update_price"] = entry["payload"]["new_price"]
+        data["update_oldPrice"] = entry["payload"].get("old_price", data.get("update_oldPrice"))
+        return data
+
+    def _post_batch(self, url, entries):
+        """
+        One POST per entry, in the payload format the Apps Script accepts
+
+        Returns:
+            list: (entry, error) pairs, error is None on success
+        """
+        results = []
+        for entry in entries:
+            self.metrics["posts"] += 1
+            try:
+                response = requests.post(url, json=entry["payload"], timeout=self.timeout)
+                error = None if response.status_code == 200 else f"Status: {response.status_code}, Response: {response.text}"
+            except requests.RequestException as e:
+                error = str(e)
+            results.append((entry, error))
+        return results
+
+    def flush(self, force=False):
+        """
+        Write every due entry, grouped per Apps Script URL
+        """
+        with self._flush_lock:
+            now = time.time()
+            with self._lock:
+                due = [dict(e) for e in self._pending.values() if force or e["next_attempt"] <= now]
+            if not due:
+                return 0
+
+            by_url = {}
+            for entry in due:
+                by_url.setdefault(entry["url"], []).append(entry)
+            results = []
+            for url, entries in by_url.items():
+                results.extend(self._post_batch(url, entries))
+
+            failed = []
+            written = []
+            with self._lock:
+                for entry, error in results:
+                    key = (entry["url"], entry["product_id"])
+                    current = self._pending.get(key)
+                    # A newer write for the product arrived while posting; keep it
+                    superseded = current is None or current["seq"] != entry["seq"]
+                    if error is None:
+                        self.metrics["written"] += 1
+                        written.append(entry)
+                        if not superseded:
+                            del self._pending[key]
+                        continue
+                    if superseded:
+                        continue
+                    current["attempts"] += 1
+                    if current["attempts"] >= self.max_attempts:
+                        del self._pending[key]
+                        self.metrics["failed"] += 1
+                        failed.append((current, error))
+                    else:
+                        self.metrics["retries"] += 1
+                        current["next_attempt"] = time.time() + min(300, self.flush_interval * 2 ** current["attempts"])
+                        logging.warning(
+                            "Price write for product %s failed (attempt %s): %s",
+                            entry["product_id"], current["attempts"], error,
+                        )
+                try:
+                    self._rewrite_journal()
+                except OSError as e:
+                    logging.error("Failed to rewrite price write journal: %s", e)
+
+            for entry in written:
+                if self.on_success is not None:
+                    try:
+                        self.on_success(entry)
+                    except Exception as e:
+                        logging.error("Price write success handler failed: %s", e)
+            for entry, error in failed:
+                logging.error("Giving up on price write for product %s: %s", entry["product_id"], error)
+                if self.on_failure is not None:
+                    try:
+                        self.on_failure(entry, error)
+                    except Exception as e:
+                        logging.error("Price write failure handler failed: %s", e)
+            return len(results)
+
+    def start(self, app=None):
+        def run():
+            while not self._closed:
+                self._wakeup.wait(self.flush_interval)
+                self._wakeup.clear()
+                try:
+                    if app is not None:
+                        with app.app_context():
+                            self.flush()
+                    else:
+                        self.flush()
+                except Exception as e:
+                    logging.error("Price write flush failed: %s", e)
+
+        threading.Thread(target=run, name="price-write-behind", daemon=True).start()
+        atexit.register(self.close)
+
+    def close(self):
+        # Unflushed writes stay in the journal and are replayed on next start,
+        # by this process or adopted by another once the lock is released
+        self._closed = True
+        self._wakeup.set()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def get_metrics(self):
+        with self._lock:
+            metrics = dict(self.metrics)
+            metrics["pending"] = len(self._pending)
+        return metrics
+
+
+def _record_written(entry):
+    from .price_history import record_price_outcome, OUTCOME_APPLIED
+
+    record_price_outcome(
+        entry.get("operation") or "update_price", entry["product_id"], OUTCOME_APPLIED,
+        entry.get("old_price"), entry.get("new_price"), entry.get("supplier"),
+    )
+
+
+def _handle_failed_write(entry, error):
+    """
+    Undo the write's local effects, record the failure and tell the supplier
+    that their change was not saved
+    """
+    from ..function_handler import revert_queued_write
+    from .price_history import record_price_outcome, OUTCOME_ERROR
+    from .whatsapp_utils import send_message, get_text_message_input, forget_price_results
+
+    # Otherwise a resend would be rejected by the weekly rule or get the
+    # cached success reply without being queued again
+    revert_queued_write(entry)
+    forget_price_results(entry["product_id"])
+    record_price_outcome(
+        entry.get("operation") or "update_price", entry["product_id"], OUTCOME_ERROR,
+        entry.get("old_price"), entry.get("new_price"), entry.get("supplier"),
+    )
+    if not entry.get("supplier"):
+        return
+    send_message(get_text_message_input(
+        entry["supplier"], FAILURE_NOTICE.format(product_id=entry["product_id"])
+    ))
+
+
+_queue = None
+
+
+def init_write_behind(app):
+    """
+    Start the write-behind queue when PRICE_WRITE_BEHIND is set
+    """
+    global _queue
+    if not app.config.get("PRICE_WRITE_BEHIND", False):
+        _queue = None
+        return None
+    _queue = PriceWriteQueue(
+        app.config.get("PRICE_WRITE_JOURNAL_PATH") or os.path.join(app.instance_path, "price_writes.journal"),
+        flush_interval=app.config.get("PRICE_WRITE_FLUSH_INTERVAL", 2.0),
+        max_attempts=app.config.get("PRICE_WRITE_MAX_ATTEMPTS", 5),
+        on_success=_record_written,
+        on_failure=_handle_failed_write,
+    )
+    _queue.replay()
+    _queue.start(app)
+    return _queue
+
+
+def get_price_write_queue():
+    return _queue
@@ -27,7 +27,7 @@ def handle_message():
         response: A tuple containing a JSON response and an HTTP status code.
     """
     body = request.get_json()
-    logging.info(f"Received webhook event type: {body.get('object')}")
+    logging.info("Received webhook event type: %s", body.get('object'))
 
     # Check if it's a WhatsApp status update
     if (
@@ -42,7 +42,7 @@ def handle_message():
             message_id = status.get("id")
             recipient_id = status.get("recipient_id")
             timestamp = status.get("timestamp")
-            logging.info(f"Status Update: {status_type}, Message ID: {message_id}, Recipient: {recipient_id}, Time: {timestamp}")
+            logging.info("Status Update: %s, Message ID: %s, Recipient: %s, Time: %s", status_type, message_id, recipient_id, timestamp)
         return jsonify({"status": "ok"}), 200
 
     # Check if it's a message event
@@ -66,11 +66,12 @@ def handle_message():
             logging.error("Failed to decode JSON")
             return jsonify({"status": "error", "message": "Invalid JSON provided"}), 400
         except Exception as e:
-            logging.error(f"Error processing message: {str(e)}")
+            logging.error("Error processing message: %s", e)
             return jsonify({"status": "error", "message": "Internal server error"}), 500
 
     # If we get here, it's an unrecognized event type
-    logging.warning(f"Unrecognized event type: {body}")
+    logging.warning("Unrecognized event type: %s", body.get("object"))
+    logging.debug("Unrecognized event body: %s", body)
     return jsonify({"status": "error", "message": "Unrecognized event type"}), 400
 
 
@@ -0,0 +1,89 @@
+"""
+Import-time benchmark for run.py.
+
+Runs `python -X importtime -c "import run"` in a fresh interpreter (which
+also executes create_app()), and reports the total wall time and the
+slowest imports by cumulative time. It can save the result as a baseline
+and fail when a later run regresses past a threshold.
+
+Usage:
+    python scripts/bench_importtime.py
+    python scripts/bench_importtime.py --runs 5 --save importtime_baseline.json
+    python scripts/bench_importtime.py --baseline importtime_baseline.json --max-regression 0.2
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_once():
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import run"],
+        cwd=_APP_DIR,
+        capture_output=True,
+        text=True,
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit("import run failed")
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = {
+                "self_us": int(self_us),
+                "cumulative_us": int(cumulative_us),
+                "top_level": len(indent) == 1,
+            }
+    import_us = sum(m["cumulative_us"] for m in modules.values() if m["top_level"])
+    return {"wall_ms": wall_ms, "import_ms": import_us / 1000, "modules": modules}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="number of fresh interpreter runs")
+    parser.add_argument("--top", type=int, default=15, help="how many slow imports to list")
+    parser.add_argument("--save", help="write the result to this JSON file")
+    parser.add_argument("--baseline", help="compare against a previously saved JSON file")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="allowed relative increase in median import time")
+    args = parser.parse_args()
+
+    runs = [measure_once() for _ in range(args.runs)]
+    import_ms = statistics.median(r["import_ms"] for r in runs)
+    wall_ms = statistics.median(r["wall_ms"] for r in runs)
+
+    print(f"import run: median import time {import_ms:.1f} ms, median wall time {wall_ms:.1f} ms over {args.runs} runs")
+    slowest = sorted(runs[-1]["modules"].items(), key=lambda item: -item[1]["cumulative_us"])
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, module in slowest[:args.top]:
+        print(f"{module['cumulative_us'] / 1000:>14.1f} {module['self_us'] / 1000:>9.1f}  {name}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"import_ms": import_ms, "wall_ms": wall_ms}, f, indent=2)
+        print(f"\nSaved result to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        change = (import_ms - baseline["import_ms"]) / baseline["import_ms"]
+        print(f"\nBaseline {baseline['import_ms']:.1f} ms, change {change:+.1%}")
+        if change > args.max_regression:
+            raise SystemExit(f"Import time regressed by {change:.1%} (limit {args.max_regression:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Command-line client for the /admin/memory endpoints.
+
+Each call is answered by whichever worker serves it, so run tracemalloc
+sessions against a single worker (or a single-worker deployment).
+
+Usage:
+    python scripts/memory_report.py sizes
+    python scripts/memory_report.py start --frames 5
+    python scripts/memory_report.py snapshot
+    python scripts/memory_report.py diff --from 1 [--to 2] [--group-by filename] [--limit 20]
+    python scripts/memory_report.py stop
+
+The server URL and admin token come from --url/--token or the BOT_URL and
+ADMIN_TOKEN environment variables.
+"""
+import argparse
+import json
+import os
+import sys
+
+import requests
+
+
+def _format_bytes(value):
+    if value is None:
+        return "-"
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(value) < 1024 or unit == "GiB":
+            return f"{value:.1f} {unit}" if unit != "B" else f"{value} B"
+        value /= 1024
+
+
+def print_sizes(result):
+    process = result["process"]
+    print(
+        f"pid {process['pid']}  rss {_format_bytes(process['rss_bytes'])}  "
+        f"peak {_format_bytes(process['peak_rss_bytes'])}  gc objects {process['gc_objects']}"
+    )
+    print(f"{'structure':<32}{'entries':>10}{'deep size':>14}")
+    for entry in result["structures"]:
+        marker = " (truncated)" if entry["truncated"] else ""
+        entries = "-" if entry["entries"] is None else entry["entries"]
+        print(f"{entry['name']:<32}{entries:>10}{_format_bytes(entry['deep_bytes']):>14}{marker}")
+    tracing = result["tracemalloc"]
+    if tracing["tracing"]:
+        print(f"tracemalloc: tracing {_format_bytes(tracing['traced_bytes'])}, "
+              f"snapshots {[s['id'] for s in tracing['snapshots']]}")
+    else:
+        print("tracemalloc: off")
+
+
+def print_diff(result):
+    print(f"snapshot {result['from']} -> {result['to']} ({result['seconds_between']} s), "
+          f"total {_format_bytes(result['total_size_diff_bytes'])}")
+    for stat in result["top"]:
+        where = stat["file"] if stat["line"] is None else f"{stat['file']}:{stat['line']}"
+        print(f"{_format_bytes(stat['size_diff_bytes']):>12} {stat['count_diff']:>+8}  {where}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the memory of a running bot worker")
+    parser.add_argument("command", choices=["sizes", "start", "stop", "snapshot", "diff"])
+    parser.add_argument("--url", default=os.getenv("BOT_URL", "http://localhost:8000"))
+    parser.add_argument("--token", default=os.getenv("ADMIN_TOKEN"))
+    parser.add_argument("--frames", type=int, default=1, help="traceback depth for start")
+    parser.add_argument("--from", dest="from_id", type=int, help="base snapshot for diff")
+    parser.add_argument("--to", dest="to_id", type=int, help="second snapshot for diff (default: new)")
+    parser.add_argument("--group-by", choices=["lineno", "filename"], default="lineno")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="print the raw JSON response")
+    args = parser.parse_args()
+
+    if not args.token:
+        raise SystemExit("An admin token is required (--token or ADMIN_TOKEN)")
+    headers = {"Authorization": f"Bearer {args.token}"}
+    base = args.url.rstrip("/") + "/admin/memory"
+
+    if args.command == "sizes":
+        response = requests.get(base, headers=headers, timeout=60)
+    elif args.command == "diff":
+        if args.from_id is None:
+            raise SystemExit("diff needs --from")
+        params = {"from": args.from_id, "group_by": args.group_by, "limit": args.limit}
+        if args.to_id is not None:
+            params["to"] = args.to_id
+        response = requests.get(f"{base}/tracemalloc/diff", headers=headers, params=params, timeout=60)
+    else:
+        params = {"frames": args.frames} if args.command == "start" else None
+        response = requests.post(f"{base}/tracemalloc/{args.command}", headers=headers, params=params, timeout=60)
+
+    body = response.json()
+    if args.json or response.status_code != 200:
+        print(json.dumps(body, indent=2))
+        sys.exit(0 if response.status_code == 200 else 1)
+
+    if args.command == "sizes":
+        print_sizes(body["result"])
+    elif args.command == "diff":
+        print_diff(body["result"])
+    else:
+        print(json.dumps({key: value for key, value in body.items() if key != "status"}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
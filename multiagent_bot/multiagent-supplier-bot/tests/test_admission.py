@@ -0,0 +1,62 @@
+import pytest
+
+from app.utils.admission import AdmissionController, MemoryBucketStore, RedisBucketStore
+
+
+def make_redis_store(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    # The bucket scripts need a Lua runtime
+    pytest.importorskip("lupa")
+    import redis
+
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(redis.Redis, "from_url", lambda url: client)
+    return RedisBucketStore("redis://localhost:6379/0")
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request, monkeypatch):
+    return MemoryBucketStore() if request.param == "memory" else make_redis_store(monkeypatch)
+
+
+def test_take_admits_up_to_capacity_then_refills(store):
+    assert [store.take("supplier:1", 1.0, 3, now=100.0) for _ in range(4)] == [True, True, True, False]
+    assert store.take("supplier:1", 1.0, 3, now=101.0)
+    assert not store.take("supplier:1", 1.0, 3, now=101.0)
+
+
+def test_refund_is_capped_at_capacity(store):
+    store.take("supplier:1", 0.001, 2, now=100.0)
+    for _ in range(5):
+        store.refund("supplier:1", 2)
+
+    assert [store.take("supplier:1", 0.001, 2, now=100.0) for _ in range(3)] == [True, True, False]
+
+
+def test_refund_of_unknown_bucket_leaves_it_full(store):
+    store.refund("supplier:2", 2)
+    assert [store.take("supplier:2", 0.001, 2, now=100.0) for _ in range(3)] == [True, True, False]
+
+
+def test_redis_take_uses_the_server_clock(monkeypatch):
+    store = make_redis_store(monkeypatch)
+    calls = []
+    take = store._take
+    store._take = lambda keys, args: calls.append(args) or take(keys=keys, args=args)
+
+    assert store.take("global", 0.001, 1)
+    assert not store.take("global", 0.001, 1)
+    # No worker clock is sent; the script stamps the bucket with Redis TIME
+    assert calls == [[0.001, 1], [0.001, 1]]
+    assert float(store._client.hget("admission:global", "updated")) > 1_000_000_000
+
+
+def test_global_shed_refunds_the_supplier_token():
+    store = MemoryBucketStore()
+    controller = AdmissionController(store, supplier_rate=0.001, supplier_burst=2, global_rate=0.001, global_burst=1)
+
+    assert controller.admit("923001")
+    assert not controller.admit("923001")
+    # The supplier was charged once for the admitted message only
+    tokens, _ = store._buckets["supplier:923001"]
+    assert round(tokens) == 1
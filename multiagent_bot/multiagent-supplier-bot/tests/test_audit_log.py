@@ -0,0 +1,57 @@
+import json
+import time
+from datetime import datetime
+
+from app.utils.audit_log import PriceAuditLog
+
+
+def read_entries(directory):
+    return [json.loads(line) for path in sorted(directory.iterdir()) for line in path.read_text().splitlines()]
+
+
+def test_stop_does_not_wait_on_a_lock_held_by_the_caller(tmp_path):
+    log = PriceAuditLog(directory=str(tmp_path), flush_interval=60)
+    log.record({"product_id": "MZ1"})
+
+    # A SIGTERM that lands inside record() finds the buffer lock held
+    with log._lock:
+        started = time.monotonic()
+        log.stop(timeout=0.2)
+        assert time.monotonic() - started < 5
+
+    log._thread.join(5)
+    assert not log._thread.is_alive()
+    assert read_entries(tmp_path) == [{"product_id": "MZ1"}]
+
+
+def test_close_flushes_what_the_writer_left(tmp_path):
+    log = PriceAuditLog(directory=str(tmp_path), flush_interval=60)
+    log.stop()
+    log.record({"product_id": "MZ2"})
+    log.close()
+    assert read_entries(tmp_path) == [{"product_id": "MZ2"}]
+
+
+def test_entries_flushed_after_midnight_are_found_by_their_timestamp(tmp_path):
+    (tmp_path / "price_audit-20261019-000.jsonl").write_text(
+        json.dumps({"product_id": "MZ1", "timestamp": "2026-10-18T23:59:58"}) + "\n"
+    )
+    log = PriceAuditLog(directory=str(tmp_path), flush_interval=60)
+    found = list(log.iter_entries(since=datetime(2026, 10, 18), until=datetime(2026, 10, 18, 23, 59, 59)))
+    log.stop()
+
+    assert [e["product_id"] for e in found] == ["MZ1"]
+
+
+def test_entries_with_bad_timestamps_are_skipped(tmp_path):
+    rows = [
+        {"product_id": "MZ1"},
+        {"product_id": "MZ2", "timestamp": "yesterday"},
+        {"product_id": "MZ3", "timestamp": "2026-10-19T10:00:00"},
+    ]
+    (tmp_path / "price_audit-20261019-000.jsonl").write_text("".join(json.dumps(r) + "\n" for r in rows))
+    log = PriceAuditLog(directory=str(tmp_path), flush_interval=60)
+    found = list(log.iter_entries(since=datetime(2026, 10, 19)))
+    log.stop()
+
+    assert [e["product_id"] for e in found] == ["MZ3"]
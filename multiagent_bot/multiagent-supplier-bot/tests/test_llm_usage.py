@@ -0,0 +1,35 @@
+from datetime import date
+
+from app.utils.llm_usage import UsageAggregator
+
+
+def test_workers_write_their_own_files_and_rollup_merges_them(tmp_path):
+    first = UsageAggregator(str(tmp_path), namespace="host.1")
+    second = UsageAggregator(str(tmp_path), namespace="host.2")
+    first.record("query", "gpt", 100, 10, 50.0, wa_id="923001")
+    second.record("query", "gpt", 200, 20, 150.0, wa_id="923001")
+    second.record("output", "gpt", 5, 5, 10.0, wa_id="923002")
+    first.flush()
+    second.flush()
+    # A second flush merges into the worker's own file only
+    first.record("query", "gpt", 100, 10, 50.0, wa_id="923001")
+    first.flush()
+
+    day = date.today().isoformat()
+    assert sorted(p.name for p in tmp_path.iterdir()) == [f"usage-{day}-host.1.json", f"usage-{day}-host.2.json"]
+    totals = {e["wa_id"]: e for e in first.rollup()}
+    assert totals["923001"]["calls"] == 3
+    assert totals["923001"]["prompt_tokens"] == 400
+    assert totals["923001"]["avg_latency_ms"] == 83.3
+    assert totals["923002"]["completion_tokens"] == 5
+
+
+def test_budget_totals_are_loaded_from_every_worker(tmp_path):
+    for n in (1, 2):
+        aggregator = UsageAggregator(str(tmp_path), namespace=f"host.{n}")
+        aggregator.record("query", "gpt", 300, 0, 1.0, wa_id="923001")
+        aggregator.flush()
+
+    restarted = UsageAggregator(str(tmp_path), daily_token_budget=500, namespace="host.3")
+    assert restarted.tokens_today("923001") == 600
+    assert restarted.is_over_budget("923001")
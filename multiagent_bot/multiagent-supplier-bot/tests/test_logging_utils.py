@@ -0,0 +1,96 @@
+import io
+import json
+import logging
+import threading
+
+from app.utils.logging_utils import AsyncBatchHandler, JsonLinesFormatter, SecretRedactor
+
+
+class RecordingStream(io.StringIO):
+    def __init__(self, gate=None):
+        super().__init__()
+        self.writes = 0
+        self.gate = gate
+
+    def write(self, text):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.writes += 1
+        return super().write(text)
+
+
+def make_logger(handler, name):
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def lines(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_records_are_written_in_batches(monkeypatch):
+    stream = RecordingStream()
+    handler = AsyncBatchHandler(stream=stream, batch_size=50, flush_interval=0.05)
+    # Hold the writer back until every record is queued
+    gate = threading.Event()
+    original_get = handler.queue.get
+    monkeypatch.setattr(handler.queue, "get", lambda *a, **k: gate.wait(5) and original_get(*a, **k))
+    logger = make_logger(handler, "test.batches")
+    for n in range(100):
+        logger.info("message %s", n)
+    gate.set()
+    handler.close()
+
+    assert [entry["msg"] for entry in lines(stream)] == [f"message {n}" for n in range(100)]
+    assert stream.writes == 2
+
+
+def test_arguments_are_captured_at_the_call():
+    stream = RecordingStream(gate=threading.Event())
+    handler = AsyncBatchHandler(stream=stream, flush_interval=0.05)
+    logger = make_logger(handler, "test.args")
+    slots = {"amount": None}
+    logger.info("pending %s", slots)
+    slots["amount"] = 450
+    stream.gate.set()
+    handler.close()
+
+    assert lines(stream)[0]["msg"] == "pending {'amount': None}"
+
+
+def test_dropped_records_are_counted_and_reported():
+    stream = RecordingStream(gate=threading.Event())
+    handler = AsyncBatchHandler(stream=stream, max_queue_size=1, flush_interval=0.05)
+    logger = make_logger(handler, "test.dropped")
+    # The writer takes the first record and blocks on the stream
+    logger.info("first")
+    while not handler.queue.empty():
+        pass
+    threads = [threading.Thread(target=lambda: [logger.info("flood") for _ in range(50)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    dropped = handler.dropped
+    stream.gate.set()
+    handler.close()
+
+    assert dropped == 4 * 50 - 1
+    summaries = [entry for entry in lines(stream) if entry["msg"] == "Log records suppressed"]
+    assert sum(entry["queue_full_dropped"] for entry in summaries) == dropped
+
+
+def test_secrets_are_redacted():
+    stream = RecordingStream()
+    formatter = JsonLinesFormatter(SecretRedactor(["verysecretvalue"]))
+    handler = AsyncBatchHandler(stream=stream, formatter=formatter, flush_interval=0.05)
+    logger = make_logger(handler, "test.redaction")
+    logger.info("token verysecretvalue header %s", "Bearer abc.def-123")
+    logger.info("key %s", "sk-" + "a" * 20)
+    handler.close()
+
+    messages = [entry["msg"] for entry in lines(stream)]
+    assert messages == ["token [REDACTED] header Bearer [REDACTED]", "key [REDACTED]"]
@@ -0,0 +1,31 @@
+import sys
+
+import pytest
+
+from app.utils.memory_introspection import deep_sizeof
+
+np = pytest.importorskip("numpy")
+
+
+def test_owned_array_buffer_is_counted_once():
+    array = np.zeros(1000, dtype=np.float64)
+    header = sys.getsizeof(array, 0) - array.nbytes
+
+    size, truncated = deep_sizeof(array)
+    assert size == header + 8000 and not truncated
+
+    holder = {"matrix": array}
+    size, _ = deep_sizeof(holder)
+    assert size == sys.getsizeof(holder, 0) + sys.getsizeof("matrix", 0) + header + 8000
+
+
+def test_view_counts_the_array_it_views_once():
+    array = np.zeros(1000, dtype=np.float64)
+    view = array[:10]
+
+    size, _ = deep_sizeof([array, view])
+    assert size == sys.getsizeof([array, view], 0) + sys.getsizeof(array, 0) + sys.getsizeof(view, 0)
+    assert sys.getsizeof(view, 0) < 8000
+
+    size, _ = deep_sizeof(view)
+    assert size == sys.getsizeof(view, 0) + sys.getsizeof(array, 0)
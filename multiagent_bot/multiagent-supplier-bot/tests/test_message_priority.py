@@ -0,0 +1,57 @@
+from app.utils import whatsapp_utils
+from app.utils.scheduler import PRIORITY_MUTATION, PRIORITY_OTHER
+
+
+def test_slot_reply_without_pending_request_is_other(monkeypatch):
+    monkeypatch.setattr(whatsapp_utils, "_pending_requests", {})
+    assert whatsapp_utils.message_priority("923001", "Rs 450") == PRIORITY_OTHER
+    assert whatsapp_utils.message_priority("923001", "MZ123") == PRIORITY_OTHER
+
+
+def test_slot_reply_to_pending_request_is_a_mutation(monkeypatch):
+    monkeypatch.setattr(whatsapp_utils, "_pending_requests", {})
+    whatsapp_utils.update_pending_request("923001", intent="price_decrease", product_id="MZ123")
+
+    assert whatsapp_utils.message_priority("923001", "Rs 450") == PRIORITY_MUTATION
+    assert whatsapp_utils.message_priority("923001", "MZ123") == PRIORITY_MUTATION
+    assert whatsapp_utils.message_priority("923002", "Rs 450") == PRIORITY_OTHER
+
+
+def test_empty_pending_request_does_not_raise_priority(monkeypatch):
+    monkeypatch.setattr(whatsapp_utils, "_pending_requests", {})
+    # Left behind by the "What would you like to do?" buttons
+    whatsapp_utils.update_pending_request("923001")
+    assert whatsapp_utils.message_priority("923001", "hello") == PRIORITY_OTHER
+
+
+class NoQueryAgent:
+    def analyze_query(self, *args):
+        raise AssertionError("a bare product code must not need the Query Identifier Agent")
+
+
+def test_bare_product_code_fills_the_pending_product(monkeypatch):
+    monkeypatch.setattr(whatsapp_utils, "_pending_requests", {})
+    monkeypatch.setattr(whatsapp_utils, "_recent_products", {"923001": ["MZ123", "KB7"]})
+    monkeypatch.setattr(whatsapp_utils, "user_conversation_threads", {})
+    monkeypatch.setattr(whatsapp_utils, "QueryIdentifierAgent", NoQueryAgent)
+    whatsapp_utils.update_pending_request("923001", intent="price_decrease")
+
+    reply = whatsapp_utils._generate_response(" mz123 ", wa_id="923001")
+
+    assert reply == "Please send the new price for product `MZ123`."
+    assert whatsapp_utils.get_pending_request("923001")["product_id"] == "MZ123"
+
+
+def test_bare_code_outside_the_options_is_checked_with_the_catalogue(monkeypatch):
+    monkeypatch.setattr(whatsapp_utils, "_recent_products", {"923001": ["MZ123"]})
+    checked = []
+
+    def check(code, wa_id=None):
+        checked.append(code)
+        return {"status": "ok", "code": "Zx-9"} if code == "ZX-9" else {"status": "unknown", "code": code}
+
+    monkeypatch.setattr(whatsapp_utils, "check_product_code", check)
+    assert whatsapp_utils.match_pending_product("923001", "zx-9") == "Zx-9"
+    assert whatsapp_utils.match_pending_product("923001", "QQ1") is None
+    assert whatsapp_utils.match_pending_product("923001", "haan") is None
+    assert checked == ["ZX-9", "QQ1"]
@@ -0,0 +1,55 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from app.utils.price_history import (
+    PriceHistoryStore,
+    OUTCOME_APPLIED,
+    OUTCOME_REJECTED_CAP,
+)
+
+
+def test_workers_sharing_a_directory_keep_their_own_codes(tmp_path):
+    worker_a = PriceHistoryStore(str(tmp_path), namespace="host.1")
+    worker_b = PriceHistoryStore(str(tmp_path), namespace="host.2")
+
+    # Each worker assigns code 0 to a different product and supplier
+    worker_a.record("update_price", "MZ1", OUTCOME_REJECTED_CAP, 100, 150, supplier="92300A")
+    worker_b.record("update_price", "KB7", OUTCOME_REJECTED_CAP, 100, 150, supplier="92300B")
+    worker_b.record("update_price", "KB7", OUTCOME_REJECTED_CAP, 100, 150, supplier="92300B")
+    worker_a.record("discount", "MZ1", OUTCOME_APPLIED, 100, 90, supplier="92300A")
+    first_a, first_b = worker_a.flush(), worker_b.flush()
+    worker_a.record("discount", "MZ1", OUTCOME_APPLIED, 100, 80, supplier="92300A")
+    second_a = worker_a.flush()
+
+    assert len({first_a, first_b, second_a}) == 3
+
+    reader = PriceHistoryStore(str(tmp_path), namespace="cli.1")
+    assert reader.top_rejected_products() == [
+        {"product_id": "KB7", "rejections": 2},
+        {"product_id": "MZ1", "rejections": 1},
+    ]
+    per_supplier = reader.changes_per_supplier_per_day()
+    assert [(row["supplier"], row["changes"]) for row in per_supplier] == [("92300A", 2)]
+
+    assert reader.compact(namespace="*") == 2
+    assert reader.top_rejected_products()[0] == {"product_id": "KB7", "rejections": 2}
+
+
+def test_unparseable_prices_are_recorded_as_missing(tmp_path):
+    store = PriceHistoryStore(str(tmp_path), namespace="host.1")
+    store.record("discount", "MZ1", OUTCOME_APPLIED, None, "20%", supplier="92300A")
+    data, suppliers, products = store.columns()
+    assert products == ["MZ1"] and suppliers == ["92300A"]
+    assert data["new_price"].size == 1
+
+
+def test_files_outside_the_namespaced_layout_are_ignored(tmp_path):
+    (tmp_path / "chunk-00000001.npz").write_bytes(b"not a chunk")
+    (tmp_path / "dictionary.json").write_text("{}")
+    store = PriceHistoryStore(str(tmp_path), namespace="host-1")
+    store.record("update_price", "MZ1", OUTCOME_REJECTED_CAP, 100, 150, supplier="92300A")
+    store.flush()
+
+    assert list(store._chunk_paths()) == ["host_1"]
+    assert store.top_rejected_products() == [{"product_id": "MZ1", "rejections": 1}]
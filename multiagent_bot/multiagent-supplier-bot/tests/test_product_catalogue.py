@@ -0,0 +1,28 @@
+from app.utils.product_catalogue import ProductCatalogue
+
+
+def _catalogue():
+    return ProductCatalogue([
+        ("MZ-1234", "Acme Traders", "923001111111"),
+        ("MZ 5678", "Acme Traders", "923001111111"),
+        ("KB_0001", "Other Co", "923002222222"),
+    ])
+
+
+def test_lookups_accept_any_spelling_and_return_the_sheet_code():
+    catalogue = _catalogue()
+    assert catalogue.canonical("mz1234") == "MZ-1234"
+    assert catalogue.canonical("MZ_1234") == "MZ-1234"
+    assert catalogue.canonical("MZ9999") is None
+
+
+def test_suggestions_use_the_sheet_code():
+    catalogue = _catalogue()
+    assert catalogue.suggest("MZ1235") == ["MZ-1234"]
+    assert catalogue.suggest("MZ567") == ["MZ 5678"]
+
+
+def test_ownership_by_wa_id():
+    catalogue = _catalogue()
+    assert catalogue.is_owned_by("mz-1234", wa_id="923001111111")
+    assert not catalogue.is_owned_by("KB0001", wa_id="923001111111")
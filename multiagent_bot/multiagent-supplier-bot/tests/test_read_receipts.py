@@ -0,0 +1,98 @@
+import requests
+
+from app.utils import read_receipts, whatsapp_utils
+from app.utils.read_receipts import ReadReceiptSender, ResponseLatency
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code != 200:
+            raise requests.HTTPError(f"{self.status_code} error")
+
+
+def test_receipt_marks_read_and_shows_typing(monkeypatch):
+    posted = []
+
+    def post(url, json=None, headers=None, timeout=None):
+        posted.append((url, json, headers["Authorization"]))
+        return FakeResponse(200)
+
+    monkeypatch.setattr(read_receipts.requests, "post", post)
+    latency = ResponseLatency()
+    sender = ReadReceiptSender("token", "v21.0", "555", latency)
+
+    sender._post("wamid.1", latency.accepted("wamid.1"))
+
+    assert posted == [(
+        "https://graph.facebook.com/v21.0/555/messages",
+        {"messaging_product": "whatsapp", "status": "read", "message_id": "wamid.1", "typing_indicator": {"type": "text"}},
+        "Bearer token",
+    )]
+    metrics = latency.get_metrics()
+    assert metrics["signals_sent"] == 1
+    assert metrics["time_to_first_signal"]["count"] == 1
+
+
+def test_failed_receipt_is_counted_not_timed(monkeypatch):
+    monkeypatch.setattr(read_receipts.requests, "post", lambda *args, **kwargs: FakeResponse(500))
+    latency = ResponseLatency()
+    sender = ReadReceiptSender("token", "v21.0", "555", latency)
+
+    sender._post("wamid.1", latency.accepted("wamid.1"))
+
+    metrics = latency.get_metrics()
+    assert metrics["signals_failed"] == 1
+    assert metrics["time_to_first_signal"]["count"] == 0
+
+
+def test_latency_is_tracked_per_message(monkeypatch):
+    clock = iter([10.0, 11.0, 13.0, 14.5])
+    monkeypatch.setattr(read_receipts.time, "monotonic", lambda: next(clock))
+    latency = ResponseLatency()
+
+    # Two messages in flight from the same supplier
+    latency.accepted("wamid.1")
+    latency.accepted("wamid.2")
+    latency.replied("wamid.1")
+    latency.replied("wamid.2")
+
+    assert sorted(latency._reply_ms) == [3000.0, 3500.0]
+    assert latency.get_metrics()["awaiting_reply"] == 0
+
+
+def test_failed_reply_is_not_timed():
+    latency = ResponseLatency()
+    latency.accepted("wamid.1")
+    latency.replied("wamid.1", ok=False)
+    latency.replied("wamid.1")
+
+    metrics = latency.get_metrics()
+    assert (metrics["replies"], metrics["replies_failed"], metrics["awaiting_reply"]) == (0, 1, 0)
+
+
+def test_unanswered_messages_are_bounded():
+    latency = ResponseLatency(max_awaiting=2)
+    for message_id in ("wamid.1", "wamid.2", "wamid.3"):
+        latency.accepted(message_id)
+
+    assert list(latency._accepted) == ["wamid.2", "wamid.3"]
+    assert latency.get_metrics()["expired"] == 1
+
+
+def test_send_reply_records_only_successful_sends(monkeypatch):
+    latency = ResponseLatency()
+    monkeypatch.setattr(read_receipts, "_latency", latency)
+    monkeypatch.setattr(whatsapp_utils, "process_text_for_whatsapp", lambda text: text)
+    results = iter([("error", 500), requests.Response()])
+    monkeypatch.setattr(whatsapp_utils, "send_message", lambda data: next(results))
+
+    latency.accepted("wamid.1")
+    latency.accepted("wamid.2")
+    whatsapp_utils.send_reply("923001", "Price updated", "wamid.1")
+    whatsapp_utils.send_reply("923001", "Price updated", "wamid.2")
+
+    metrics = latency.get_metrics()
+    assert (metrics["replies"], metrics["replies_failed"]) == (1, 1)
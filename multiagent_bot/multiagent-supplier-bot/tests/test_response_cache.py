@@ -0,0 +1,48 @@
+import pytest
+
+from app.utils.response_cache import ResponseCache
+
+OPPOSITE_PAIRS = [
+    ("I want to increase the price of my product", "I want to decrease the price of my product"),
+    ("please increase the price of my product", "please decrease the price of my product"),
+    ("meri product ki price increase kar dijiye please", "meri product ki price decrease kar dijiye please"),
+]
+
+
+def _analysis(intent):
+    return {"intent": intent, "product_id": None, "amount": None, "confidence": "high"}
+
+
+@pytest.mark.parametrize("cached, incoming", OPPOSITE_PAIRS)
+def test_price_action_is_not_reused_for_opposite_message(cached, incoming):
+    cache = ResponseCache()
+    cache.put(cached, _analysis("price_increase"), "Which product?")
+
+    assert cache._vector(cached) @ cache._vector(incoming) >= cache.threshold
+    assert cache.get(incoming) is None
+
+
+@pytest.mark.parametrize("cached, incoming", OPPOSITE_PAIRS)
+def test_price_action_is_reused_for_exact_normalized_match(cached, incoming):
+    cache = ResponseCache()
+    cache.put(cached, _analysis("price_increase"), "Which product?")
+
+    hit = cache.get(cached.upper() + "!!")
+    assert hit["analysis"]["intent"] == "price_increase"
+
+
+def test_generic_message_hits_by_similarity():
+    cache = ResponseCache(threshold=0.8)
+    cache.put("hello how are you", _analysis("unclear"), "Hi! How can I help?")
+    cache.put("I want to increase the price of my product", _analysis("price_increase"), "Which product?")
+
+    hit = cache.get("hello how are you doing")
+    assert hit["reply"] == "Hi! How can I help?"
+    assert cache.get_metrics()["hits"] == 1
+
+
+def test_messages_with_digits_are_not_cached():
+    cache = ResponseCache()
+    assert not cache.put("MZ123 ki price kam karni hai", _analysis("unclear"))
+    assert cache.get("MZ123 ki price kam karni hai") is None
+    assert cache.get_metrics()["uncacheable"] == 1
@@ -0,0 +1,39 @@
+from flask import Flask
+
+from app.utils import response_cache, whatsapp_utils
+from app.utils.response_cache import init_response_cache
+
+
+class CountingQueryAgent:
+    calls = 0
+
+    def analyze_query(self, message, history):
+        CountingQueryAgent.calls += 1
+        return {"intent": "greeting", "product_id": None, "amount": None, "confidence": "high"}
+
+
+class UnusedOutputAgent:
+    def format_response(self, *args):
+        raise AssertionError("interactive clarifications need no Output Agent call")
+
+
+def test_generic_messages_hit_the_cache_with_interactive_replies_on(monkeypatch):
+    app = Flask(__name__)
+    # The defaults: interactive clarifications and the response cache both on
+    app.config.update(INTERACTIVE_MESSAGES_ENABLED=True, RESPONSE_CACHE_ENABLED=True)
+    monkeypatch.setattr(response_cache, "_cache", None)
+    monkeypatch.setattr(whatsapp_utils, "_pending_requests", {})
+    monkeypatch.setattr(whatsapp_utils, "user_conversation_threads", {})
+    monkeypatch.setattr(whatsapp_utils, "QueryIdentifierAgent", CountingQueryAgent)
+    monkeypatch.setattr(whatsapp_utils, "OutputAgent", UnusedOutputAgent)
+    CountingQueryAgent.calls = 0
+
+    with app.app_context():
+        init_response_cache(app)
+        first = whatsapp_utils._generate_response("Assalam o alaikum", wa_id="923001")
+        # Same supplier, right after the intent buttons were sent
+        second = whatsapp_utils._generate_response("assalam o alaikum!!", wa_id="923001")
+
+    assert first.text == second.text == "What would you like to do?"
+    assert CountingQueryAgent.calls == 1
+    assert response_cache.get_response_cache().get_metrics()["hits"] == 1
@@ -0,0 +1,64 @@
+import threading
+import time
+
+from flask import Flask
+
+from app.utils.scheduler import MessageScheduler, PRIORITY_MUTATION, PRIORITY_OTHER
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_same_supplier_messages_finish_in_submission_order():
+    scheduler = MessageScheduler(Flask(__name__), workers=4)
+    finished = []
+
+    def handle(label, delay):
+        time.sleep(delay)
+        finished.append(label)
+
+    # "change price" then a quick correction, which would otherwise overtake it
+    scheduler.submit(handle, ("change price", 0.2), priority=PRIORITY_OTHER, key="923001")
+    scheduler.submit(handle, ("correction", 0), priority=PRIORITY_MUTATION, key="923001")
+
+    assert wait_until(lambda: len(finished) == 2)
+    assert finished == ["change price", "correction"]
+    assert scheduler.get_metrics()["suppliers_queued"] == 0
+
+
+def test_same_supplier_messages_never_overlap():
+    scheduler = MessageScheduler(Flask(__name__), workers=4)
+    running = []
+    overlaps = []
+    lock = threading.Lock()
+
+    def handle():
+        with lock:
+            running.append(1)
+            if len(running) > 1:
+                overlaps.append(True)
+        time.sleep(0.02)
+        with lock:
+            running.pop()
+
+    for _ in range(10):
+        scheduler.submit(handle, key="923001")
+    assert wait_until(lambda: scheduler.get_metrics()["processed"] == 10)
+    assert overlaps == []
+
+
+def test_other_suppliers_are_not_held_back():
+    scheduler = MessageScheduler(Flask(__name__), workers=2)
+    release = threading.Event()
+    finished = []
+
+    scheduler.submit(lambda: release.wait(5) and finished.append("slow"), key="923001")
+    scheduler.submit(lambda: finished.append("other supplier"), key="923002")
+
+    assert wait_until(lambda: finished == ["other supplier"])
+    release.set()
+    assert wait_until(lambda: finished == ["other supplier", "slow"])
@@ -0,0 +1,78 @@
+import threading
+import time
+
+from app.utils.single_flight import SingleFlight, make_price_key, price_key_product
+
+
+class FakeSheet:
+    def __init__(self):
+        self.price = None
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def set_price(self, price, delay=0):
+        with self._lock:
+            self.calls += 1
+        time.sleep(delay)
+        self.price = price
+        return f"ok {price}"
+
+
+def test_other_mutation_of_same_product_evicts_cached_result():
+    sheet = FakeSheet()
+    calls = SingleFlight(expiry=60, group_of=price_key_product)
+
+    for price in (450, 400, 450):
+        result, shared = calls.do(make_price_key("MZ1", "price_decrease", price), sheet.set_price, price)
+        assert not shared
+        assert result == f"ok {price}"
+
+    assert sheet.calls == 3
+    assert sheet.price == 450
+
+
+def test_repeat_of_latest_mutation_is_replayed():
+    sheet = FakeSheet()
+    calls = SingleFlight(expiry=60, group_of=price_key_product)
+
+    calls.do(make_price_key("MZ1", "price_decrease", 400), sheet.set_price, 400)
+    calls.do(make_price_key("MZ2", "price_decrease", 100), sheet.set_price, 100)
+    result, shared = calls.do(make_price_key("mz1 ", "price_decrease", "400.0"), sheet.set_price, 400)
+
+    assert shared
+    assert result == "ok 400"
+    assert sheet.calls == 2
+
+
+def test_concurrent_identical_calls_share_one_execution():
+    sheet = FakeSheet()
+    calls = SingleFlight(expiry=60, group_of=price_key_product)
+    key = make_price_key("MZ1", "price_increase", 500)
+    start = threading.Barrier(5)
+    outcomes = []
+
+    def worker():
+        start.wait()
+        outcomes.append(calls.do(key, sheet.set_price, 500, 0.2))
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sheet.calls == 1
+    assert [result for result, _ in outcomes] == ["ok 500"] * 5
+    assert sum(1 for _, shared in outcomes if not shared) == 1
+
+
+def test_failed_results_are_not_replayed():
+    calls = SingleFlight(expiry=60, should_cache=lambda result: not result.startswith("❌"))
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        return "❌ failed" if len(attempts) == 1 else "ok"
+
+    assert calls.do("key", flaky) == ("❌ failed", False)
+    assert calls.do("key", flaky) == ("ok", False)
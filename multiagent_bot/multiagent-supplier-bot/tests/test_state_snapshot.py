@@ -0,0 +1,86 @@
+import os
+import time
+from datetime import datetime
+
+from app.utils import state_snapshot
+from app.utils.state_snapshot import StateSnapshotter
+
+
+def make_snapshotter(tmp_path, message_ids, threads=None, namespace="host.1", **kwargs):
+    return StateSnapshotter(
+        str(tmp_path / "state.snapshot"), {} if threads is None else threads, message_ids, namespace=namespace, **kwargs
+    )
+
+
+def test_message_ids_beyond_the_count_limit_are_dropped(tmp_path):
+    ids = set()
+    snapshotter = make_snapshotter(tmp_path, ids, max_ids=3)
+    for n in range(5):
+        ids.add(f"wamid.{n}")
+        snapshotter.note_message_id(f"wamid.{n}")
+    snapshotter.snapshot()
+
+    assert ids == {"wamid.2", "wamid.3", "wamid.4"}
+    restored = set()
+    make_snapshotter(tmp_path, restored).load()
+    assert restored == ids
+
+
+def test_expired_message_ids_are_dropped_on_the_next_snapshot(tmp_path, monkeypatch):
+    ids = {"wamid.old"}
+    snapshotter = make_snapshotter(tmp_path, ids, max_id_age=60)
+    now = time.time()
+    monkeypatch.setattr(state_snapshot.time, "time", lambda: now)
+    snapshotter.note_message_id("wamid.old")
+    snapshotter.snapshot()
+    size_before = snapshotter.metrics["last_size_bytes"]
+
+    monkeypatch.setattr(state_snapshot.time, "time", lambda: now + 30)
+    ids.add("wamid.new")
+    snapshotter.note_message_id("wamid.new")
+    snapshotter.snapshot()
+    monkeypatch.setattr(state_snapshot.time, "time", lambda: now + 61)
+    # Nothing new arrived, but the expiry alone rewrites the file
+    assert snapshotter.snapshot()
+
+    assert ids == {"wamid.new"}
+    assert snapshotter.metrics["message_ids"] == 1
+    assert snapshotter.metrics["last_size_bytes"] == size_before
+    restored = set()
+    make_snapshotter(tmp_path, restored, max_id_age=60).load()
+    assert restored == {"wamid.new"}
+
+
+def test_workers_keep_their_own_files_and_restore_merges_them(tmp_path):
+    first_threads = {"923001": [{"role": "user", "content": "old", "timestamp": datetime(2026, 10, 19, 9)}]}
+    second_threads = {
+        "923001": [{"role": "user", "content": "new", "timestamp": datetime(2026, 10, 19, 10)}],
+        "923002": [{"role": "user", "content": "hi", "timestamp": datetime(2026, 10, 19, 10)}],
+    }
+    for namespace, threads, message_id in (("host.1", first_threads, "wamid.1"), ("host.2", second_threads, "wamid.2")):
+        snapshotter = make_snapshotter(tmp_path, {message_id}, threads=threads, namespace=namespace)
+        for wa_id in threads:
+            snapshotter.mark_thread_dirty(wa_id)
+        snapshotter.note_message_id(message_id)
+        snapshotter.snapshot()
+    # Another worker's later snapshot does not erase the first one's state
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["state.host.1.snapshot", "state.host.2.snapshot"]
+
+    threads, ids = {}, set()
+    assert make_snapshotter(tmp_path, ids, threads=threads, namespace="host.3").load()
+    assert ids == {"wamid.1", "wamid.2"}
+    assert threads["923001"][0]["content"] == "new"
+    assert set(threads) == {"923001", "923002"}
+
+
+def test_files_of_long_gone_workers_are_removed_on_load(tmp_path):
+    old = make_snapshotter(tmp_path, {"wamid.1"}, namespace="host.1")
+    old.note_message_id("wamid.1")
+    old.snapshot()
+    stale = time.time() - 120
+    os.utime(old.path, (stale, stale))
+
+    ids = set()
+    assert not make_snapshotter(tmp_path, ids, namespace="host.2", max_id_age=60).load()
+    assert ids == set()
+    assert list(tmp_path.iterdir()) == []
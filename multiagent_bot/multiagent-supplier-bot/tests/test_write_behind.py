@@ -0,0 +1,171 @@
+import fcntl
+
+import requests
+
+from app import function_handler
+from app.utils import write_behind
+from app.utils.single_flight import make_price_key
+from app.utils.write_behind import PriceWriteQueue
+
+URL = "https://script.example/exec"
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.text = "" if status_code == 200 else "boom"
+
+
+def make_queue(tmp_path, monkeypatch, status_code, **kwargs):
+    posted = []
+
+    def post(url, json=None, timeout=None):
+        posted.append(json)
+        return FakeResponse(status_code)
+
+    monkeypatch.setattr(write_behind.requests, "post", post)
+    queue = PriceWriteQueue(str(tmp_path / "writes.journal"), **kwargs)
+    return queue, posted
+
+
+def test_applied_is_reported_only_after_the_write_lands(tmp_path, monkeypatch):
+    written = []
+    queue, posted = make_queue(tmp_path, monkeypatch, 200, on_success=written.append)
+
+    queue.enqueue(URL, "MZ1", {"new_price": 400}, "923001", "update_price", 450, 400)
+    queue.enqueue(URL, "MZ1", {"new_price": 420}, "923001", "update_price", 450, 420)
+    assert written == []
+
+    queue.flush()
+    assert posted == [{"new_price": 420}]
+    assert [(e["product_id"], e["new_price"], e["supplier"]) for e in written] == [("MZ1", 420, "923001")]
+    assert queue.get_metrics()["pending"] == 0
+
+
+def test_final_failure_is_handed_to_on_failure_once(tmp_path, monkeypatch):
+    written, failed = [], []
+    queue, _ = make_queue(
+        tmp_path, monkeypatch, 500, max_attempts=2,
+        on_success=written.append, on_failure=lambda entry, error: failed.append(entry),
+    )
+
+    queue.enqueue(URL, "MZ1", {"new_price": 400}, "923001", "update_price", 450, 400)
+    queue.flush(force=True)
+    assert failed == []
+    queue.flush(force=True)
+
+    assert written == []
+    assert [e["supplier"] for e in failed] == ["923001"]
+    assert queue.get_metrics()["pending"] == 0
+
+
+def test_network_error_counts_as_a_failed_attempt(tmp_path, monkeypatch):
+    failed = []
+    queue = PriceWriteQueue(
+        str(tmp_path / "writes.journal"), max_attempts=1, on_failure=lambda entry, error: failed.append(error)
+    )
+
+    def post(url, json=None, timeout=None):
+        raise requests.ConnectionError("down")
+
+    monkeypatch.setattr(write_behind.requests, "post", post)
+    queue.enqueue(URL, "MZ1", {"new_price": 400})
+    queue.flush()
+    assert failed == ["down"]
+
+
+def test_each_process_keeps_its_own_journal(tmp_path):
+    base = str(tmp_path / "writes.journal")
+    first = PriceWriteQueue(base, namespace="host.1")
+    second = PriceWriteQueue(base, namespace="host.2")
+
+    first.enqueue(URL, "MZ1", {"new_price": 400})
+    second.enqueue(URL, "MZ2", {"new_price": 500})
+
+    assert sorted(p.name for p in tmp_path.glob("writes.*.journal")) == ["writes.host.1.journal", "writes.host.2.journal"]
+    assert [e["product_id"] for e in PriceWriteQueue._read_journal(first.journal_path)] == ["MZ1"]
+
+
+def test_orphaned_journal_is_adopted_once(tmp_path):
+    base = str(tmp_path / "writes.journal")
+    gone = PriceWriteQueue(base, namespace="host.1")
+    gone.enqueue(URL, "MZ1", {"new_price": 400})
+    gone.enqueue(URL, "MZ2", {"new_price": 500})
+
+    survivor = PriceWriteQueue(base, namespace="host.2")
+    survivor.enqueue(URL, "MZ2", {"new_price": 520})
+    assert survivor.replay() == 2
+
+    assert [p.name for p in tmp_path.glob("writes.*.journal")] == ["writes.host.2.journal"]
+    prices = {e["product_id"]: e["payload"]["new_price"] for e in PriceWriteQueue._read_journal(survivor.journal_path)}
+    assert prices == {"MZ1": 400, "MZ2": 520}
+
+    restarted = PriceWriteQueue(base, namespace="host.3")
+    assert restarted.replay() == 0
+    survivor.close()
+
+
+def test_journal_of_a_live_process_is_left_alone(tmp_path):
+    base = str(tmp_path / "writes.journal")
+    live = PriceWriteQueue(base, namespace="host.1")
+    live.enqueue(URL, "MZ1", {"new_price": 400})
+    with open(live.journal_path + ".lock", "a") as lock:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+
+        other = PriceWriteQueue(base, namespace="host.2")
+        assert other.replay() == 0
+
+    assert [e["product_id"] for e in PriceWriteQueue._read_journal(live.journal_path)] == ["MZ1"]
+
+
+def test_revert_clears_weekly_entry_and_cached_result(tmp_path, monkeypatch):
+    monkeypatch.setattr(function_handler, "_PRICE_LOG_FILE", str(tmp_path / "price_log.json"))
+    monkeypatch.setattr(function_handler, "_price_log_loaded", True)
+    monkeypatch.setattr(function_handler, "_price_increase_log", {})
+
+    logged_at = function_handler.log_price_increase("MZ1")
+    key = make_price_key("MZ1", "update_price", 500)
+    function_handler._price_calls.do(key, lambda: "✅ Price will be increased soon.")
+    entry = {"product_id": "MZ1", "operation": "update_price", "new_price": 500, "increase_logged_at": logged_at}
+
+    function_handler.revert_queued_write(entry)
+
+    assert "MZ1" not in function_handler._price_increase_log
+    result, shared = function_handler._price_calls.do(key, lambda: "second call")
+    assert result == "second call" and not shared
+
+
+def test_revert_keeps_a_later_increase(tmp_path, monkeypatch):
+    monkeypatch.setattr(function_handler, "_PRICE_LOG_FILE", str(tmp_path / "price_log.json"))
+    monkeypatch.setattr(function_handler, "_price_log_loaded", True)
+    monkeypatch.setattr(function_handler, "_price_increase_log", {"MZ1": "2026-10-19T10:00:00"})
+
+    function_handler.revert_queued_write({"product_id": "MZ1", "increase_logged_at": "2026-10-18T10:00:00"})
+
+    assert function_handler._price_increase_log == {"MZ1": "2026-10-19T10:00:00"}
+
+
+def test_rejections_are_not_replayed_and_keep_the_cached_success():
+    success_key = make_price_key("MZ7", "update_price", 500)
+    function_handler._price_calls.do(success_key, lambda: "✅ Price will be increased soon.")
+
+    rejected_key = make_price_key("MZ7", "update_price", 900)
+    reject = lambda: "⚠️ Price increase of 80.00% exceeds 10% threshold."
+    function_handler._price_calls.do(rejected_key, reject)
+    result, shared = function_handler._price_calls.do(rejected_key, lambda: "checked again")
+    assert result == "checked again" and not shared
+
+    result, shared = function_handler._price_calls.do(success_key, lambda: "second call")
+    assert result.startswith("✅") and shared
+    function_handler._price_calls.forget_group("MZ7")
+
+
+def test_product_lock_ignores_case_and_whitespace(monkeypatch):
+    held = []
+    original = function_handler._product_locks.hold
+    monkeypatch.setattr(function_handler._product_locks, "hold", lambda key: held.append(key) or original(key))
+    monkeypatch.setattr(function_handler, "_price_log_loaded", True)
+    monkeypatch.setattr(function_handler, "_price_increase_log", {})
+
+    function_handler.revert_queued_write({"product_id": " mz1", "increase_logged_at": "2026-10-19T10:00:00"})
+    assert held == ["MZ1"]